@@ -0,0 +1,321 @@
+import os
+import sys
+import json
+import time
+import ast
+import shutil
+import hashlib
+import argparse
+
+ML_DIR = os.path.dirname(os.path.abspath(__file__))
+ML_MODEL = os.path.join(ML_DIR, "ml_model")
+CACHE_DIR = os.path.join(ML_DIR, ".build_cache")
+MAX_MB = 2048
+INDEX = "index.json"
+MODEL_FILES = ["harmonic_model.pkl", "harmonic_model.forest.npy", "harmonic_model.forest.values.npy",
+               "harmonic_model.forest.json"]
+GENERATOR = os.path.join(ML_DIR, "data_genrator.py")
+TRAINER = os.path.join(ML_MODEL, "train_model.py")
+
+sys.path[:0] = [ML_DIR, ML_MODEL]
+
+# A content-addressed store for the dataset and the trained model. An entry's key is a
+# hash of everything that decides its contents: the generation arguments or the training
+# hyperparameters plus the dataset key, and the source of the code that builds it (which
+# covers the constants set in that code).
+# Entries are built in a scratch directory and renamed into place, so a crash never
+# leaves half an entry, and the least recently used ones are evicted past max_mb.
+
+def source_digest(*paths):
+    """Hash of source files, ignoring line endings."""
+    h = hashlib.sha256()
+    for path in paths:
+        with open(path, "rb") as f:
+            h.update(f.read().replace(b"\r\n", b"\n"))
+    return h.hexdigest()
+
+def source_constants(path, *names):
+    """Values of top-level literal assignments in a source file, read without importing it."""
+    with open(path, "rb") as f:
+        tree = ast.parse(f.read())
+    values = {}
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name) \
+                and node.targets[0].id in names:
+            values[node.targets[0].id] = ast.literal_eval(node.value)
+    missing = [name for name in names if name not in values]
+    if missing:
+        raise ValueError(f"{path} has no literal {', '.join(missing)}")
+    return [values[name] for name in names]
+
+# The scripts' own defaults and file names, read from their source so that parsing the
+# command line and hashing a config import neither (pandas, scikit-learn): a cache hit
+# only reads files
+DATASET_FILE, DATASET_DIR, DATASET_SIZE, SHARD_SIZE, RESOLUTION = source_constants(
+    GENERATOR, "DATASET_FILE", "OUT_DIR", "DATASET_SIZE", "SHARD_SIZE", "RESOLUTION")
+N_TREES, BATCH_SIZE, VAL_FRACTION = source_constants(TRAINER, "N_TREES", "BATCH_SIZE", "VAL_FRACTION")
+
+def config_key(kind, config):
+    blob = json.dumps(config, sort_keys=True).encode()
+    return f"{kind}-{hashlib.sha256(blob).hexdigest()[:16]}"
+
+def dir_bytes(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+class BuildCache:
+    """Directories of build outputs keyed by config_key(), with LRU eviction past max_mb.
+
+    index.json records each entry's size and last use, running hit / miss counts and
+    which entries are published (linked into the script directories); published
+    entries are never evicted, so the links stay valid.
+    """
+
+    def __init__(self, directory=CACHE_DIR, max_mb=MAX_MB):
+        self.directory = directory
+        self.max_bytes = max_mb * 2**20
+        os.makedirs(directory, exist_ok=True)
+        self.index = {"hits": 0, "misses": 0, "entries": {}, "published": {}}
+        path = os.path.join(directory, INDEX)
+        if os.path.exists(path):
+            with open(path) as f:
+                self.index = json.load(f)
+        # Entries removed by hand are forgotten
+        self.index["entries"] = {k: v for k, v in self.index["entries"].items()
+                                 if os.path.isdir(os.path.join(directory, k))}
+        self.session = {"hits": 0, "misses": 0, "evicted": 0}
+
+    def path(self, key):
+        return os.path.join(self.directory, key)
+
+    def lookup(self, key):
+        """Entry directory on a hit (counted and marked as used), else None."""
+        entry = self.index["entries"].get(key)
+        if entry is None:
+            return None
+        entry["last_used"] = time.time()
+        entry["hits"] += 1
+        self._count("hits")
+        return self.path(key)
+
+    def build(self, key, config, build):
+        """Run build(directory) in a scratch directory and store the result as key; returns its path."""
+        scratch = f"{self.path(key)}.{os.getpid()}.tmp"
+        shutil.rmtree(scratch, ignore_errors=True)
+        os.makedirs(scratch)
+        try:
+            build(scratch)
+            with open(os.path.join(scratch, "config.json"), "w") as f:
+                json.dump(config, f, indent=2, sort_keys=True)
+            shutil.rmtree(self.path(key), ignore_errors=True)
+            os.replace(scratch, self.path(key))
+        finally:
+            shutil.rmtree(scratch, ignore_errors=True)
+        now = time.time()
+        self.index["entries"][key] = {"bytes": dir_bytes(self.path(key)), "created": now, "last_used": now,
+                                      "hits": 0}
+        self._count("misses")
+        self.evict(keep=[key])
+        return self.path(key)
+
+    def fetch(self, key, config, build):
+        """(entry directory, hit): the cached entry, or a fresh build of it."""
+        path = self.lookup(key)
+        if path is not None:
+            return path, True
+        return self.build(key, config, build), False
+
+    def evict(self, keep=()):
+        """Drop least recently used entries until the cache fits in max_bytes, except keep and published ones."""
+        entries = self.index["entries"]
+        for key in sorted(entries, key=lambda k: entries[k]["last_used"]):
+            if self.size() <= self.max_bytes:
+                break
+            if key in keep or key in self.index["published"].values():
+                continue
+            shutil.rmtree(self.path(key), ignore_errors=True)
+            del entries[key]
+            self.session["evicted"] += 1
+        self.save()
+
+    def publish(self, key, name, dest):
+        """Link dest to file or directory name of an entry; dest's previous entry becomes evictable."""
+        publish(os.path.join(self.path(key), name), dest)
+        self.index["published"][os.path.abspath(dest)] = key
+        self.save()
+
+    def unpublish(self, dest):
+        """Remove dest if the cache published it, unpinning its entry; returns whether it did."""
+        key = self.index["published"].pop(os.path.abspath(dest), None)
+        if key is None:
+            return False
+        if os.path.islink(dest) or os.path.isfile(dest):
+            os.remove(dest)
+        elif os.path.isdir(dest):
+            shutil.rmtree(dest)
+        self.save()
+        return True
+
+    def size(self):
+        return sum(entry["bytes"] for entry in self.index["entries"].values())
+
+    def _count(self, outcome):
+        self.index[outcome] += 1
+        self.session[outcome] += 1
+        self.save()
+
+    def save(self):
+        path = os.path.join(self.directory, INDEX)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.index, f, indent=2)
+        os.replace(tmp, path)
+
+    def summary(self):
+        total = self.index["hits"] + self.index["misses"]
+        return (f"Build cache {self.directory}: {len(self.index['entries'])} entries, "
+                f"{self.size() / 2**20:.1f}/{self.max_bytes / 2**20:.0f} MB | this run {self.session['hits']} hits, "
+                f"{self.session['misses']} misses, {self.session['evicted']} evicted | "
+                f"all time {self.index['hits']}/{total} hits")
+
+def publish(source, dest):
+    """Point dest at a cached file or directory: a symlink, or a copy where links are not allowed."""
+    if os.path.islink(dest) or os.path.isfile(dest):
+        os.remove(dest)
+    elif os.path.isdir(dest):
+        shutil.rmtree(dest)
+    try:
+        # Relative, so the links survive moving the checkout
+        os.symlink(os.path.relpath(source, os.path.dirname(os.path.abspath(dest))), dest,
+                   target_is_directory=os.path.isdir(source))
+    except OSError:
+        if os.path.isdir(source):
+            shutil.copytree(source, dest)
+        else:
+            shutil.copy2(source, dest)
+
+def dataset_config(args):
+    config = {
+        "format": args.format,
+        "size": args.size,
+        "seed": args.seed,
+        "code": source_digest(GENERATOR),
+    }
+    if args.format != "csv":
+        config["shard_size"] = args.shard_size
+    if args.format == "wvc":
+        config["resolution"] = args.resolution
+        config["code"] = source_digest(GENERATOR, os.path.join(ML_DIR, "..", "mark_2", "wavecodec.py"))
+    return config
+
+def model_config(args, dataset_key):
+    hyperparameters = {"n_trees": args.trees}
+    if args.format != "csv":
+        hyperparameters.update(batch_size=args.batch_size, val_fraction=args.val_fraction)
+    return {
+        "dataset": dataset_key,
+        "hyperparameters": hyperparameters,
+        "code": source_digest(*(os.path.join(ML_MODEL, name)
+                                for name in ("train_model.py", "features.py", "compact_forest.py"))),
+    }
+
+def build_dataset(args):
+    def build(directory):
+        import data_genrator as gen
+        if args.format == "csv":
+            gen.generate_dataset(args.size, args.seed, os.path.join(directory, DATASET_FILE))
+        else:
+            gen.generate_shards(args.size, os.path.join(directory, DATASET_DIR), args.shard_size, args.seed,
+                                args.workers, args.format, args.resolution)
+    return build
+
+def build_model(args, dataset_dir):
+    def build(directory):
+        import pickle
+        import train_model
+        if args.format == "csv":
+            X, y = train_model.load_dataset(os.path.join(dataset_dir, DATASET_FILE))
+            model, label_encoder, acc = train_model.train(X, y, args.trees)
+        else:
+            model, label_encoder, acc, _ = train_model.train_sharded(os.path.join(dataset_dir, DATASET_DIR),
+                                                                     args.batch_size, args.trees,
+                                                                     args.val_fraction)
+        print(f"Validation Accuracy: {acc * 100:.2f}%", flush=True)
+        with open(os.path.join(directory, MODEL_FILES[0]), "wb") as f:
+            pickle.dump((model, label_encoder, train_model.feature_spec()), f)
+        train_model.export_forest(model, label_encoder, os.path.join(directory, MODEL_FILES[1]))
+        with open(os.path.join(directory, "metrics.json"), "w") as f:
+            json.dump({"accuracy": acc}, f)
+    return build
+
+def build_all(args):
+    """Dataset and model through the cache, then published where the scripts read them."""
+    cache = BuildCache(args.cache_dir, args.max_mb)
+    start = time.time()
+    data_cfg = dataset_config(args)
+    data_key = config_key("dataset", data_cfg)
+    model_cfg = model_config(args, data_key)
+    model_key = config_key("model", model_cfg)
+
+    # A cached model needs neither its dataset nor a training run
+    model_dir = cache.lookup(model_key)
+    data_dir = cache.lookup(data_key) if model_dir else None
+    if model_dir is None:
+        t = time.time()
+        data_dir, hit = cache.fetch(data_key, data_cfg, build_dataset(args))
+        print(f"dataset {data_key}: {'hit' if hit else 'miss, built'} in {time.time() - t:.2f}s", flush=True)
+        t = time.time()
+        model_dir = cache.build(model_key, model_cfg, build_model(args, data_dir))
+        print(f"model {model_key}: miss, trained in {time.time() - t:.2f}s", flush=True)
+        if not os.path.isdir(data_dir):
+            print(f"dataset {data_key}: evicted to stay within {args.max_mb:g} MB, not published", flush=True)
+            data_dir = None
+    else:
+        print(f"model {model_key}: hit (dataset {data_key} {'cached' if data_dir else 'not needed'})", flush=True)
+
+    if not args.no_publish:
+        name = DATASET_FILE if args.format == "csv" else DATASET_DIR
+        if data_dir:
+            cache.publish(data_key, name, os.path.join(ML_DIR, name))
+        elif cache.unpublish(os.path.join(ML_DIR, name)):
+            # Whatever was linked there belongs to another configuration
+            print(f"Removed {os.path.join(ML_DIR, name)}: this model's dataset is not cached "
+                  f"(run with a larger --max-mb to keep it)", flush=True)
+        for name in MODEL_FILES:
+            cache.publish(model_key, name, os.path.join(ML_MODEL, name))
+        cache.evict()
+        print(f"Published to {ML_DIR} and {ML_MODEL}", flush=True)
+    print(cache.summary(), flush=True)
+    print(f"Done in {time.time() - start:.2f}s", flush=True)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generate the dataset and train the model through the build cache")
+    parser.add_argument("command", nargs="?", choices=["build", "stats", "clear"], default="build")
+    parser.add_argument("--size", type=int, default=DATASET_SIZE, help="number of waveforms")
+    parser.add_argument("--seed", type=int, default=0, help="dataset seed (part of the cache key)")
+    parser.add_argument("--format", choices=["csv", "npy", "npz", "wvc"], default="csv",
+                        help="the labeled CSV and train(), or shards and train_sharded()")
+    parser.add_argument("--shard-size", type=int, default=SHARD_SIZE)
+    parser.add_argument("--resolution", type=float, default=RESOLUTION, help="volts per step in .wvc shards")
+    parser.add_argument("--workers", type=int, default=None, help="shard generation processes")
+    parser.add_argument("--trees", type=int, default=N_TREES)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="windows per batch for shards")
+    parser.add_argument("--val-fraction", type=float, default=VAL_FRACTION, help="held-out share of rows for shards")
+    parser.add_argument("--cache-dir", default=CACHE_DIR)
+    parser.add_argument("--max-mb", type=float, default=MAX_MB, help="evict least recently used entries past this")
+    parser.add_argument("--no-publish", action="store_true",
+                        help="only fill the cache; do not link the artifacts into the script directories")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.command == "build":
+        build_all(args)
+    elif args.command == "stats":
+        cache = BuildCache(args.cache_dir, args.max_mb)
+        for key, entry in sorted(cache.index["entries"].items(), key=lambda item: -item[1]["last_used"]):
+            print(f"{key}  {entry['bytes'] / 2**20:8.1f} MB  {entry['hits']:4d} hits  last used "
+                  f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(entry['last_used']))}")
+        print(cache.summary())
+    else:
+        shutil.rmtree(args.cache_dir, ignore_errors=True)
+        print(f"Removed {args.cache_dir}")
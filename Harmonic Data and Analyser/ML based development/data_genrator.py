@@ -1,6 +1,11 @@
 import numpy as np
 import pandas as pd
 import os
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
 
 # Constants
 SAMPLE_RATE = 1000
@@ -17,63 +22,215 @@ THD_THRESHOLDS = {
     "Medium": 10, # 5% ≤ THD < 10%
     "High": 20    # 10% ≤ THD < 20%
 }
-
-# Output file
-OUT_FILE = "harmonic_labeled_dataset.csv"
-
-
-def generate_waveform_and_labels():
-    t = np.arange(SAMPLES) / SAMPLE_RATE
-
-    # Base signal
-    signal = V_PEAK * np.sin(2 * np.pi * FUNDAMENTAL_FREQ * t)
-
-    # Choose random harmonics (1–6 harmonics from 3rd to 49th odd)
-    available_harmonics = list(range(3, 50, 2))
-    num_harmonics = np.random.randint(1, 7)
-    chosen_harmonics = sorted(np.random.choice(available_harmonics, size=num_harmonics, replace=False))
-
-    harmonic_magnitudes = []
-
-    for h in chosen_harmonics:
-        mag = V_PEAK * np.random.uniform(0.01, 0.1)
-        harmonic_magnitudes.append(mag)
-        signal += mag * np.sin(2 * np.pi * FUNDAMENTAL_FREQ * h * t + np.random.uniform(0, 2*np.pi))
-
-    # THD Calculation
-    V1 = V_PEAK
-    thd = np.sqrt(np.sum(np.square(harmonic_magnitudes))) / V1
-    thd_percent = round(thd * 100, 2)
-
-    # Classify THD level
-    if thd_percent < THD_THRESHOLDS["Low"]:
-        thd_class = "Low"
-    elif thd_percent < THD_THRESHOLDS["Medium"]:
-        thd_class = "Medium"
+CLASS_NAMES = ["Low", "Medium", "High"]  # thd_class codes 0, 1, 2 in binary shards
+
+# Output file, shared with ml_model/train_model.py
+ML_DIR = os.path.dirname(os.path.abspath(__file__))
+DATASET_FILE = "harmonic_labeled_dataset.csv"
+OUT_FILE = os.path.join(ML_DIR, DATASET_FILE)
+OUT_DIR = "harmonic_dataset"
+MARK_2 = os.path.join(ML_DIR, "..", "mark_2")
+RESOLUTION = 0.01  # V per step in .wvc shards
+
+# Candidate harmonics (3rd to 49th odd) and 1 to 6 of them per waveform
+HARMONIC_ORDERS = np.arange(3, 50, 2)
+MAX_HARMONICS = 6
+HARMONIC_MAG_RANGE = (0.01, 0.1)  # fraction of V_PEAK
+SHARD_SIZE = 50_000  # waveforms per shard file
+BATCH_SIZE = 4096    # waveforms synthesized at once inside a shard
+
+_t = np.arange(SAMPLES) / SAMPLE_RATE
+_FUNDAMENTAL = V_PEAK * np.sin(2 * np.pi * FUNDAMENTAL_FREQ * _t)
+_SIN = np.sin(2 * np.pi * FUNDAMENTAL_FREQ * np.outer(HARMONIC_ORDERS, _t))
+_COS = np.cos(2 * np.pi * FUNDAMENTAL_FREQ * np.outer(HARMONIC_ORDERS, _t))
+
+
+def generate_batch(rng, n):
+    """n waveforms at once: (signals (n x SAMPLES), thd %, thd_class codes, harmonic mask).
+
+    Same distribution as the original per-row generator. m * sin(wt + p) is written as
+    m*cos(p) * sin(wt) + m*sin(p) * cos(wt), so the whole batch is two matrix products
+    with precomputed tables.
+    """
+    # Pick 1-6 distinct harmonics per row: the k smallest of a row of random keys
+    counts = rng.integers(1, MAX_HARMONICS + 1, size=n)
+    ranks = np.argsort(np.argsort(rng.random((n, len(HARMONIC_ORDERS))), axis=1), axis=1)
+    present = ranks < counts[:, None]
+
+    mags = np.where(present, V_PEAK * rng.uniform(*HARMONIC_MAG_RANGE, size=present.shape), 0)
+    phases = rng.uniform(0, 2 * np.pi, size=present.shape)
+    signals = (mags * np.cos(phases)) @ _SIN + (mags * np.sin(phases)) @ _COS
+    signals += _FUNDAMENTAL
+
+    thd = np.round(np.sqrt(np.sum(np.square(mags), axis=1)) / V_PEAK * 100, 2)
+    thd_class = np.digitize(thd, [THD_THRESHOLDS["Low"], THD_THRESHOLDS["Medium"]])
+    return signals, thd, thd_class, present
+
+
+def generate_waveform_and_labels(rng=None):
+    signals, thd, thd_class, present = generate_batch(rng or np.random.default_rng(), 1)
+    return (signals[0], float(thd[0]), CLASS_NAMES[thd_class[0]],
+            ",".join(map(str, HARMONIC_ORDERS[present[0]])))
+
+
+def wavecodec():
+    # The codec lives with the datalog in mark_2
+    sys.path.insert(0, os.path.abspath(MARK_2))
+    import wavecodec
+    return wavecodec
+
+
+def generate_shard(index, seed, n, out_dir, fmt, resolution=RESOLUTION):
+    """Write one shard from its own SeedSequence; returns its manifest entry."""
+    rng = np.random.default_rng(seed)
+    name = f"shard_{index:05d}"
+    if fmt == "npy":
+        # Written batch by batch through a memmap, so memory stays flat whatever the shard size
+        signals = np.lib.format.open_memmap(os.path.join(out_dir, name + ".npy"), mode="w+",
+                                            dtype=np.float32, shape=(n, SAMPLES))
     else:
-        thd_class = "High"
-
-    return signal, thd_percent, thd_class, ",".join(map(str, chosen_harmonics))
-
-
-def generate_dataset():
-    data_rows = []
-
-    for i in range(DATASET_SIZE):
-        signal, thd, thd_class, harmonics = generate_waveform_and_labels()
-        row = list(np.round(signal, 3)) + [thd, thd_class, harmonics]
-        data_rows.append(row)
-
-        if i % 50 == 0:
-            print(f"Generated {i}/{DATASET_SIZE} samples")
+        signals = np.empty((n, SAMPLES), dtype=np.float32)
+    thd = np.empty(n, dtype=np.float32)
+    thd_class = np.empty(n, dtype=np.uint8)
+    present = np.empty((n, len(HARMONIC_ORDERS)), dtype=bool)
+
+    for start in range(0, n, BATCH_SIZE):
+        stop = min(start + BATCH_SIZE, n)
+        signals[start:stop], thd[start:stop], thd_class[start:stop], present[start:stop] = \
+            generate_batch(rng, stop - start)
+
+    entry = {"rows": n, "labels": name + ".labels.npz"}
+    if fmt == "wvc":
+        # One chunk per batch; each waveform is a channel, delta-coded along its samples
+        entry["signals"] = name + ".wvc"
+        with wavecodec().WaveWriter(os.path.join(out_dir, entry["signals"]), resolution) as writer:
+            for start in range(0, n, BATCH_SIZE):
+                writer.write(signals[start:start + BATCH_SIZE])
+        np.savez(os.path.join(out_dir, entry["labels"]), thd=thd, thd_class=thd_class, harmonics=present)
+    elif fmt == "npy":
+        signals.flush()
+        del signals
+        entry["signals"] = name + ".npy"
+        np.savez(os.path.join(out_dir, entry["labels"]), thd=thd, thd_class=thd_class, harmonics=present)
+    else:
+        entry["signals"] = entry["labels"] = name + ".npz"
+        np.savez(os.path.join(out_dir, entry["signals"]), signals=signals, thd=thd,
+                 thd_class=thd_class, harmonics=present)
+    return entry
+
+
+def generate_shards(size, out_dir, shard_size=SHARD_SIZE, seed=None, workers=None, fmt="npy",
+                    resolution=RESOLUTION):
+    """Generate size waveforms as shards in a process pool and write manifest.json.
+
+    Shard i always draws from SeedSequence(seed).spawn(...)[i], so the output only
+    depends on the seed and shard size, not on the number of workers.
+    """
+    if os.path.islink(out_dir):
+        # A dataset published from the build cache; never write into the cached copy
+        os.remove(out_dir)
+    os.makedirs(out_dir, exist_ok=True)
+    root = np.random.SeedSequence(seed)
+    n_shards = -(-size // shard_size)
+    sizes = [min(shard_size, size - i * shard_size) for i in range(n_shards)]
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(generate_shard, i, child, n, out_dir, fmt, resolution)
+                   for i, (child, n) in enumerate(zip(root.spawn(n_shards), sizes))]
+        shards = []
+        for i, future in enumerate(futures):
+            shards.append(future.result())
+            print(f"Generated shard {i + 1}/{n_shards}", flush=True)
+
+    extra = {"resolution": resolution} if fmt == "wvc" else {}
+    return write_manifest(out_dir, size, shards, shard_size, seed=root.entropy, **extra)
+
+
+def write_manifest(out_dir, size, shards, shard_size, **extra):
+    manifest = {
+        "size": size,
+        "shard_size": shard_size,
+        "sample_rate": SAMPLE_RATE,
+        "samples": SAMPLES,
+        "dtype": "float32",
+        "class_names": CLASS_NAMES,
+        "thd_thresholds": THD_THRESHOLDS,
+        "harmonic_orders": HARMONIC_ORDERS.tolist(),
+        "shards": shards,
+    }
+    manifest.update(extra)
+    with open(os.path.join(out_dir, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def convert_csv(csv_path, out_dir, resolution=0.001, rows_per_read=BATCH_SIZE):
+    """Turn a labeled CSV from generate_dataset() into a one-shard .wvc dataset.
+
+    The CSV rounds to three decimals, so the default 1 mV resolution is lossless; every
+    chunk is decoded again and checked against the resolution before it is written.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    entry = {"rows": 0, "signals": "shard_00000.wvc", "labels": "shard_00000.labels.npz"}
+    thd, thd_class, present = [], [], []
+    with wavecodec().WaveWriter(os.path.join(out_dir, entry["signals"]), resolution, verify=True) as writer:
+        for df in pd.read_csv(csv_path, chunksize=rows_per_read):
+            writer.write(df.iloc[:, :SAMPLES].to_numpy(dtype=np.float64))
+            thd.append(df["THD"].to_numpy(dtype=np.float32))
+            thd_class.append(df["THD_class"].map(CLASS_NAMES.index).to_numpy(dtype=np.uint8))
+            for orders in df["harmonics_present"].astype(str):
+                present.append(np.isin(HARMONIC_ORDERS, [int(h) for h in orders.split(",")]))
+            entry["rows"] += len(df)
+    np.savez(os.path.join(out_dir, entry["labels"]), thd=np.concatenate(thd),
+             thd_class=np.concatenate(thd_class), harmonics=np.array(present))
+    return write_manifest(out_dir, entry["rows"], [entry], entry["rows"], resolution=resolution,
+                          source=os.path.basename(csv_path))
+
+
+def generate_dataset(size=DATASET_SIZE, seed=None, path=OUT_FILE):
+    """Original CSV output, kept for the existing training script."""
+    rng = np.random.default_rng(seed)
+    signals, thd, thd_class, present = generate_batch(rng, size)
 
     columns = [f"Va_{i}" for i in range(SAMPLES)] + ["THD", "THD_class", "harmonics_present"]
-    df = pd.DataFrame(data_rows, columns=columns)
-    df.to_csv(OUT_FILE, index=False)
-    print(f"\nDataset saved to: {OUT_FILE}")
+    df = pd.DataFrame(np.round(signals, 3), columns=columns[:SAMPLES])
+    df["THD"] = thd
+    df["THD_class"] = np.array(CLASS_NAMES)[thd_class]
+    df["harmonics_present"] = [",".join(map(str, HARMONIC_ORDERS[row])) for row in present]
+    df.to_csv(path, index=False)
+    print(f"\nDataset saved to: {path}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generate labeled harmonic waveforms")
+    parser.add_argument("--size", type=int, default=DATASET_SIZE, help="number of waveforms")
+    parser.add_argument("--format", choices=["npy", "npz", "wvc", "csv"], default="npy",
+                        help="float32 .npy shards + label sidecars, self-contained .npz shards, "
+                             "quantized .wvc shards + label sidecars, or the old CSV")
+    parser.add_argument("--resolution", type=float, default=RESOLUTION, help="volts per step in .wvc shards")
+    parser.add_argument("--from-csv", metavar="CSV",
+                        help="convert an existing labeled CSV into a .wvc dataset in --out instead of generating")
+    parser.add_argument("--out", default=OUT_DIR, help="output directory for shards")
+    parser.add_argument("--shard-size", type=int, default=SHARD_SIZE)
+    parser.add_argument("--workers", type=int, default=None, help="processes (default: CPU count)")
+    parser.add_argument("--seed", type=int, default=None, help="seed for reproducible output")
+    return parser.parse_args()
 
 
 if __name__ == "__main__":
-    if os.path.exists(OUT_FILE):
-        os.remove(OUT_FILE)
-    generate_dataset()
+    args = parse_args()
+    start = time.time()
+    if args.from_csv:
+        manifest = convert_csv(args.from_csv, args.out)
+        print(f"Converted {manifest['size']} waveforms to {args.out} in {time.time() - start:.2f}s")
+        raise SystemExit
+    if args.format == "csv":
+        # Also drops a link into the build cache (build_cache.py) instead of writing through it
+        if os.path.lexists(OUT_FILE):
+            os.remove(OUT_FILE)
+        generate_dataset(args.size, args.seed)
+    else:
+        manifest = generate_shards(args.size, args.out, args.shard_size, args.seed, args.workers, args.format,
+                                   args.resolution)
+        print(f"\nDataset saved to: {args.out} ({len(manifest['shards'])} shards, seed {manifest['seed']})")
+    print(f"{args.size} waveforms in {time.time() - start:.2f}s")
@@ -0,0 +1,93 @@
+import os
+import json
+import numpy as np
+
+COMPACT_FILE = "harmonic_model.forest.npy"
+CHUNK = 256  # windows walked together; keeps the (windows x trees) state in cache
+
+# One record per node of every tree. Leaves point back at themselves with an infinite
+# threshold, so a fixed number of steps walks every tree to its leaf without branching.
+NODE_DTYPE = np.dtype([
+    ("feature", "<i4"),
+    ("threshold", "<f8"),
+    ("left", "<i4"),
+    ("right", "<i4"),
+])
+
+def sidecar_path(path):
+    return path[:-len(".npy")] + ".json" if path.endswith(".npy") else path + ".json"
+
+def save_forest(path, feature, threshold, left, right, values, roots, max_depth, classes, spec):
+    """Write the flattened forest: path (.npy nodes), .values.npy (class probabilities) and a .json sidecar."""
+    for name in (path, path[:-len(".npy")] + ".values.npy", sidecar_path(path)):
+        if os.path.islink(name):
+            # Published from the build cache; replace the link, keep the cached copy
+            os.remove(name)
+    nodes = np.empty(len(feature), dtype=NODE_DTYPE)
+    nodes["feature"] = feature
+    nodes["threshold"] = threshold
+    nodes["left"] = left
+    nodes["right"] = right
+    np.save(path, nodes)
+    np.save(path[:-len(".npy")] + ".values.npy", np.asarray(values, dtype="<f4"))
+    meta = {
+        "roots": [int(r) for r in roots],
+        "max_depth": int(max_depth),
+        "classes": [str(c) for c in classes],
+        "feature_spec": spec,
+    }
+    with open(sidecar_path(path), "w") as f:
+        json.dump(meta, f, indent=2)
+
+class LabelDecoder:
+    """The one LabelEncoder method prediction needs, without scikit-learn."""
+
+    def __init__(self, classes):
+        self.classes_ = np.asarray(classes)
+
+    def inverse_transform(self, codes):
+        return self.classes_[np.asarray(codes)]
+
+class CompactForest:
+    """Random forest evaluated from flat NumPy arrays.
+
+    predict_proba() starts every (window, tree) pair at its tree's root and takes
+    max_depth vectorized steps; each step gathers the split feature, threshold and
+    child for all pairs at once. Inputs are compared as float32, like scikit-learn.
+    """
+
+    def __init__(self, path=COMPACT_FILE, mmap=True):
+        nodes = np.load(path, mmap_mode="r" if mmap else None)
+        # Separate contiguous columns gather faster than fields of the record array
+        self.feature = np.ascontiguousarray(nodes["feature"])
+        self.threshold = np.ascontiguousarray(nodes["threshold"])
+        # children[2 * node + went_left] picks the next node with a single gather
+        self.children = np.column_stack((nodes["right"], nodes["left"])).ravel()
+        self.values = np.load(path[:-len(".npy")] + ".values.npy", mmap_mode="r" if mmap else None)
+        with open(sidecar_path(path)) as f:
+            meta = json.load(f)
+        self.roots = np.asarray(meta["roots"], dtype=np.int64)
+        self.max_depth = meta["max_depth"]
+        self.classes = meta["classes"]
+        self.spec = meta["feature_spec"]
+
+    def leaves(self, X):
+        """(windows x trees) leaf node index of every tree for every row of X."""
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        out = np.empty((len(X), len(self.roots)), dtype=np.int64)
+        for a in range(0, len(X), CHUNK):
+            chunk = X[a:a + CHUNK]
+            flat = chunk.ravel()
+            row_start = (np.arange(len(chunk)) * X.shape[1])[:, None]
+            node = np.broadcast_to(self.roots, (len(chunk), len(self.roots))).copy()
+            for _ in range(self.max_depth):
+                went_left = flat[row_start + self.feature[node]] <= self.threshold[node]
+                node = self.children[2 * node + went_left]
+            out[a:a + len(chunk)] = node
+        return out
+
+    def predict_proba(self, X):
+        return self.values[self.leaves(X)].mean(axis=1)
+
+    def predict(self, X):
+        return np.argmax(self.predict_proba(X), axis=1)
@@ -0,0 +1,50 @@
+import numpy as np
+from functools import lru_cache
+
+# Constants
+SAMPLE_RATE = 1000
+FUNDAMENTAL_FREQ = 50
+ORDERS = np.arange(2, 50)  # harmonic orders 2-49
+
+FEATURE_NAMES = (["fundamental", "rms", "crest_factor", "thd_pct"] +
+                 [f"h{h}_pct" for h in ORDERS])
+
+@lru_cache(maxsize=8)
+def harmonic_bins(n, sample_rate=SAMPLE_RATE, fundamental=FUNDAMENTAL_FREQ):
+    """FFT bin of the fundamental and of every order in ORDERS for an n-sample window.
+
+    Orders above Nyquist are read at the bin they alias to (at 1 kHz the 11th shows
+    up at 450 Hz, the 20th at DC), which is where their energy actually lands.
+    """
+    resolution = sample_rate / n
+    freqs = np.concatenate(([fundamental], ORDERS * fundamental)) % sample_rate
+    freqs = np.where(freqs > sample_rate / 2, sample_rate - freqs, freqs)
+    return np.rint(freqs / resolution).astype(int)
+
+def extract_features(windows, sample_rate=SAMPLE_RATE, fundamental=FUNDAMENTAL_FREQ):
+    """Feature matrix (windows x len(FEATURE_NAMES)) for a (windows x samples) array.
+
+    Columns are the fundamental peak magnitude (V), RMS (V), crest factor, THD (%)
+    from the power left after removing the fundamental, then each harmonic as a
+    percentage of the fundamental. One batched rfft covers all windows.
+    """
+    windows = np.atleast_2d(np.asarray(windows, dtype=np.float64))
+    n = windows.shape[-1]
+    bins = harmonic_bins(n, sample_rate, fundamental)
+    magnitude = np.abs(np.fft.rfft(windows, axis=-1)[:, bins]) * (2 / n)
+    fundamental_mag = magnitude[:, 0]
+
+    rms = np.sqrt(np.mean(np.square(windows), axis=-1))
+    peak = np.max(np.abs(windows), axis=-1)
+
+    features = np.empty((len(windows), len(FEATURE_NAMES)))
+    features[:, 0] = fundamental_mag
+    features[:, 1] = rms
+    with np.errstate(divide='ignore', invalid='ignore'):
+        features[:, 2] = np.where(rms > 0, peak / rms, 0)
+        fundamental_rms = fundamental_mag / np.sqrt(2)
+        distortion = np.sqrt(np.maximum(rms**2 - fundamental_rms**2, 0))
+        features[:, 3] = np.where(fundamental_rms > 0, 100 * distortion / fundamental_rms, 0)
+        features[:, 4:] = np.where(fundamental_mag[:, None] > 0,
+                                   100 * magnitude[:, 1:] / fundamental_mag[:, None], 0)
+    return features
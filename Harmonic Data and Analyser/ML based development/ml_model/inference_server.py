@@ -0,0 +1,297 @@
+import os
+import sys
+import json
+import time
+import base64
+import asyncio
+import signal
+import argparse
+import numpy as np
+from predict_model import load_model, model_inputs, N_SAMPLES
+
+# The analyzer's shared-memory ring lives in mark_2
+MARK_2 = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "mark_2")
+
+DEFAULT_SOCKET = "/tmp/harmonic_inference.sock"
+MAX_BATCH = 64        # windows per model.predict call
+BUDGET_MS = 5.0       # longest a request waits for others to join its batch
+LATENCY_WINDOW = 10_000  # most recent latencies kept for the percentile report
+
+class LatencyStats:
+    """Fixed-size ring of recent request latencies (ms)."""
+
+    def __init__(self, size=LATENCY_WINDOW):
+        self.values = np.zeros(size)
+        self.count = 0
+        self.batches = 0
+        self.batched = 0
+
+    def add(self, latencies):
+        for value in latencies:
+            self.values[self.count % len(self.values)] = value
+            self.count += 1
+
+    def report(self):
+        recent = self.values[:min(self.count, len(self.values))]
+        if len(recent) == 0:
+            return "no requests yet"
+        p50, p99 = np.percentile(recent, [50, 99])
+        mean_batch = self.batched / max(self.batches, 1)
+        return (f"{self.count} requests | p50 {p50:.2f} ms | p99 {p99:.2f} ms | "
+                f"mean batch {mean_batch:.1f}")
+
+class MicroBatcher:
+    """Gather concurrent requests into one vectorized model.predict call.
+
+    A batch closes when it holds max_batch windows or when its oldest request has
+    waited budget_ms, whichever comes first. Prediction runs in a worker thread, so
+    the next batch keeps filling while the current one is classified.
+    """
+
+    def __init__(self, model_path=None, max_batch=MAX_BATCH, budget_ms=BUDGET_MS):
+        self.model, self.label_encoder, self.spec = load_model(model_path)
+        self.max_batch = max_batch
+        self.budget = budget_ms / 1000
+        self.queue = asyncio.Queue()
+        self.stats = LatencyStats()
+
+    async def classify(self, window):
+        """THD class label for one (1000,) window."""
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((window, time.perf_counter(), future))
+        return await future
+
+    def _predict(self, windows):
+        pred = self.model.predict(model_inputs(windows, self.spec))
+        return self.label_encoder.inverse_transform(pred)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        windows = np.empty((self.max_batch, N_SAMPLES))
+        while True:
+            batch = [await self.queue.get()]
+            deadline = batch[0][1] + self.budget
+            while len(batch) < self.max_batch:
+                # Requests that queued up during the previous predict join at once
+                if not self.queue.empty():
+                    batch.append(self.queue.get_nowait())
+                    continue
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            n = len(batch)
+            for i, (window, _, _) in enumerate(batch):
+                windows[i] = window
+            try:
+                labels = await loop.run_in_executor(None, self._predict, windows[:n].copy())
+            except Exception as e:
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            done = time.perf_counter()
+            for (_, start, future), label in zip(batch, labels):
+                if not future.done():
+                    future.set_result(str(label))
+            self.stats.add([(done - start) * 1000 for _, start, _ in batch])
+            self.stats.batches += 1
+            self.stats.batched += n
+
+def decode_window(request):
+    """(1000,) float64 window from a request's base64 float32 payload or plain list."""
+    if "samples_b64" in request:
+        window = np.frombuffer(base64.b64decode(request["samples_b64"]), dtype="<f4")
+    else:
+        window = np.asarray(request["samples"], dtype=np.float64)
+    if window.shape != (N_SAMPLES,):
+        raise ValueError(f"window must have exactly {N_SAMPLES} samples, got {window.size}")
+    return window
+
+def encode_window(window):
+    return base64.b64encode(np.asarray(window, dtype="<f4").tobytes()).decode("ascii")
+
+async def handle_line(batcher, line):
+    """One NDJSON request line -> one NDJSON response line."""
+    request_id = None
+    try:
+        request = json.loads(line)
+        request_id = request.get("id")
+        label = await batcher.classify(decode_window(request))
+        response = {"id": request_id, "class": label}
+    except Exception as e:
+        response = {"id": request_id, "error": str(e)}
+    return (json.dumps(response) + "\n").encode()
+
+async def serve_stream(batcher, readline, write):
+    """Answer every request line from readline(); responses may come back out of order, matched by id."""
+    pending = set()
+    while True:
+        line = await readline()
+        if not line:
+            break
+        if not line.strip():
+            continue
+
+        async def answer(line=line):
+            write(await handle_line(batcher, line))
+
+        task = asyncio.create_task(answer())
+        pending.add(task)
+        task.add_done_callback(pending.discard)
+    if pending:
+        await asyncio.gather(*pending)
+
+async def serve_stdio(batcher):
+    loop = asyncio.get_running_loop()
+
+    # A blocking read in a thread works for pipes, files and terminals alike
+    def readline():
+        return loop.run_in_executor(None, sys.stdin.buffer.readline)
+
+    def write(data):
+        sys.stdout.buffer.write(data)
+        sys.stdout.buffer.flush()
+
+    await serve_stream(batcher, readline, write)
+
+async def serve_socket(batcher, path):
+    async def client(reader, writer):
+        try:
+            await serve_stream(batcher, reader.readline, writer.write)
+            await writer.drain()
+        finally:
+            writer.close()
+
+    if os.path.exists(path):
+        os.remove(path)
+    server = await asyncio.start_unix_server(client, path)
+    print(f"Listening on {path}", file=sys.stderr, flush=True)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+
+async def attach_ring(batcher, name, period):
+    """Classify the latest one-second window of every phase in the analyzer's ring."""
+    sys.path.insert(0, os.path.abspath(MARK_2))
+    from shm_ring import ShmRing
+    from data_generator import channel_names
+
+    ring = None
+    while ring is None:
+        try:
+            ring = ShmRing.attach(name)
+        except (FileNotFoundError, ValueError):
+            print("Waiting for data generator...", file=sys.stderr, flush=True)
+            await asyncio.sleep(1.0)
+    expected = batcher.spec["sample_rate"] if batcher.spec else 1000
+    if ring.sample_rate != expected:
+        ring.close()
+        raise ValueError(f"ring runs at {ring.sample_rate} Hz, the model expects {expected} Hz")
+
+    labels = channel_names(ring.n_rows - 1)
+    n_frames = -(-N_SAMPLES // ring.frame_len)
+    try:
+        while True:
+            view, first = ring.window(n_frames)
+            if view is not None:
+                # Copy out before classifying; the generator keeps overwriting the ring
+                window = np.array(view[:, -N_SAMPLES:])
+                if ring.is_intact(first):
+                    classes = await asyncio.gather(*(batcher.classify(row) for row in window[1:]))
+                    print(json.dumps({"time_ms": float(window[0, -1]), "classes": dict(zip(labels, classes))}),
+                          flush=True)
+            await asyncio.sleep(period)
+    finally:
+        ring.close()
+
+async def report_loop(batcher, interval):
+    while True:
+        await asyncio.sleep(interval)
+        print(batcher.stats.report(), file=sys.stderr, flush=True)
+
+async def serve(args):
+    batcher = MicroBatcher(args.model, args.max_batch, args.budget_ms)
+    tasks = [asyncio.create_task(batcher.run())]
+    if args.report_s > 0:
+        tasks.append(asyncio.create_task(report_loop(batcher, args.report_s)))
+    try:
+        if args.attach_ring:
+            await attach_ring(batcher, args.attach_ring, args.ring_period)
+        elif args.socket:
+            await serve_socket(batcher, args.socket)
+        else:
+            await serve_stdio(batcher)
+    finally:
+        for task in tasks:
+            task.cancel()
+        print(batcher.stats.report(), file=sys.stderr, flush=True)
+
+async def load_test(args):
+    """Send args.requests windows over args.concurrency connections and report latency."""
+    rng = np.random.default_rng(0)
+    t = np.arange(N_SAMPLES) / 1000
+    payloads = [encode_window(340 * np.sin(2 * np.pi * 50 * t) + rng.normal(0, 5, N_SAMPLES))
+                for _ in range(32)]
+    latencies = []
+    per_client = -(-args.requests // args.concurrency)
+
+    async def client(k):
+        reader, writer = await asyncio.open_unix_connection(args.socket)
+        for i in range(per_client):
+            request = json.dumps({"id": f"{k}-{i}", "samples_b64": payloads[i % len(payloads)]}) + "\n"
+            start = time.perf_counter()
+            writer.write(request.encode())
+            await writer.drain()
+            response = json.loads(await reader.readline())
+            latencies.append((time.perf_counter() - start) * 1000)
+            if "error" in response:
+                raise RuntimeError(response["error"])
+        writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(k) for k in range(args.concurrency)))
+    elapsed = time.perf_counter() - start
+    p50, p99 = np.percentile(latencies, [50, 99])
+    print(f"{len(latencies)} requests in {elapsed:.2f}s ({len(latencies) / elapsed:.0f} req/s) | "
+          f"p50 {p50:.2f} ms | p99 {p99:.2f} ms", flush=True)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Micro-batching THD class inference service")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    srv = sub.add_parser("serve", help="classify NDJSON requests from stdin (default), a Unix socket or the live ring")
+    srv.add_argument("--model", help="model file (default: the compact forest if present, else the pickle)")
+    srv.add_argument("--socket", nargs="?", const=DEFAULT_SOCKET, help=f"listen on a Unix socket (default {DEFAULT_SOCKET})")
+    srv.add_argument("--attach-ring", nargs="?", const="harmonic_ring", metavar="NAME",
+                     help="classify the analyzer's live Phase A/B/C windows")
+    srv.add_argument("--ring-period", type=float, default=1.0, help="seconds between ring classifications")
+    srv.add_argument("--max-batch", type=int, default=MAX_BATCH)
+    srv.add_argument("--budget-ms", type=float, default=BUDGET_MS, help="latency budget for filling a batch")
+    srv.add_argument("--report-s", type=float, default=10.0, help="p50/p99 report interval on stderr (0 = off)")
+
+    lt = sub.add_parser("load-test", help="drive a running socket server and report latency")
+    lt.add_argument("--socket", default=DEFAULT_SOCKET)
+    lt.add_argument("--requests", type=int, default=5000)
+    lt.add_argument("--concurrency", type=int, default=32)
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    # Stop cleanly (socket removed, final report) on SIGTERM as well as Ctrl+C
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        asyncio.run(serve(args) if args.command == "serve" else load_test(args))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+import os
+import json
+import time
+import shutil
+import tempfile
+import itertools
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from sklearn.model_selection import StratifiedKFold
+
+FOLDS = 5
+ETA = 3                 # successive halving keeps the best 1/ETA of the candidates each round
+MIN_ROWS_PER_FOLD = 20  # smallest first-round budget, per fold
+LATENCY_BATCH = 64      # rows per timed predict call, the inference server's MAX_BATCH
+LATENCY_REPEATS = 5
+TOLERANCE = 0.02        # accuracy below the round's best that still competes on speed
+RANDOM_STATE = 42
+REPORT_FILE = "model_search.json"
+
+# Candidate families and their grids; every combination is one candidate
+GRIDS = {
+    "random_forest": {"n_estimators": [10, 30, 100], "max_depth": [None, 8], "min_samples_leaf": [1, 5]},
+    "extra_trees": {"n_estimators": [10, 30, 100], "min_samples_leaf": [1, 5]},
+    "decision_tree": {"max_depth": [4, 8, None], "min_samples_leaf": [1, 5]},
+    "hist_gradient_boosting": {"max_iter": [50, 100], "max_depth": [3, None]},
+    "logistic_regression": {"C": [0.1, 1.0, 10.0]},
+}
+
+def candidates(families=None):
+    """[(family, params)] for every grid point of the chosen families."""
+    out = []
+    for family, grid in GRIDS.items():
+        if families and family not in families:
+            continue
+        for values in itertools.product(*grid.values()):
+            out.append((family, dict(zip(grid, values))))
+    return out
+
+def make_model(family, params):
+    # Single-threaded: the process pool supplies the parallelism
+    if family == "random_forest":
+        from sklearn.ensemble import RandomForestClassifier
+        return RandomForestClassifier(random_state=RANDOM_STATE, n_jobs=1, **params)
+    if family == "extra_trees":
+        from sklearn.ensemble import ExtraTreesClassifier
+        return ExtraTreesClassifier(random_state=RANDOM_STATE, n_jobs=1, **params)
+    if family == "decision_tree":
+        from sklearn.tree import DecisionTreeClassifier
+        return DecisionTreeClassifier(random_state=RANDOM_STATE, **params)
+    if family == "hist_gradient_boosting":
+        from sklearn.ensemble import HistGradientBoostingClassifier
+        return HistGradientBoostingClassifier(random_state=RANDOM_STATE, **params)
+    if family == "logistic_regression":
+        from sklearn.pipeline import make_pipeline
+        from sklearn.preprocessing import StandardScaler
+        from sklearn.linear_model import LogisticRegression
+        return make_pipeline(StandardScaler(), LogisticRegression(max_iter=1000, **params))
+    raise ValueError(f"unknown model family {family!r}")
+
+def predict_latency_us(model, X, batch=LATENCY_BATCH, repeats=LATENCY_REPEATS):
+    """Median per-row time (µs) of model.predict on batches of `batch` rows."""
+    rows = X[np.arange(batch) % len(X)]
+    model.predict(rows)
+    times = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        model.predict(rows)
+        times.append(time.perf_counter() - t0)
+    return float(np.median(times)) / batch * 1e6
+
+# Worker state: the training matrix, memory-mapped once per process
+_X = _y = None
+
+def init_worker(x_path, y_path):
+    global _X, _y
+    _X = np.load(x_path, mmap_mode="r")
+    _y = np.load(y_path, mmap_mode="r")
+    # Keep OpenMP / BLAS inside a model to one thread per worker
+    from threadpoolctl import threadpool_limits
+    threadpool_limits(1)
+
+def evaluate(index, family, params, rows, fold, folds):
+    """Fit one candidate on one fold of the first `rows` rows; returns its accuracy, fit time and latency."""
+    y = np.asarray(_y[:rows])
+    train, test = list(StratifiedKFold(folds, shuffle=True, random_state=RANDOM_STATE).split(y, y))[fold]
+    model = make_model(family, params)
+    t0 = time.perf_counter()
+    model.fit(_X[train], y[train])
+    fit_s = time.perf_counter() - t0
+    X_test = np.asarray(_X[test])
+    accuracy = float(np.mean(model.predict(X_test) == y[test]))
+    return index, fold, accuracy, fit_s, predict_latency_us(model, X_test)
+
+def halving_schedule(n_candidates, n_rows, folds, eta=ETA):
+    """Rows per round: the last round uses all rows, each earlier one 1/eta of the next."""
+    min_rows = min(MIN_ROWS_PER_FOLD * folds, n_rows)
+    rounds = 1
+    while eta ** rounds < n_candidates and n_rows // eta ** rounds >= min_rows:
+        rounds += 1
+    return [n_rows // eta ** (rounds - 1 - r) for r in range(rounds)]
+
+def rank(results, tolerance=TOLERANCE):
+    """Order candidate results best first.
+
+    Candidates within `tolerance` of the best accuracy compete on accuracy per µs of
+    inference; the rest follow by accuracy.
+    """
+    best = max(r["accuracy"] for r in results)
+    eligible = lambda r: r["accuracy"] >= best - tolerance
+    return sorted(results, key=lambda r: (eligible(r), r["accuracy_per_us"] if eligible(r) else r["accuracy"]),
+                  reverse=True)
+
+def search(features, labels, folds=FOLDS, workers=None, eta=ETA, tolerance=TOLERANCE, families=None,
+           report_path=REPORT_FILE):
+    """Successive-halving k-fold search over candidates(); returns (best entry, report).
+
+    Rows are shuffled once and written to a temporary .npy pair that the workers map
+    read-only, so no worker receives the matrix through pickling. Every (candidate,
+    fold) fit is one task; each round keeps the best 1/eta candidates by rank() and
+    gives the survivors eta times the rows, ending on the full matrix.
+    """
+    y = np.asarray(labels)
+    order = np.random.default_rng(RANDOM_STATE).permutation(len(y))
+    scratch = tempfile.mkdtemp(prefix="model_search_")
+    x_path, y_path = os.path.join(scratch, "X.npy"), os.path.join(scratch, "y.npy")
+    np.save(x_path, np.ascontiguousarray(features[order], dtype=np.float64))
+    np.save(y_path, y[order])
+
+    pool_candidates = candidates(families)
+    schedule = halving_schedule(len(pool_candidates), len(y), folds, eta)
+    entries = [{"family": family, "params": params, "rounds": []} for family, params in pool_candidates]
+    alive = list(range(len(entries)))
+    start = time.time()
+    try:
+        with ProcessPoolExecutor(workers, initializer=init_worker, initargs=(x_path, y_path)) as pool:
+            for r, rows in enumerate(schedule):
+                t = time.time()
+                futures = [pool.submit(evaluate, i, entries[i]["family"], entries[i]["params"], rows, fold, folds)
+                           for i in alive for fold in range(folds)]
+                scores = {i: [] for i in alive}
+                for future in futures:
+                    i, fold, accuracy, fit_s, latency_us = future.result()
+                    scores[i].append((accuracy, fit_s, latency_us))
+
+                results = []
+                for i in alive:
+                    accuracy, fit_s, latency_us = np.array(scores[i]).T
+                    result = {"round": r, "rows": rows, "accuracy": float(accuracy.mean()),
+                              "accuracy_std": float(accuracy.std()), "fit_s": float(fit_s.mean()),
+                              "latency_us": float(np.median(latency_us))}
+                    result["accuracy_per_us"] = result["accuracy"] / result["latency_us"]
+                    entries[i]["rounds"].append(result)
+                    results.append(dict(result, index=i))
+
+                ranked = [res["index"] for res in rank(results, tolerance)]
+                keep = 1 if r == len(schedule) - 1 else max(1, -(-len(alive) // eta))
+                for i in ranked[keep:]:
+                    entries[i]["eliminated_in"] = r
+                alive = ranked[:keep]
+                print(f"Round {r + 1}/{len(schedule)}: {len(results)} candidates x {folds} folds on {rows} rows "
+                      f"in {time.time() - t:.1f}s, {len(alive)} kept", flush=True)
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    best = entries[alive[0]]
+    report = {"folds": folds, "eta": eta, "tolerance": tolerance, "schedule": schedule, "rows": len(y),
+              "workers": workers or os.cpu_count(), "search_s": time.time() - start, "best": alive[0],
+              "candidates": entries}
+    if report_path:
+        with open(report_path, "w") as f:
+            json.dump(report, f, indent=2)
+    return best, report
+
+def print_report(report, top=10):
+    """The last round each candidate reached, best first."""
+    last = [dict(entry["rounds"][-1], index=i) for i, entry in enumerate(report["candidates"])]
+    last.sort(key=lambda r: (r["round"], r["index"] == report["best"], r["accuracy_per_us"]), reverse=True)
+    print(f"{'family':<24}{'params':<52}{'rows':>6}{'acc':>8}{'fit s':>8}{'µs/row':>9}{'acc/µs':>9}")
+    for r in last[:top]:
+        entry = report["candidates"][r["index"]]
+        params = ", ".join(f"{k}={v}" for k, v in entry["params"].items())
+        print(f"{entry['family']:<24}{params:<52}{r['rows']:>6}{r['accuracy']:>8.3f}{r['fit_s']:>8.3f}"
+              f"{r['latency_us']:>9.2f}{r['accuracy_per_us']:>9.4f}")
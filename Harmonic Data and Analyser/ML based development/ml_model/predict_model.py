@@ -1,23 +1,60 @@
+import os
 import numpy as np
 import pickle
+from features import extract_features
+from compact_forest import CompactForest, LabelDecoder, COMPACT_FILE
 
-# Load the trained model
-with open("harmonic_model.pkl", "rb") as f:
-    model, label_encoder = pickle.load(f)
+MODEL_FILE = "harmonic_model.pkl"
+N_SAMPLES = 1000
 
-# Input waveform sample (1000 values from 1s at 1kHz)
-# Example usage: paste your data into this string
-input_data = "-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025"
+def load_model(path=None):
+    """(model, label_encoder, feature_spec); feature_spec is None for raw-sample models.
+
+    Without a path the compact forest is preferred when it exists: it loads without
+    unpickling (or importing) scikit-learn.
+    """
+    if path is None:
+        path = COMPACT_FILE if os.path.exists(COMPACT_FILE) else MODEL_FILE
+    if path.endswith(".npy"):
+        forest = CompactForest(path)
+        return forest, LabelDecoder(forest.classes), forest.spec
+    with open(path, "rb") as f:
+        saved = pickle.load(f)
+    if len(saved) == 2:
+        # Models trained before feature extraction take the 1000 raw samples
+        model, label_encoder = saved
+        return model, label_encoder, None
+    return saved
+
+def model_inputs(windows, spec):
+    windows = np.atleast_2d(windows)
+    if spec is None:
+        return windows
+    return extract_features(windows, spec["sample_rate"], spec["fundamental"])
+
+# Loaded on first use so importing this module stays cheap
+_model = None
+
+def _loaded():
+    global _model
+    if _model is None:
+        _model = load_model()
+    return _model
+
+def predict_windows(windows, model=None, label_encoder=None, spec=None):
+    """THD class labels for a (windows x 1000) array, classified in one batch."""
+    if model is None:
+        model, label_encoder, spec = _loaded()
+    pred = model.predict(model_inputs(windows, spec))
+    return label_encoder.inverse_transform(pred)
 
 def classify_waveform(input_str):
     try:
         values = np.array([float(x.strip()) for x in input_str.strip().split(",")])
-        if len(values) != 1000:
+        if len(values) != N_SAMPLES:
             raise ValueError("Waveform must have exactly 1000 samples.")
 
-        values = values.reshape(1, -1)
-        pred_class = model.predict(values)[0]
-        class_label = label_encoder.inverse_transform([pred_class])[0]
+        class_label = predict_windows(values.reshape(1, -1))[0]
 
         print(f"Predicted THD Class: {class_label}")
         return class_label
@@ -25,6 +62,11 @@ def classify_waveform(input_str):
     except Exception as e:
         print(f"Error: {e}")
 
-# If input_data is provided
-if input_data:
-    classify_waveform(input_data)
+if __name__ == "__main__":
+    # Input waveform sample (1000 values from 1s at 1kHz)
+    # Example usage: paste your data into this string
+    input_data = "-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025,-13.573,112.140,193.563,273.330,336.842,319.258,341.381,254.100,225.602,81.025,13.573,-112.140,-193.563,-273.330,-336.842,-319.258,-341.381,-254.100,-225.602,-81.025"
+
+    # If input_data is provided
+    if input_data:
+        classify_waveform(input_data)
@@ -1,34 +1,307 @@
+import os
+import sys
+import json
+import time
+import argparse
 import pandas as pd
 import numpy as np
 from sklearn.model_selection import train_test_split
-from sklearn.ensemble import RandomForestClassifier
+from sklearn.ensemble import RandomForestClassifier, ExtraTreesClassifier
 from sklearn.preprocessing import LabelEncoder
 import pickle
+from features import extract_features, FEATURE_NAMES, SAMPLE_RATE, FUNDAMENTAL_FREQ
+from compact_forest import save_forest, sidecar_path, COMPACT_FILE
+import model_search
+from predict_model import load_model
 
-# Load the labeled dataset
-df = pd.read_csv("harmonic_labeled_dataset.csv")
+ML_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+DATASET = os.path.join(ML_DIR, "harmonic_labeled_dataset.csv")  # written by data_genrator.py
+MARK_2 = os.path.join(ML_DIR, "..", "mark_2")
+MODEL_FILE = "harmonic_model.pkl"
+N_SAMPLES = 1000  # Va_0 to Va_999
+N_TREES = 100
+MIN_SAMPLES_LEAF = 5
+TEST_SIZE = 0.2
+RANDOM_STATE = 42
+BATCH_SIZE = 50_000     # windows per training batch in sharded mode
+VAL_FRACTION = 0.2      # held-out share of rows in sharded mode
+FEATURE_CHUNK = 4096    # windows converted to features at a time
 
-# Extract features and labels
-X = df.iloc[:, 0:1000]  # Va_0 to Va_999
-y = df["THD_class"]
+def peak_rss_mb():
+    """High-water RSS of this process in MB, or None where it cannot be read (Windows).
 
-# Encode class labels (Low=0, Medium=1, High=2)
-label_encoder = LabelEncoder()
-y_encoded = label_encoder.fit_transform(y)
+    VmHWM is preferred: ru_maxrss survives exec, so a spawned child would report its
+    parent's peak, and it is in bytes on macOS but KiB elsewhere.
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 1024
 
-# Train-test split
-X_train, X_test, y_train, y_test = train_test_split(X, y_encoded, test_size=0.2, random_state=42)
+def load_dataset(path=DATASET):
+    """Raw windows (rows x 1000) and THD class labels from the labeled CSV."""
+    df = pd.read_csv(path)
+    X = df.iloc[:, 0:N_SAMPLES].to_numpy(dtype=np.float64)
+    y = df["THD_class"].to_numpy()
+    return X, y
 
-# Train model
-model = RandomForestClassifier(n_estimators=100, random_state=42)
-model.fit(X_train, y_train)
+def feature_spec():
+    """Stored with the model so prediction extracts exactly the same features."""
+    return {"names": FEATURE_NAMES, "n_samples": N_SAMPLES,
+            "sample_rate": SAMPLE_RATE, "fundamental": FUNDAMENTAL_FREQ}
 
-# Accuracy
-acc = model.score(X_test, y_test)
-print(f"Validation Accuracy: {acc * 100:.2f}%")
+def new_forest(n_estimators=N_TREES, **kwargs):
+    # The labels carry aliasing noise, so stop splitting at 5 samples per leaf
+    return RandomForestClassifier(n_estimators=n_estimators, min_samples_leaf=MIN_SAMPLES_LEAF,
+                                  random_state=RANDOM_STATE, **kwargs)
 
-# Save model
-with open("harmonic_model.pkl", "wb") as f:
-    pickle.dump((model, label_encoder), f)
+def train(X, y, n_trees=N_TREES):
+    """Fit the classifier on spectral features; returns (model, label_encoder, accuracy)."""
+    features = extract_features(X)
 
-print("Model saved as harmonic_model.pkl")
+    # Encode class labels (High=0, Low=1, Medium=2)
+    label_encoder = LabelEncoder()
+    y_encoded = label_encoder.fit_transform(y)
+
+    # Train-test split
+    X_train, X_test, y_train, y_test = train_test_split(features, y_encoded, test_size=TEST_SIZE,
+                                                        random_state=RANDOM_STATE)
+
+    # Train model
+    model = new_forest(n_trees)
+    model.fit(X_train, y_train)
+    return model, label_encoder, model.score(X_test, y_test)
+
+class ShardedDataset:
+    """Rows of a data_genrator.py shard directory, read through np.memmap.
+
+    Only .npy shards are memory-mapped; .npz and .wvc shards are loaded (and decoded)
+    one at a time.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, "manifest.json")) as f:
+            self.manifest = json.load(f)
+        self.class_names = np.array(self.manifest["class_names"])
+        self.shards = self.manifest["shards"]
+        self.offsets = np.cumsum([0] + [s["rows"] for s in self.shards])
+        self.size = int(self.offsets[-1])
+        self._open = (None, None, None)
+
+    def _shard(self, i):
+        if self._open[0] != i:
+            entry = self.shards[i]
+            labels = np.load(os.path.join(self.directory, entry["labels"]))
+            if entry["signals"].endswith(".npy"):
+                signals = np.load(os.path.join(self.directory, entry["signals"]), mmap_mode="r")
+            elif entry["signals"].endswith(".wvc"):
+                sys.path.insert(0, os.path.abspath(MARK_2))
+                import wavecodec
+                _, signals = wavecodec.load(os.path.join(self.directory, entry["signals"]), axis=0,
+                                            dtype=np.float32)
+            else:
+                signals = labels["signals"]
+            self._open = (i, signals, labels["thd_class"])
+        return self._open[1], self._open[2]
+
+    def batches(self, start, stop, batch_size):
+        """Yield (windows, class names) for rows start..stop-1; batches never span shards."""
+        pos = start
+        while pos < stop:
+            i = int(np.searchsorted(self.offsets, pos, side="right") - 1)
+            signals, codes = self._shard(i)
+            a = pos - self.offsets[i]
+            b = min(stop, self.offsets[i + 1], pos + batch_size) - self.offsets[i]
+            yield signals[a:b], self.class_names[codes[a:b]]
+            pos += b - a
+
+def batch_features(windows):
+    """Features for a (possibly memory-mapped) batch without a float64 copy of all of it."""
+    out = np.empty((len(windows), len(FEATURE_NAMES)))
+    for a in range(0, len(windows), FEATURE_CHUNK):
+        out[a:a + FEATURE_CHUNK] = extract_features(windows[a:a + FEATURE_CHUNK])
+    return out
+
+def train_sharded(directory, batch_size=BATCH_SIZE, n_trees=N_TREES, val_fraction=VAL_FRACTION):
+    """Grow a forest batch by batch with warm_start; returns (model, label_encoder, accuracy, stats).
+
+    The last val_fraction of the rows is held out. Every training batch adds its share
+    of the n_trees trees, fitted on that batch only, so at most one batch of features
+    is in memory. With more batches than trees the extra batches are not used, and a
+    warning says how many windows that leaves out. Every batch must hold every class:
+    trees fitted on fewer classes could not be combined with the rest.
+    """
+    data = ShardedDataset(directory)
+    label_encoder = LabelEncoder().fit(data.class_names)
+    n_train = int(data.size * (1 - val_fraction))
+
+    # Labels only: check the classes of every batch before any tree is fitted
+    sizes = []
+    for i, (_, labels) in enumerate(data.batches(0, n_train, batch_size) if n_train else []):
+        missing = sorted(set(label_encoder.classes_) - set(labels))
+        if missing and i < n_trees:
+            raise ValueError(f"training batch {i} (rows {sum(sizes)}..{sum(sizes) + len(labels) - 1}) has no "
+                             f"{', '.join(map(str, missing))} windows; use a larger --batch-size")
+        sizes.append(len(labels))
+    n_batches = len(sizes)
+    trees = [len(part) for part in np.array_split(np.arange(n_trees), max(n_batches, 1))]
+    if n_batches > n_trees:
+        print(f"Warning: {n_batches} training batches but {n_trees} trees; the last {n_batches - n_trees} "
+              f"batches ({sum(sizes[n_trees:])} windows) are not used. Raise --batch-size or --trees.",
+              flush=True)
+
+    model = new_forest(n_estimators=0, warm_start=True)
+    start = time.time()
+    seen = 0
+    for (windows, labels), n_new in zip(data.batches(0, n_train, batch_size), trees):
+        if n_new == 0:
+            break
+        model.n_estimators += n_new
+        model.fit(batch_features(windows), label_encoder.transform(labels))
+        seen += len(windows)
+        print(f"  {model.n_estimators}/{n_trees} trees, {seen} windows, "
+              f"{seen / (time.time() - start):.0f} windows/s", flush=True)
+    train_time = time.time() - start
+
+    correct = 0
+    for windows, labels in data.batches(n_train, data.size, batch_size):
+        correct += np.count_nonzero(model.predict(batch_features(windows)) == label_encoder.transform(labels))
+    acc = correct / max(data.size - n_train, 1)
+
+    stats = {"windows": seen, "train_s": train_time, "windows_per_s": seen / train_time,
+             "peak_rss_mb": peak_rss_mb()}
+    return model, label_encoder, acc, stats
+
+def search_model(features, labels, args):
+    """Cross-validated model search (model_search.py); returns (model refit on all rows, label_encoder, accuracy)."""
+    label_encoder = LabelEncoder().fit(labels)
+    y = label_encoder.transform(labels)
+    best, report = model_search.search(features, y, args.folds, args.workers, args.eta, args.tolerance,
+                                       args.families, args.report)
+    model_search.print_report(report)
+    result = best["rounds"][-1]
+    print(f"Selected {best['family']} {best['params']}: {result['accuracy'] * 100:.2f}% over {args.folds} folds, "
+          f"{result['latency_us']:.2f} µs/row, search {report['search_s']:.1f}s (report: {args.report})")
+    model = model_search.make_model(best["family"], best["params"]).fit(features, y)
+    return model, label_encoder, result["accuracy"]
+
+def sharded_features(directory, max_rows=None, batch_size=BATCH_SIZE):
+    """(features, class names) of the first max_rows rows of a shard directory."""
+    data = ShardedDataset(directory)
+    stop = data.size if max_rows is None else min(max_rows, data.size)
+    features, labels = [], []
+    for windows, names in data.batches(0, stop, batch_size):
+        features.append(batch_features(windows))
+        labels.append(names)
+    return np.concatenate(features), np.concatenate(labels)
+
+def export_forest(model, label_encoder, path=COMPACT_FILE):
+    """Flatten every tree into shared node arrays that compact_forest.CompactForest evaluates."""
+    feature, threshold, left, right, values, roots = [], [], [], [], [], []
+    offset = 0
+    for estimator in model.estimators_:
+        tree = estimator.tree_
+        ids = np.arange(tree.node_count)
+        leaf = tree.children_left == -1
+        roots.append(offset)
+        feature.append(np.where(leaf, 0, tree.feature))
+        threshold.append(np.where(leaf, np.inf, tree.threshold))
+        left.append(np.where(leaf, ids, tree.children_left) + offset)
+        right.append(np.where(leaf, ids, tree.children_right) + offset)
+        # Older scikit-learn stores class counts, newer stores fractions; normalize either way
+        value = tree.value[:, 0, :]
+        values.append(value / value.sum(axis=1, keepdims=True))
+        offset += tree.node_count
+
+    max_depth = max(estimator.tree_.max_depth for estimator in model.estimators_)
+    classes = label_encoder.inverse_transform(model.classes_)
+    save_forest(path, np.concatenate(feature), np.concatenate(threshold), np.concatenate(left),
+                np.concatenate(right), np.concatenate(values), roots, max_depth, classes, feature_spec())
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Train the THD class model")
+    parser.add_argument("--dataset", help="shard directory from data_genrator.py (default: the labeled CSV)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="windows per batch in sharded mode")
+    parser.add_argument("--trees", type=int, default=N_TREES, help="forest size")
+    parser.add_argument("--val-fraction", type=float, default=VAL_FRACTION, help="held-out share of rows in sharded mode")
+    parser.add_argument("--out", default=MODEL_FILE)
+    parser.add_argument("--export", default=COMPACT_FILE, help="compact forest file for predict_model (.npy)")
+    parser.add_argument("--no-export", action="store_true", help="only write the pickle")
+    parser.add_argument("--export-only", action="store_true", help="export the existing --out pickle without training")
+    parser.add_argument("--search", action="store_true",
+                        help="pick the model family and hyperparameters by k-fold cross-validation with "
+                             "successive halving across all cores (see model_search.py)")
+    parser.add_argument("--folds", type=int, default=model_search.FOLDS, help="cross-validation folds for --search")
+    parser.add_argument("--workers", type=int, default=None, help="search processes (default: CPU count)")
+    parser.add_argument("--eta", type=int, default=model_search.ETA,
+                        help="--search keeps the best 1/eta candidates per round")
+    parser.add_argument("--tolerance", type=float, default=model_search.TOLERANCE,
+                        help="--search ranks candidates this close to the best accuracy by accuracy per µs")
+    parser.add_argument("--families", nargs="+", choices=list(model_search.GRIDS), default=None,
+                        help="model families to search (default: all)")
+    parser.add_argument("--max-rows", type=int, default=None, help="rows of a sharded --dataset to search on")
+    parser.add_argument("--report", default=model_search.REPORT_FILE, help="per-candidate --search results")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.export_only:
+        model, label_encoder, spec = load_model(args.out)
+        if spec is None:
+            raise SystemExit(f"{args.out} takes raw samples; only feature-based models can be exported "
+                             "(retrain it with this script)")
+        if not isinstance(model, (RandomForestClassifier, ExtraTreesClassifier)):
+            raise SystemExit(f"{args.out} holds a {type(model).__name__}; only forests have a compact form")
+        export_forest(model, label_encoder, args.export)
+        print(f"Compact forest saved as {args.export}")
+        raise SystemExit
+
+    if args.search:
+        start = time.time()
+        if args.dataset:
+            features, labels = sharded_features(args.dataset, args.max_rows, args.batch_size)
+        else:
+            X, labels = load_dataset()
+            features = extract_features(X)
+        model, label_encoder, acc = search_model(features, labels, args)
+        print(f"Searched and trained on {len(features)} windows in {time.time() - start:.2f}s")
+    elif args.dataset:
+        model, label_encoder, acc, stats = train_sharded(args.dataset, args.batch_size, args.trees, args.val_fraction)
+        rss = "" if stats["peak_rss_mb"] is None else f", peak RSS {stats['peak_rss_mb']:.0f} MB"
+        print(f"Trained on {stats['windows']} windows in {stats['train_s']:.2f}s "
+              f"({stats['windows_per_s']:.0f} windows/s{rss})")
+    else:
+        X, y = load_dataset()
+        start = time.time()
+        model, label_encoder, acc = train(X, y, args.trees)
+        print(f"Trained on {len(X)} windows in {time.time() - start:.2f}s")
+    print(f"Validation Accuracy: {acc * 100:.2f}%")
+
+    # Save model; the third element marks the feature-based format
+    if os.path.islink(args.out):
+        # Published from the build cache (build_cache.py); replace the link, keep the cached copy
+        os.remove(args.out)
+    with open(args.out, "wb") as f:
+        pickle.dump((model, label_encoder, feature_spec()), f)
+
+    print(f"Model saved as {args.out}")
+
+    if not args.no_export and isinstance(model, (RandomForestClassifier, ExtraTreesClassifier)):
+        export_forest(model, label_encoder, args.export)
+        print(f"Compact forest saved as {args.export}")
+    elif not args.no_export and os.path.lexists(args.export):
+        # predict_model prefers the compact forest, which would now be stale
+        for name in (args.export, args.export[:-len(".npy")] + ".values.npy", sidecar_path(args.export)):
+            if os.path.lexists(name):
+                os.remove(name)
+        print(f"{type(model).__name__} has no compact form; removed the stale {args.export}")
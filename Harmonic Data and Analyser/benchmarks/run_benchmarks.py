@@ -0,0 +1,386 @@
+import os
+import io
+import sys
+import gc
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import contextlib
+import tracemalloc
+import multiprocessing
+import numpy as np
+from queue import Empty
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MARK_2 = os.path.join(ROOT, "mark_2")
+ML_DIR = os.path.join(ROOT, "ML based development")
+ML_MODEL = os.path.join(ML_DIR, "ml_model")
+sys.path[:0] = [MARK_2, ML_DIR, ML_MODEL]
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+SEED = 0
+MIN_TIME = 1.0      # seconds of timed repeats per case
+MAX_REPEATS = 200
+TOLERANCE = 0.25    # throughput drop that counts as a regression
+TRAINING_TIMEOUT_S = 3600  # per training size, before the child is stopped
+
+SIZES = {
+    "quick":    {"channels": [1, 3], "rates": [1000], "rows": [500]},
+    "standard": {"channels": [1, 3, 100, 1000], "rates": [1000, 25600], "rows": [500, 10_000, 100_000]},
+    "full":     {"channels": [1, 3, 100, 1000], "rates": [1000, 25600], "rows": [500, 10_000, 100_000, 1_000_000]},
+}
+
+def measure(fn, units, unit, min_time=MIN_TIME, max_repeats=MAX_REPEATS):
+    """Time fn() repeatedly; returns throughput, latency percentiles and peak traced allocation."""
+    fn()  # warm caches, plans and lazy imports
+    latencies = []
+    start = time.perf_counter()
+    while len(latencies) < 3 or (time.perf_counter() - start < min_time and len(latencies) < max_repeats):
+        t0 = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - t0)
+
+    gc.collect()
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    latencies = np.array(latencies) * 1000
+    p50, p99 = np.percentile(latencies, [50, 99])
+    return {
+        "unit": unit,
+        "throughput": units / (p50 / 1000),
+        "p50_ms": p50,
+        "p99_ms": p99,
+        "mean_ms": latencies.mean(),
+        "repeats": len(latencies),
+        "peak_mb": peak / 2**20,
+        "peak_mb_source": "tracemalloc",
+    }
+
+# Synthesis
+
+def bench_synthesis(sizes):
+    import data_generator as gen
+
+    np.random.seed(SEED)
+    t = np.arange(1000) / 1000
+
+    def per_sample():
+        for ti in t:
+            gen.generate_voltage(ti)
+
+    yield "synthesis.generate_voltage", measure(per_sample, 1000, "samples")
+
+    for ch in sizes["channels"]:
+        for fs in sizes["rates"]:
+            synth = gen.BlockSynthesizer(ch, fs, seed=SEED)
+            yield f"synthesis.block[ch={ch},fs={fs}]", measure(synth.next_block, ch * fs, "samples")
+
+# Analysis
+
+def bench_analysis(sizes):
+    import pandas as pd
+    import data_generator as gen
+    import harmonic_analyzer as ha
+    from sliding_dft import SlidingHarmonicBank
+    from aggregation import TenCycleStage
+
+    for ch in sizes["channels"]:
+        for fs in sizes["rates"]:
+            time_ms, block = gen.BlockSynthesizer(ch, fs, seed=SEED).next_block()
+            tag = f"[ch={ch},fs={fs}]"
+            yield f"analysis.analyze_window{tag}", measure(lambda: ha.analyze_window(block, fs), ch * fs, "samples")
+            # One IEC 10-cycle (200 ms) window, a fifth of the FFT
+            short = block[:, :fs // 5]
+            yield (f"analysis.analyze_window_200ms{tag}",
+                   measure(lambda: ha.analyze_window(short, fs), ch * fs // 5, "samples"))
+
+            result = ha.analyze_window(block, fs)
+            yield (f"analysis.calculate_thd{tag}",
+                   measure(lambda: ha.calculate_thd(result.magnitude, result.fundamental_bin,
+                                                    np.maximum(result.harmonic_bins, 0)), ch, "windows"))
+
+            hop = fs // 10
+            bins = np.unique(np.maximum(result.harmonic_bins, 0))
+            bank = SlidingHarmonicBank(fs, hop, bins, ch)
+            bank.reset(block)
+            x_old, x_new = block[:, :hop], block[:, -hop:]
+            yield f"analysis.sliding_update{tag}", measure(lambda: bank.update(x_old, x_new), ch * hop, "samples")
+
+            stage = TenCycleStage(ch, fs)
+            clock = {"t": 0.0}
+
+            def feed():
+                stage.feed(time_ms + clock["t"], block)
+                clock["t"] += 1000
+
+            yield f"aggregation.ten_cycle{tag}", measure(feed, ch * fs, "samples")
+
+    # The CSV cycle of the original analyzer: re-read realtime_data.csv, then analyze
+    time_ms, block = gen.BlockSynthesizer(3, 1000, seed=SEED).next_block()
+    tmp = tempfile.mkdtemp()
+    cwd = os.getcwd()
+    try:
+        df = pd.DataFrame(np.column_stack((time_ms, block.T)), columns=["Time(ms)"] + gen.channel_names(3))
+        df.to_csv(os.path.join(tmp, "realtime_data.csv"), index=False)
+        os.chdir(tmp)
+        source = ha.CsvSource()
+
+        def csv_cycle():
+            t, phases, _ = source.read()
+            ha.analyze_window(phases, source.sample_rate)
+
+        yield "analysis.csv_cycle[ch=3,fs=1000]", measure(csv_cycle, 3000, "samples")
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(tmp)
+
+# Storage
+
+def bench_storage(sizes):
+    import pandas as pd
+    import data_generator as gen
+    import wavecodec as wc
+    import data_genrator as ml_gen
+
+    # A datalog chunk is a few channels; the 1000-channel blocks would only measure memory traffic
+    for ch in [c for c in sizes["channels"] if c <= 100]:
+        for fs in sizes["rates"]:
+            time_ms, block = gen.BlockSynthesizer(ch, fs, seed=SEED).next_block()
+            tag = f"[ch={ch},fs={fs}]"
+            encoded = wc.encode_chunk(block, 0.01)
+            result = measure(lambda: wc.encode_chunk(block, 0.01), ch * fs, "samples")
+            result["bytes_per_sample"] = len(encoded) / block.size
+            yield f"storage.wvc_encode{tag}", result
+            yield f"storage.wvc_decode{tag}", measure(lambda: wc.decode_chunk(encoded, 0.01), ch * fs, "samples")
+
+    # Loading the labeled ML dataset: CSV text against the .wvc shard of the same rows
+    tmp = tempfile.mkdtemp()
+    try:
+        for rows in sizes["rows"][:2]:
+            signals, *_ = ml_gen.generate_batch(np.random.default_rng(SEED), rows)
+            signals = np.round(signals, 3)
+            csv_path, wvc_path = os.path.join(tmp, f"{rows}.csv"), os.path.join(tmp, f"{rows}.wvc")
+            pd.DataFrame(signals).to_csv(csv_path, index=False)
+            with wc.WaveWriter(wvc_path, 0.001) as writer:
+                for a in range(0, rows, ml_gen.BATCH_SIZE):
+                    writer.write(signals[a:a + ml_gen.BATCH_SIZE])
+
+            result = measure(lambda: pd.read_csv(csv_path).to_numpy(), rows, "windows")
+            result["bytes_per_sample"] = os.path.getsize(csv_path) / signals.size
+            yield f"storage.load_csv[rows={rows}]", result
+            result = measure(lambda: wc.load(wvc_path, axis=0), rows, "windows")
+            result["bytes_per_sample"] = os.path.getsize(wvc_path) / signals.size
+            yield f"storage.load_wvc[rows={rows}]", result
+    finally:
+        shutil.rmtree(tmp)
+
+# Training (each size in a fresh process so peak RSS belongs to that run alone)
+
+def _train_child(rows, tmp, queue):
+    import data_genrator
+    import train_model
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        data_genrator.generate_shards(rows, tmp, seed=SEED, workers=1)
+        generate_s = time.perf_counter() - start
+        batch = min(train_model.BATCH_SIZE, max(rows // 5, 100))
+        _, _, acc, stats = train_model.train_sharded(tmp, batch_size=batch)
+    queue.put({"generate_s": generate_s, "train_s": stats["train_s"], "windows": stats["windows"],
+               "accuracy": acc, "peak_rss_mb": train_model.peak_rss_mb()})
+
+def _child_result(child, queue, timeout=TRAINING_TIMEOUT_S):
+    """The child's result, or (None, reason) if it died or ran past the timeout."""
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return queue.get(timeout=1.0), None
+        except Empty:
+            if not child.is_alive():
+                # It may have posted its result just before exiting
+                try:
+                    return queue.get(timeout=1.0), None
+                except Empty:
+                    return None, f"training process exited with code {child.exitcode}"
+            if time.monotonic() > deadline:
+                child.terminate()
+                return None, f"training process still running after {timeout:.0f}s"
+
+def bench_training(sizes):
+    ctx = multiprocessing.get_context("spawn")
+    for rows in sizes["rows"]:
+        tmp = tempfile.mkdtemp()
+        try:
+            queue = ctx.Queue()
+            child = ctx.Process(target=_train_child, args=(rows, tmp, queue))
+            child.start()
+            out, error = _child_result(child, queue)
+            child.join()
+        finally:
+            shutil.rmtree(tmp)
+        if error:
+            for name in (f"dataset.generate[rows={rows}]", f"training.sharded[rows={rows}]"):
+                yield name, {"unit": "windows", "throughput": 0.0, "failed": error}
+            continue
+        common = {"repeats": 1}
+        if out["peak_rss_mb"] is not None:
+            common.update(peak_mb=out["peak_rss_mb"], peak_mb_source="rss")
+        yield f"dataset.generate[rows={rows}]", dict(common, unit="windows", throughput=rows / out["generate_s"],
+                                                       p50_ms=out["generate_s"] * 1000, p99_ms=out["generate_s"] * 1000)
+        yield f"training.sharded[rows={rows}]", dict(common, unit="windows", throughput=out["windows"] / out["train_s"],
+                                                       p50_ms=out["train_s"] * 1000, p99_ms=out["train_s"] * 1000,
+                                                       accuracy=out["accuracy"])
+
+# Inference
+
+def cold_start(path, repeats=3):
+    """A fresh interpreter importing predict_model and loading one model file."""
+    import subprocess
+    code = f"from predict_model import load_model; load_model({path!r})"
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], cwd=ML_MODEL, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        times.append((time.perf_counter() - start) * 1000)
+    p50, p99 = np.percentile(times, [50, 99])
+    return {"unit": "starts", "throughput": 1000 / p50, "p50_ms": p50, "p99_ms": p99, "repeats": repeats}
+
+def bench_inference(sizes):
+    import predict_model
+    from features import extract_features
+
+    cwd = os.getcwd()
+    os.chdir(ML_MODEL)
+    try:
+        rng = np.random.default_rng(SEED)
+        t = np.arange(1000) / 1000
+        windows = 340 * np.sin(2 * np.pi * 50 * t) + rng.normal(0, 20, (1024, 1000))
+        text = ",".join(f"{v:.3f}" for v in windows[0])
+
+        def classify():
+            with contextlib.redirect_stdout(io.StringIO()):
+                predict_model.classify_waveform(text)
+
+        yield "inference.classify_waveform", measure(classify, 1, "windows")
+        yield "inference.extract_features[batch=1024]", measure(lambda: extract_features(windows), 1024, "windows")
+
+        for name, path in [("pickle", predict_model.MODEL_FILE), ("compact", "harmonic_model.forest.npy")]:
+            if not os.path.exists(path):
+                continue
+            yield f"inference.cold_start[{name}]", cold_start(path)
+            yield f"inference.load[{name}]", measure(lambda: predict_model.load_model(path), 1, "loads",
+                                                       min_time=0.5, max_repeats=5)
+            model, encoder, spec = predict_model.load_model(path)
+            for batch in (1, 64, 1024):
+                yield (f"inference.predict[{name},batch={batch}]",
+                       measure(lambda: predict_model.predict_windows(windows[:batch], model, encoder, spec),
+                               batch, "windows"))
+    finally:
+        os.chdir(cwd)
+
+SUITES = {
+    "synthesis": bench_synthesis,
+    "analysis": bench_analysis,
+    "storage": bench_storage,
+    "training": bench_training,
+    "inference": bench_inference,
+}
+
+def metadata(size):
+    commit = None
+    with contextlib.suppress(Exception):
+        import subprocess
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                                text=True).stdout.strip() or None
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": commit,
+        "size": size,
+        "seed": SEED,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpus": os.cpu_count(),
+    }
+
+def compare(results, baseline, tolerance):
+    """Throughput ratio of every case present in both runs; returns the regressed case names."""
+    regressions = []
+    print(f"\n{'case':58s} {'throughput':>14s} {'baseline':>14s} {'ratio':>7s}", flush=True)
+    for name, r in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        ratio = r["throughput"] / base["throughput"]
+        flag = ""
+        if "failed" in r:
+            flag = "  FAILED"
+            regressions.append(name)
+        elif ratio < 1 - tolerance:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        print(f"{name:58s} {r['throughput']:14.4g} {base['throughput']:14.4g} {ratio:7.2f}{flag}", flush=True)
+    return regressions
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark synthesis, analysis, storage, training and inference")
+    parser.add_argument("--size", choices=list(SIZES), default="standard",
+                        help="quick: a smoke run; full adds 1M training rows")
+    parser.add_argument("--suite", action="append", choices=list(SUITES), help="run only these suites")
+    parser.add_argument("--out", default="benchmark_results.json", help="JSON results file")
+    parser.add_argument("--baseline", default=BASELINE, help="results file to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="also write the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE, help="allowed throughput drop (fraction)")
+    parser.add_argument("--fail-on-regression", action="store_true", help="exit with status 1 on a regression")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    sizes = SIZES[args.size]
+    results = {}
+    for suite in args.suite or SUITES:
+        for name, result in SUITES[suite](sizes):
+            results[name] = result
+            if "failed" in result:
+                print(f"{name:58s} FAILED: {result['failed']}", flush=True)
+                continue
+            peak = f"{result['peak_mb']:8.1f} MB" if "peak_mb" in result else "       -"
+            size = f" | {result['bytes_per_sample']:.2f} B/sample" if "bytes_per_sample" in result else ""
+            print(f"{name:58s} {result['throughput']:12.4g} {result['unit']}/s | p50 {result['p50_ms']:9.3f} ms"
+                  f" | p99 {result['p99_ms']:9.3f} ms | peak {peak}{size}", flush=True)
+
+    report = {"meta": metadata(args.size), "results": results}
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults saved to {args.out}", flush=True)
+    failed = [name for name, result in results.items() if "failed" in result]
+    if failed:
+        print(f"{len(failed)} case(s) failed", flush=True)
+    if args.save_baseline and failed:
+        print("Baseline not saved: some cases failed", flush=True)
+        return 1
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline saved to {args.baseline}", flush=True)
+        return 0
+
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline["results"], args.tolerance)
+        print(f"\n{len(regressions)} regression(s) beyond {args.tolerance:.0%}", flush=True)
+        if regressions and args.fail_on_regression:
+            return 1
+    return 1 if failed and args.fail_on_regression else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,120 @@
+import json
+import numpy as np
+from collections import namedtuple
+from functools import lru_cache
+from scipy.fft import rfft
+
+FUNDAMENTAL_FREQ = 50
+WINDOW_CYCLES = 10                       # 200 ms basic interval at 50 Hz
+LEVELS = [('3s', 15), ('10min', 200)]    # 15 x 10-cycle = 150 cycles; 200 x 3 s = 10 min
+MAX_HARMONIC = 49
+
+AggregateRecord = namedtuple('AggregateRecord', ['level', 'start_ms', 'end_ms', 'orders', 'values', 'thd'])
+
+@lru_cache(maxsize=8)
+def group_weights(n, sample_rate, fundamental=FUNDAMENTAL_FREQ, cycles=WINDOW_CYCLES):
+    """(orders, bin index matrix, weights) for IEC 61000-4-7 harmonic groups.
+
+    Group h sums the squared bins within +/- half a harmonic spacing of h, with the two
+    bins exactly half-way to the neighbours weighted 1/2.
+    """
+    n_bins = n // 2 + 1
+    offsets = np.arange(-cycles // 2, cycles // 2 + 1)
+    weights = np.ones(len(offsets))
+    weights[[0, -1]] = 0.5
+    orders = np.arange(1, MAX_HARMONIC + 1)
+    centers = orders * int(round(fundamental * n / sample_rate))
+    orders = orders[centers + offsets[-1] < n_bins]
+    bins = orders[:, None] * int(round(fundamental * n / sample_rate)) + offsets
+    return orders, bins, weights
+
+def harmonic_groups(block, sample_rate, fundamental=FUNDAMENTAL_FREQ, cycles=WINDOW_CYCLES):
+    """RMS harmonic group values for a (channels x N) block covering `cycles` cycles."""
+    n = block.shape[-1]
+    orders, bins, weights = group_weights(n, sample_rate, fundamental, cycles)
+    power = np.abs(rfft(block, axis=-1)) ** 2 * (2 / n**2)
+    return orders, np.sqrt(power[:, bins] @ weights)
+
+class HarmonicAggregator:
+    """Streaming RMS aggregation of 10-cycle values into the 150-cycle and 10-minute levels.
+
+    Every level keeps a preallocated (channels x orders) sum of squares and a count.
+    When a level has collected its number of inputs it emits their RMS, resets, and
+    feeds that value to the next level, so memory is fixed however long it runs.
+    """
+
+    def __init__(self, n_channels, orders, levels=LEVELS):
+        self.orders = np.asarray(orders)
+        self.levels = levels
+        self.sum_sq = np.zeros((len(levels), n_channels, len(self.orders)))
+        self.counts = np.zeros(len(levels), dtype=int)
+        self.starts = np.zeros(len(levels))
+        self.scratch = np.empty((n_channels, len(self.orders)))
+
+    def add(self, values, start_ms, end_ms):
+        """Feed one 10-cycle (channels x orders) array; return the records that closed."""
+        records = []
+        for i, (name, length) in enumerate(self.levels):
+            if self.counts[i] == 0:
+                self.starts[i] = start_ms
+            np.square(values, out=self.scratch)
+            self.sum_sq[i] += self.scratch
+            self.counts[i] += 1
+            if self.counts[i] < length:
+                break
+            values = np.sqrt(self.sum_sq[i] / length)
+            thd = 100 * np.sqrt(np.sum(values[:, 1:] ** 2, axis=-1)) / values[:, 0]
+            records.append(AggregateRecord(name, self.starts[i], end_ms, self.orders, values, thd))
+            self.sum_sq[i] = 0
+            self.counts[i] = 0
+        return records
+
+class TenCycleStage:
+    """Cut a continuous sample stream into 10-cycle windows and aggregate their harmonic groups."""
+
+    def __init__(self, n_channels, sample_rate, fundamental=FUNDAMENTAL_FREQ, cycles=WINDOW_CYCLES):
+        self.sample_rate = sample_rate
+        self.fundamental = fundamental
+        self.cycles = cycles
+        self.window_len = int(round(cycles * sample_rate / fundamental))
+        self.buffer = np.empty((n_channels, self.window_len))
+        self.fill = 0
+        self.start_ms = None
+        self.last_ms = None
+        self.gaps = 0
+        orders, _, _ = group_weights(self.window_len, sample_rate, fundamental, cycles)
+        self.aggregator = HarmonicAggregator(n_channels, orders)
+
+    def feed(self, time_ms, block):
+        """Append (n,) times and (channels x n) samples; return records closed by them."""
+        step = 1000 / self.sample_rate
+        if self.last_ms is not None and abs(time_ms[0] - self.last_ms - step) > step / 2:
+            # Samples were missed; restart the current 10-cycle interval
+            self.gaps += 1
+            self.fill = 0
+        self.last_ms = time_ms[-1]
+
+        records = []
+        done = 0
+        while done < block.shape[-1]:
+            if self.fill == 0:
+                self.start_ms = time_ms[done]
+            n = min(block.shape[-1] - done, self.window_len - self.fill)
+            self.buffer[:, self.fill:self.fill + n] = block[:, done:done + n]
+            self.fill += n
+            done += n
+            if self.fill == self.window_len:
+                _, values = harmonic_groups(self.buffer, self.sample_rate, self.fundamental, self.cycles)
+                records += self.aggregator.add(values, self.start_ms, time_ms[done - 1] + step)
+                self.fill = 0
+        return records
+
+def record_to_json(record, labels):
+    return json.dumps({
+        'level': record.level,
+        'start_ms': record.start_ms,
+        'end_ms': record.end_ms,
+        'orders': record.orders.tolist(),
+        'thd': dict(zip(labels, np.round(record.thd, 4).tolist())),
+        'rms': dict(zip(labels, np.round(record.values, 4).tolist())),
+    })
@@ -0,0 +1,225 @@
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from harmonic_analyzer import analyze_window, phase_labels, MAX_HARMONIC
+from datalog import DatalogReader, csv_epoch
+from results_store import ResultsStore
+
+ML_MODEL = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "ML based development", "ml_model")
+WINDOW_MS = 1000
+WINDOWS_PER_TASK = 32   # windows analyzed per task, in one batched FFT
+CHUNK_S = 60            # seconds of datalog read at a time
+CSV_ROWS = 100_000      # rows per pandas chunk for datalog.csv input
+
+# Worker state, set up once per process by init_worker
+_model = None
+_predict = None
+
+def init_worker(model_path):
+    global _model, _predict
+    if model_path:
+        sys.path.insert(0, os.path.abspath(ML_MODEL))
+        from predict_model import load_model, predict_windows
+        _model = load_model(model_path)
+        _predict = predict_windows
+
+def analyze_batch(starts, blocks, sample_rate, window_ms, keep_harmonics):
+    """Analyze (windows x channels x N) blocks; returns (CSV lines, arrays for the results store).
+
+    Formatting happens here too, so the parent only writes finished text.
+    """
+    n_windows, n_channels, n = blocks.shape
+    result = analyze_window(blocks.reshape(-1, n).astype(np.float64), sample_rate)
+    fields = [result.fundamental_freq, result.rms, result.peak, result.thd]
+    fields = [f.reshape(n_windows, n_channels) for f in fields]
+    classes = None
+    if _model is not None:
+        model, label_encoder, spec = _model
+        classes = _predict(blocks.reshape(-1, n)[:, -spec["n_samples"]:], model, label_encoder,
+                                  spec).reshape(n_windows, n_channels)
+
+    lines = []
+    for w in range(n_windows):
+        values = [f"{starts[w]:.3f}", f"{starts[w] + window_ms:.3f}"]
+        for p in range(n_channels):
+            values += [f"{fields[0][w, p]:.3f}", f"{fields[1][w, p]:.3f}", f"{fields[2][w, p]:.3f}",
+                       f"{fields[3][w, p]:.4f}"]
+            if classes is not None:
+                values.append(str(classes[w, p]))
+        lines.append(",".join(values))
+
+    arrays = None
+    if keep_harmonics:
+        shape = (n_windows, n_channels)
+        arrays = (result.fundamental_freq.reshape(shape), result.fundamental_mag.reshape(shape), fields[1],
+                  fields[2], fields[3], result.harmonic_mags.reshape(shape + (-1,)))
+    return "\n".join(lines) + "\n", arrays
+
+def iter_csv(path, rows=CSV_ROWS):
+    """(time_ms, channels x n) chunks of a datalog.csv."""
+    for df in pd.read_csv(path, chunksize=rows):
+        values = df.to_numpy(dtype=np.float64)
+        yield values[:, 0], values[:, 1:].T
+
+def iter_datalog(reader, start_ms, end_ms, chunk_s=CHUNK_S):
+    """(time_ms, channels x n) chunks of a binary datalog, chunk_s seconds at a time.
+
+    Time(ms) is relative to the first run's epoch, so runs after a generator restart
+    follow on at their wall-clock place instead of overlapping the first.
+    """
+    t = start_ms
+    while t < end_ms:
+        time_ms, block = reader.read_wall(reader.epoch_unix + t / 1000,
+                                          reader.epoch_unix + min(t + chunk_s * 1000, end_ms) / 1000)
+        if len(time_ms):
+            yield time_ms, block
+        t += chunk_s * 1000
+
+def iter_windows(chunks, sample_rate, window_ms, stats):
+    """Cut a chunk stream into windows [k * window_ms, (k + 1) * window_ms) of Time(ms).
+
+    Time(ms) is snapped to the sample grid first (a sample-mode datalog.csv accumulates
+    float error in it), so windowing works on integer sample numbers. Yields (start_ms,
+    channels x N) for every window that has exactly N samples; windows with gaps are
+    counted in stats['skipped'] and left out. The unfinished window at the end of each
+    chunk carries over to the next.
+    """
+    n = int(round(window_ms * sample_rate / 1000))
+    carry_i, carry = np.empty(0, dtype=np.int64), None
+    for time_ms, block in chunks:
+        index = np.rint(np.asarray(time_ms) * sample_rate / 1000).astype(np.int64)
+        if carry is not None and len(carry_i):
+            index = np.concatenate((carry_i, index))
+            block = np.concatenate((carry, block), axis=1)
+        k = index // n
+        edges = np.concatenate(([0], np.flatnonzero(np.diff(k)) + 1, [len(k)]))
+        for a, b in zip(edges[:-2], edges[1:-1]):
+            if b - a == n:
+                yield k[a] * window_ms, block[:, a:b]
+            else:
+                stats['skipped'] += 1
+        carry_i, carry = index[edges[-2]:], block[:, edges[-2]:]
+    if carry is not None and len(carry_i) == n:
+        yield carry_i[0] // n * window_ms, carry
+
+def iter_batches(windows, size):
+    starts, blocks = [], []
+    for start, block in windows:
+        starts.append(start)
+        blocks.append(block)
+        if len(blocks) == size:
+            yield np.array(starts), np.stack(blocks)
+            starts, blocks = [], []
+    if blocks:
+        yield np.array(starts), np.stack(blocks)
+
+def open_input(path, start_ms=None, end_ms=None):
+    """(chunk iterator, channel count, sample rate, Unix epoch of Time(ms) = 0)."""
+    if os.path.isdir(path):
+        reader = DatalogReader(path)
+        if not reader.segments:
+            raise ValueError(f"{path} holds no datalog segments")
+        first, last = reader.wall_range()
+        start = first if start_ms is None else start_ms
+        end = last + 1 if end_ms is None else end_ms
+        return (iter_datalog(reader, start, end), len(reader.columns), reader.segments[0]['sample_rate'],
+                reader.epoch_unix)
+    head = pd.read_csv(path, nrows=2)
+    sample_rate = round(1000 / (head['Time(ms)'][1] - head['Time(ms)'][0]))
+    chunks = iter_csv(path)
+    if start_ms is not None or end_ms is not None:
+        lo = -np.inf if start_ms is None else start_ms
+        hi = np.inf if end_ms is None else end_ms
+        chunks = ((t[(t >= lo) & (t < hi)], x[:, (t >= lo) & (t < hi)]) for t, x in chunks)
+    return chunks, head.shape[1] - 1, sample_rate, csv_epoch(path)
+
+def backfill(args):
+    chunks, n_channels, sample_rate, epoch = open_input(args.datalog, args.start_ms, args.end_ms)
+    labels = phase_labels(n_channels)
+    n = int(round(args.window_ms * sample_rate / 1000))
+    if args.model:
+        init_worker(args.model)
+        spec = _model[2]
+        if spec is None or spec["sample_rate"] != sample_rate or spec["n_samples"] > n:
+            raise ValueError(f"the model needs {spec and spec['n_samples']} samples at "
+                             f"{spec and spec['sample_rate']} Hz per window; the datalog has {n} at {sample_rate} Hz")
+    store = None
+    if args.results:
+        store = ResultsStore(args.results, labels, np.arange(2, MAX_HARMONIC + 1))
+
+    columns = ["start_ms", "end_ms"]
+    for label in labels:
+        columns += [f"{label}_freq", f"{label}_rms", f"{label}_peak", f"{label}_thd"]
+        if args.model:
+            columns.append(f"{label}_class")
+
+    stats = {'skipped': 0}
+    batches = iter_batches(iter_windows(chunks, sample_rate, args.window_ms, stats), args.windows_per_task)
+    max_in_flight = 2 * args.workers
+    pending = deque()
+    done = 0
+    rejected = 0
+    start = time.time()
+    last_report = start
+
+    def write(starts, future):
+        nonlocal done, rejected
+        text, arrays = future.result()
+        out.write(text)
+        if store:
+            for w, t in enumerate(starts):
+                if not store.append(epoch + (t + args.window_ms) / 1000, *(a[w] for a in arrays)):
+                    rejected += 1
+        done += len(starts)
+
+    # Windows are submitted in time order and written in that order; at most max_in_flight
+    # batches are queued, so memory does not grow with the length of the datalog
+    with open(args.out, "w") as out, \
+            ProcessPoolExecutor(args.workers, initializer=init_worker, initargs=(args.model,)) as pool:
+        out.write(",".join(columns) + "\n")
+        for starts, blocks in batches:
+            pending.append((starts, pool.submit(analyze_batch, starts, blocks, sample_rate, args.window_ms,
+                                                store is not None)))
+            if len(pending) >= max_in_flight:
+                write(*pending.popleft())
+            if time.time() - last_report >= args.status_s:
+                last_report = time.time()
+                print(f"{done} windows, {done * args.window_ms / 1000 / (last_report - start):.0f}x real time",
+                      flush=True)
+        while pending:
+            write(*pending.popleft())
+    if store:
+        store.close()
+
+    elapsed = time.time() - start
+    print(f"Analyzed {done} windows ({done * args.window_ms / 1000:.0f} s of data) in {elapsed:.2f}s, "
+          f"{done * args.window_ms / 1000 / max(elapsed, 1e-9):.0f}x real time; {stats['skipped']} incomplete "
+          f"windows skipped -> {args.out}", flush=True)
+    if rejected:
+        print(f"{rejected} windows not stored: the results store already holds later rows", flush=True)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Re-analyze a recorded datalog with a process pool")
+    parser.add_argument('datalog', help="binary datalog directory or datalog.csv")
+    parser.add_argument('--out', default='backfill.csv', help="per-window results, in time order")
+    parser.add_argument('--window-ms', type=float, default=WINDOW_MS,
+                        help="analysis window; windows start at multiples of it in Time(ms)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--windows-per-task', type=int, default=WINDOWS_PER_TASK)
+    parser.add_argument('--start-ms', type=float, default=None,
+                        help="for a datalog directory, Time(ms) of its first generator run (later runs follow on)")
+    parser.add_argument('--end-ms', type=float, default=None)
+    parser.add_argument('--model', default=None,
+                        help="also classify every window and phase with this model (e.g. harmonic_model.forest.npy)")
+    parser.add_argument('--results', default=None, metavar='DIR',
+                        help="also append the results to this results store (see results_store.py)")
+    parser.add_argument('--status-s', type=float, default=10.0, help="progress line interval")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    backfill(parse_args())
@@ -0,0 +1,171 @@
+import os
+import json
+import time
+import numpy as np
+from collections import namedtuple
+
+# Defaults (EN 50160 style limits)
+THD_LIMIT = 8.0          # %
+SAG_LEVEL = 0.9          # fraction of nominal RMS
+SWELL_LEVEL = 1.1
+FREQ_DEVIATION = 0.5     # Hz
+NOMINAL_VOLTAGE = 240.0  # V RMS
+NOMINAL_FREQ = 50.0
+PRE_TRIGGER = 1.0        # seconds kept before the trigger
+POST_TRIGGER = 2.0       # seconds recorded after it
+RING_SECONDS = 10.0
+
+Trigger = namedtuple('Trigger', ['kind', 'phase', 'value', 'limit', 'time_ms'])
+
+class EventDetector:
+    """Compare per-cycle THD, RMS and fundamental frequency against their limits.
+
+    Each (condition, phase) pair fires once when it goes out of limits and re-arms
+    only after a cycle back within them, so a lasting disturbance is one event.
+    """
+
+    KINDS = ['thd', 'sag', 'swell', 'frequency']
+
+    def __init__(self, labels, thd_limit=THD_LIMIT, sag=SAG_LEVEL, swell=SWELL_LEVEL,
+                 freq_deviation=FREQ_DEVIATION, nominal_v=NOMINAL_VOLTAGE, nominal_hz=NOMINAL_FREQ):
+        self.labels = labels
+        self.limits = {
+            'thd': thd_limit,
+            'sag': sag * nominal_v,
+            'swell': swell * nominal_v,
+            'frequency': freq_deviation,
+        }
+        self.nominal_hz = nominal_hz
+        self.active = np.zeros((len(self.KINDS), len(labels)), dtype=bool)
+
+    def check(self, time_ms, thd, rms, freq=None):
+        """Triggers that fired this cycle; freq may be None when it was not measured."""
+        values = [thd, rms, rms, None if freq is None else np.abs(freq - self.nominal_hz)]
+        out = [
+            np.asarray(thd) > self.limits['thd'],
+            np.asarray(rms) < self.limits['sag'],
+            np.asarray(rms) > self.limits['swell'],
+            np.zeros(len(self.labels), dtype=bool) if freq is None else values[3] > self.limits['frequency'],
+        ]
+        fired = []
+        for k, kind in enumerate(self.KINDS):
+            for p in np.flatnonzero(out[k] & ~self.active[k]):
+                fired.append(Trigger(kind, self.labels[p], float(values[k][p]), self.limits[kind], float(time_ms)))
+            if freq is not None or kind != 'frequency':
+                self.active[k] = out[k]
+        return fired
+
+class CaptureRing:
+    """Preallocated circular buffer of the last `seconds` of raw (time + channels) samples."""
+
+    def __init__(self, n_channels, sample_rate, seconds=RING_SECONDS):
+        self.sample_rate = sample_rate
+        self.capacity = int(seconds * sample_rate)
+        self.data = np.zeros((n_channels + 1, self.capacity))
+        self.total = 0  # samples appended so far
+
+    def append(self, time_ms, block):
+        n = len(time_ms)
+        if n > self.capacity:
+            time_ms, block = time_ms[-self.capacity:], block[:, -self.capacity:]
+            self.total += n - self.capacity
+            n = self.capacity
+        pos = self.total % self.capacity
+        first = min(n, self.capacity - pos)
+        self.data[0, pos:pos + first] = time_ms[:first]
+        self.data[1:, pos:pos + first] = block[:, :first]
+        if first < n:
+            self.data[0, :n - first] = time_ms[first:]
+            self.data[1:, :n - first] = block[:, first:]
+        self.total += n
+
+    def extract(self, start, stop):
+        """Copy of samples start..stop-1 (absolute sample numbers); start is clipped to what is still held."""
+        start = max(start, self.total - self.capacity, 0)
+        idx = np.arange(start, stop) % self.capacity
+        return self.data[:, idx]
+
+class TriggeredCapture:
+    """Keep raw samples in a CaptureRing and write the window around each event to disk.
+
+    feed() takes every new raw block (the analyzer's sources call it as their tap);
+    check() takes each cycle's results. When a trigger fires, the capture waits until
+    post_s seconds more have arrived, then writes pre_s + post_s seconds as
+    <directory>/<stamp>_<ms>_<kind>_<phase>.npz (time_ms float64, samples float32) and a .json
+    sidecar describing the event. Triggers that fire while a capture is pending join it.
+    """
+
+    def __init__(self, directory, labels, sample_rate, detector, pre_s=PRE_TRIGGER, post_s=POST_TRIGGER,
+                 ring_s=RING_SECONDS, metrics=None):
+        if pre_s + post_s > ring_s:
+            raise ValueError("the capture ring must hold the pre- and post-trigger windows")
+        self.directory = directory
+        self.labels = labels
+        self.detector = detector
+        self.ring = CaptureRing(len(labels), sample_rate, ring_s)
+        self.pre = int(pre_s * sample_rate)
+        self.post = int(post_s * sample_rate)
+        self.metrics = metrics
+        self.pending = None
+        self.written = 0
+        self.bytes = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def feed(self, time_ms, block):
+        self.ring.append(time_ms, block)
+        if self.pending and self.ring.total >= self.pending['stop']:
+            self._write()
+
+    def check(self, time_ms, thd, rms, freq=None):
+        fired = self.detector.check(time_ms, thd, rms, freq)
+        if not fired:
+            return fired
+        if self.pending is None:
+            at = self.ring.total
+            self.pending = {'start': at - self.pre, 'trigger': at, 'stop': at + self.post, 'triggers': []}
+        self.pending['triggers'] += fired
+        return fired
+
+    def close(self):
+        """Write a pending capture with whatever post-trigger samples arrived."""
+        if self.pending and self.ring.total > self.pending['trigger']:
+            self.pending['stop'] = self.ring.total
+            self._write()
+
+    def _write(self):
+        event, self.pending = self.pending, None
+        start = time.perf_counter()
+        window = self.ring.extract(event['start'], event['stop'])
+        # The ring may have held less history than pre_s; describe what was copied out
+        copied = event['stop'] - window.shape[1]
+        first = event['triggers'][0]
+        now = time.time()
+        stamp = f"{time.strftime('%Y%m%d_%H%M%S', time.localtime(now))}_{int(now * 1000) % 1000:03d}"
+        name = f"{stamp}_{first.kind}_{first.phase}"
+        base = os.path.join(self.directory, name)
+        suffix = 1
+        while os.path.exists(base + '.npz'):
+            # Two captures in one millisecond (or a clock step back)
+            base = os.path.join(self.directory, f"{name}_{suffix}")
+            suffix += 1
+        np.savez(base + '.npz', time_ms=window[0], samples=window[1:].astype(np.float32))
+        meta = {
+            'triggers': [t._asdict() for t in event['triggers']],
+            'trigger_ms': first.time_ms,
+            'start_ms': float(window[0, 0]),
+            'end_ms': float(window[0, -1]),
+            'pre_trigger_s': max(event['trigger'] - copied, 0) / self.ring.sample_rate,
+            'post_trigger_s': (event['stop'] - max(event['trigger'], copied)) / self.ring.sample_rate,
+            'sample_rate': self.ring.sample_rate,
+            'columns': self.labels,
+            'written_unix': time.time(),
+        }
+        with open(base + '.json', 'w') as f:
+            json.dump(meta, f, indent=2)
+        self.written += 1
+        self.bytes += os.path.getsize(base + '.npz')
+        if self.metrics:
+            self.metrics.mark('capture', start)
+            self.metrics.count('captures')
+        print(f"Captured {first.kind} event on {first.phase} ({first.value:.2f} vs limit {first.limit:.2f}) "
+              f"-> {base}.npz", flush=True)
@@ -2,6 +2,11 @@ import numpy as np
 import csv
 import time
 import sys
+import argparse
+import signal
+from shm_ring import ShmRing, DEFAULT_RING_NAME
+from datalog import DatalogWriter, CompressedDatalogWriter, RESOLUTION
+from metrics import Metrics
 
 # Configuration
 SAMPLE_RATE = 1000
@@ -10,6 +15,15 @@ BASE_VOLTAGE = 240 * np.sqrt(2)
 HARMONICS = [3, 5, 7, 11, 13, 17, 19, 23, 25, 31, 35, 41, 43, 47]
 PHASE_SHIFT = 2 * np.pi / 3
 
+# Block synthesis
+HARMONIC_MAG_RANGE = (0.01, 0.15)  # fraction of BASE_VOLTAGE
+HARMONIC_PHASE_NOISE = 0.1         # radians
+DRIFT_RATE = 0.02                  # random-walk step per block, as a fraction of each range
+NOISE_STD = 0.5
+
+STAGES = ['synthesis', 'backpressure', 'publish', 'datalog', 'csv', 'report', 'slack', 'cycle']
+COUNTERS = ['cycles', 'overruns', 'stalls', 'forced_overwrites']
+
 def generate_voltage(t, phase_offset=0):
     signal = BASE_VOLTAGE * np.sin(2 * np.pi * FUNDAMENTAL_FREQ * t + phase_offset)
     for h in HARMONICS:
@@ -19,54 +33,306 @@ def generate_voltage(t, phase_offset=0):
     signal += np.random.normal(0, 0.5)
     return signal
 
-def init_csv(filename):
+def channel_names(n_channels):
+    if n_channels == 3:
+        return ['PhaseA(V)', 'PhaseB(V)', 'PhaseC(V)']
+    return [f'Ch{k}(V)' for k in range(n_channels)]
+
+class BlockSynthesizer:
+    """Synthesize (channels x samples) voltage blocks with one batched matrix product per block.
+
+    Channel k is phase k % 3 of a three-phase feeder. Harmonic magnitudes and phases
+    are held for the whole block and drift as a bounded random walk between blocks.
+    """
+
+    def __init__(self, n_channels=3, sample_rate=SAMPLE_RATE, block_size=None, seed=None,
+                 fundamental=FUNDAMENTAL_FREQ):
+        self.n_channels = n_channels
+        self.sample_rate = sample_rate
+        self.block_size = block_size or sample_rate
+        self.rng = np.random.default_rng(seed)
+        self.samples = 0
+
+        # Order 1 is the fundamental; it shares the basis with the harmonics
+        self.orders = np.array([1] + HARMONICS)
+        omega = 2 * np.pi * fundamental * self.orders
+        n = np.arange(self.block_size) / sample_rate
+        self.sin_basis = np.sin(np.outer(omega, n))
+        self.cos_basis = np.cos(np.outer(omega, n))
+
+        # Each block reuses the basis; the start-of-block phase is folded into the coefficients
+        self.block_advance = (omega * self.block_size / sample_rate) % (2 * np.pi)
+        self.block_phase = np.zeros(len(self.orders))
+
+        lo, hi = HARMONIC_MAG_RANGE
+        shape = (n_channels, len(HARMONICS))
+        self.mags = np.empty((n_channels, len(self.orders)))
+        self.mags[:, 0] = BASE_VOLTAGE
+        self.mags[:, 1:] = BASE_VOLTAGE * self.rng.uniform(lo, hi, shape)
+        self.phases = np.empty((n_channels, len(self.orders)))
+        self.phases[:, 0] = (np.arange(n_channels) % 3) * PHASE_SHIFT
+        self.phases[:, 1:] = self.rng.uniform(-HARMONIC_PHASE_NOISE, HARMONIC_PHASE_NOISE, shape)
+
+    def _drift(self):
+        lo, hi = BASE_VOLTAGE * np.array(HARMONIC_MAG_RANGE)
+        mags = self.mags[:, 1:]
+        mags += self.rng.normal(0, DRIFT_RATE * (hi - lo), mags.shape)
+        np.clip(mags, lo, hi, out=mags)
+
+        phases = self.phases[:, 1:]
+        phases += self.rng.normal(0, DRIFT_RATE * 2 * HARMONIC_PHASE_NOISE, phases.shape)
+        np.clip(phases, -HARMONIC_PHASE_NOISE, HARMONIC_PHASE_NOISE, out=phases)
+
+    def next_block(self):
+        """Return (time_ms, block) where block has shape (n_channels, block_size)."""
+        self._drift()
+        phase = self.phases + self.block_phase
+        block = (self.mags * np.cos(phase)) @ self.sin_basis
+        block += (self.mags * np.sin(phase)) @ self.cos_basis
+        block += self.rng.normal(0, NOISE_STD, block.shape)
+
+        time_ms = (self.samples + np.arange(self.block_size)) * (1000 / self.sample_rate)
+        self.samples += self.block_size
+        self.block_phase = (self.block_phase + self.block_advance) % (2 * np.pi)
+        return time_ms, block
+
+def init_csv(filename, columns):
     with open(filename, 'w') as f:
         writer = csv.writer(f)
-        writer.writerow(['Time(ms)', 'PhaseA(V)', 'PhaseB(V)', 'PhaseC(V)'])
-
-# Initialize CSV files
-init_csv('realtime_data.csv')
-init_csv('datalog.csv')
-
-t = 0
-cycle_count = 0
-print("Data generator started", flush=True)
-
-try:
-    while True:
-        start_time = time.time()
-        realtime_buffer = []
-        
-        # Generate 1 second of data (1000 samples)
-        for i in range(1000):
-            va = generate_voltage(t)
-            vb = generate_voltage(t, PHASE_SHIFT)
-            vc = generate_voltage(t, 2 * PHASE_SHIFT)
-            realtime_buffer.append([t * 1000, va, vb, vc])
-            t += 0.001
-            
-            # Print progress every 100 samples
-            if i % 100 == 0:
-                print(f"Generating samples... {i+100}/1000", flush=True)
-        
-        # Update realtime CSV
-        with open('realtime_data.csv', 'w') as f_rt:
-            writer = csv.writer(f_rt)
-            writer.writerow(['Time(ms)', 'PhaseA(V)', 'PhaseB(V)', 'PhaseC(V)'])
-            writer.writerows(realtime_buffer)
-        
-        # Append to datalog
-        with open('datalog.csv', 'a') as f_log:
-            writer = csv.writer(f_log)
-            writer.writerows(realtime_buffer)
-        
-        cycle_count += 1
-        print(f"Cycle {cycle_count}: Generated 1000 samples (1.00s)", flush=True)
-        
-        # Maintain timing
-        elapsed = time.time() - start_time
-        if elapsed < 1.0:
-            time.sleep(1.0 - elapsed)
-            
-except KeyboardInterrupt:
-    print("Data generator stopped", flush=True)
\ No newline at end of file
+        writer.writerow(['Time(ms)'] + columns)
+
+def write_csv(rows, columns):
+    # Update realtime CSV
+    with open('realtime_data.csv', 'w') as f_rt:
+        writer = csv.writer(f_rt)
+        writer.writerow(['Time(ms)'] + columns)
+        writer.writerows(rows)
+
+    # Append to datalog
+    with open('datalog.csv', 'a') as f_log:
+        writer = csv.writer(f_log)
+        writer.writerows(rows)
+
+def open_datalog(args, columns, sample_rate):
+    if args.no_datalog:
+        return None
+    max_bytes = args.datalog_max_mb * 2**20
+    if args.datalog_resolution:
+        return CompressedDatalogWriter(args.datalog, columns, sample_rate, args.datalog_resolution,
+                                       max_bytes=max_bytes, hourly=not args.no_hourly_rollover)
+    return DatalogWriter(args.datalog, columns, sample_rate, args.datalog_dtype,
+                         max_bytes=max_bytes, hourly=not args.no_hourly_rollover)
+
+def warn_aliasing(sample_rate):
+    aliased = [h for h in HARMONICS if h * FUNDAMENTAL_FREQ >= sample_rate / 2]
+    if aliased:
+        print(f"Note: at {sample_rate} Hz harmonics {aliased[0]}-{aliased[-1]} are above Nyquist and alias; "
+              f"use --mode block --sample-rate 12800 (or 10240) to keep all of them", flush=True)
+
+def open_metrics(args, **info):
+    metrics = Metrics('generator', None if args.no_metrics else args.metrics, args.metrics_interval,
+                      STAGES, COUNTERS)
+    metrics.info = dict(info, mode=args.mode)
+    return metrics
+
+def wait_for_readers(ring, timeout, metrics):
+    """Hold the next frame while it would overwrite one a registered analyzer still needs.
+
+    After `timeout` seconds the frame is published anyway (counted as a forced
+    overwrite), so a reader that died without releasing its slot cannot stall the feed.
+    """
+    if ring.headroom() > 0:
+        return
+    metrics.count('stalls')
+    start = metrics.now()
+    deadline = time.time() + timeout
+    while ring.headroom() <= 0:
+        if time.time() > deadline:
+            metrics.count('forced_overwrites')
+            break
+        time.sleep(0.001)
+    metrics.mark('backpressure', start)
+
+def end_cycle(args, metrics, start, period):
+    if metrics.end_cycle(start, period) and not args.verbose:
+        print(metrics.summary('cycle'), flush=True)
+
+def run_sample_mode(args):
+    columns = channel_names(3)
+    if args.csv:
+        init_csv('realtime_data.csv', columns)
+        init_csv('datalog.csv', columns)
+    ring = ShmRing.create(args.ring, 4, 1000, args.ring_frames, SAMPLE_RATE)
+    datalog = open_datalog(args, columns, SAMPLE_RATE)
+    metrics = open_metrics(args, channels=3, sample_rate=SAMPLE_RATE, block_size=1000)
+
+    t = 0
+    cycle_count = 0
+    print("Data generator started", flush=True)
+    warn_aliasing(SAMPLE_RATE)
+
+    try:
+        while True:
+            start_time = time.time()
+            start = mark = metrics.now()
+            realtime_buffer = []
+
+            # Generate 1 second of data (1000 samples)
+            for i in range(1000):
+                va = generate_voltage(t)
+                vb = generate_voltage(t, PHASE_SHIFT)
+                vc = generate_voltage(t, 2 * PHASE_SHIFT)
+                realtime_buffer.append([t * 1000, va, vb, vc])
+                t += 0.001
+
+                # Print progress every 100 samples
+                if args.verbose and i % 100 == 0:
+                    print(f"Generating samples... {i+100}/1000", flush=True)
+
+            frame = np.array(realtime_buffer).T
+            mark = metrics.mark('synthesis', mark)
+            wait_for_readers(ring, args.backpressure_timeout, metrics)
+            mark = metrics.now()
+            ring.publish(frame)
+            mark = metrics.mark('publish', mark)
+            if datalog:
+                datalog.append(frame[0], frame[1:])
+                mark = metrics.mark('datalog', mark)
+            if args.csv:
+                write_csv(realtime_buffer, columns)
+                mark = metrics.mark('csv', mark)
+
+            cycle_count += 1
+            if args.verbose:
+                print(f"Cycle {cycle_count}: Generated 1000 samples (1.00s)", flush=True)
+                metrics.mark('report', mark)
+            end_cycle(args, metrics, start, 1.0)
+
+            # Maintain timing
+            elapsed = time.time() - start_time
+            if elapsed < 1.0:
+                metrics.record('slack', 1.0 - elapsed)
+                time.sleep(1.0 - elapsed)
+
+    except KeyboardInterrupt:
+        print("Data generator stopped", flush=True)
+    finally:
+        ring.close()
+        if datalog:
+            datalog.close()
+        metrics.flush()
+
+def run_block_mode(args):
+    synth = BlockSynthesizer(args.channels, args.sample_rate, args.block_size, args.seed, args.fundamental_hz)
+    block_duration = synth.block_size / synth.sample_rate
+    columns = channel_names(args.channels)
+    if args.csv:
+        init_csv('realtime_data.csv', columns)
+        init_csv('datalog.csv', columns)
+    ring = ShmRing.create(args.ring, args.channels + 1, synth.block_size, args.ring_frames, synth.sample_rate)
+    datalog = open_datalog(args, columns, synth.sample_rate)
+    metrics = open_metrics(args, channels=args.channels, sample_rate=synth.sample_rate, block_size=synth.block_size)
+    frame = np.empty((args.channels + 1, synth.block_size))
+
+    cycle_count = 0
+    print(f"Data generator started (block mode, {args.channels} channels @ {args.sample_rate} Hz)", flush=True)
+    warn_aliasing(synth.sample_rate)
+
+    try:
+        while True:
+            start_time = time.time()
+            start = metrics.now()
+            time_ms, block = synth.next_block()
+            mark = metrics.mark('synthesis', start)
+            synth_time = mark - start
+
+            frame[0] = time_ms
+            frame[1:] = block
+            wait_for_readers(ring, args.backpressure_timeout, metrics)
+            mark = metrics.now()
+            ring.publish(frame)
+            mark = metrics.mark('publish', mark)
+            if datalog:
+                datalog.append(time_ms, block)
+                mark = metrics.mark('datalog', mark)
+            if args.csv:
+                write_csv(frame.T.tolist(), columns)
+                mark = metrics.mark('csv', mark)
+
+            cycle_count += 1
+            if args.verbose:
+                rate = block.size / synth_time if synth_time > 0 else float('inf')
+                print(f"Cycle {cycle_count}: Generated {synth.block_size} samples x {args.channels} channels "
+                      f"({block_duration:.2f}s) | synthesis {rate:,.0f} samples/s", flush=True)
+                metrics.mark('report', mark)
+            end_cycle(args, metrics, start, block_duration)
+
+            # Maintain timing
+            elapsed = time.time() - start_time
+            if not args.free_run and elapsed < block_duration:
+                metrics.record('slack', block_duration - elapsed)
+                time.sleep(block_duration - elapsed)
+
+    except KeyboardInterrupt:
+        print("Data generator stopped", flush=True)
+    finally:
+        ring.close()
+        if datalog:
+            datalog.close()
+        metrics.flush()
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Three-phase harmonic voltage generator")
+    parser.add_argument('--mode', choices=['sample', 'block'], default='sample',
+                        help="'sample' evaluates generate_voltage per sample; 'block' synthesizes whole blocks")
+    parser.add_argument('--channels', type=int, default=3,
+                        help="number of voltage channels in block mode (channel k is phase k %% 3)")
+    parser.add_argument('--sample-rate', type=int, default=SAMPLE_RATE)
+    parser.add_argument('--block-size', type=int, default=None,
+                        help="samples per block (default: one second of samples)")
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--fundamental-hz', type=float, default=FUNDAMENTAL_FREQ,
+                        help="fundamental frequency in block mode, e.g. 49.8 for an off-nominal grid")
+    parser.add_argument('--free-run', action='store_true',
+                        help="do not sleep to hold real-time cadence (soak testing)")
+    parser.add_argument('--ring', default=DEFAULT_RING_NAME,
+                        help="name of the shared-memory ring the analyzers attach to")
+    parser.add_argument('--ring-frames', type=int, default=None,
+                        help="number of blocks the shared-memory ring holds (default: 4 s of data, at least 16)")
+    parser.add_argument('--backpressure-timeout', type=float, default=30.0,
+                        help="longest wait (s) for an analyzer holding a reader slot before overwriting its frames")
+    parser.add_argument('--csv', action='store_true',
+                        help="also write realtime_data.csv and append to datalog.csv")
+    parser.add_argument('--datalog', default='datalog',
+                        help="directory of the binary datalog (see datalog.py)")
+    parser.add_argument('--datalog-resolution', type=float, default=RESOLUTION,
+                        help="volts per step in compressed datalog segments (0 = raw, memory-mappable floats)")
+    parser.add_argument('--datalog-dtype', choices=['float32', 'float64'], default='float32',
+                        help="sample type of raw segments")
+    parser.add_argument('--datalog-max-mb', type=int, default=256,
+                        help="roll over to a new segment at this size")
+    parser.add_argument('--no-hourly-rollover', action='store_true')
+    parser.add_argument('--no-datalog', action='store_true')
+    parser.add_argument('--verbose', action='store_true',
+                        help="print every cycle instead of a periodic status line")
+    parser.add_argument('--metrics', default='generator_metrics.json',
+                        help="stage timings and counters, rewritten every --metrics-interval seconds")
+    parser.add_argument('--metrics-interval', type=float, default=5.0)
+    parser.add_argument('--no-metrics', action='store_true', help="keep metrics in memory only")
+    args = parser.parse_args(argv)
+    if args.mode == 'sample' and (args.channels != 3 or args.sample_rate != SAMPLE_RATE
+                                  or args.fundamental_hz != FUNDAMENTAL_FREQ):
+        parser.error("--channels, --sample-rate and --fundamental-hz require --mode block")
+    if args.ring_frames is None:
+        block_size = args.block_size or args.sample_rate
+        args.ring_frames = max(16, -(-4 * args.sample_rate // block_size))
+    return args
+
+if __name__ == "__main__":
+    # Let the supervisor's terminate() run the same cleanup as Ctrl+C
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    args = parse_args()
+    if args.mode == 'block':
+        run_block_mode(args)
+    else:
+        run_sample_mode(args)
@@ -0,0 +1,426 @@
+import os
+import glob
+import json
+import time
+import argparse
+import numpy as np
+import wavecodec as wc
+
+# Defaults
+CHUNK_LEN = 1000                 # samples per chunk (one index entry)
+MAX_SEGMENT_BYTES = 256 * 2**20  # size-based rollover
+INDEX_DTYPE = np.dtype([('t0', '<f8'), ('n', '<i8')])
+WVC_INDEX_DTYPE = np.dtype([('t0', '<f8'), ('n', '<i8'), ('offset', '<i8')])
+RESOLUTION = 0.01        # V, for compressed segments
+TIME_STEPS = 1024        # Time(ms) quantization steps per sample period
+
+class DatalogWriter:
+    """Append (channels x samples) blocks to a chunked binary datalog directory.
+
+    Each segment is a preallocated <name>.bin holding a float64 Time(ms) column
+    followed by one column per channel, each `capacity` samples long, so any time
+    range of one channel is a contiguous slice of the file. <name>.idx lists the
+    start time and sample count of every chunk_len-sample chunk, and <name>.json
+    describes the layout. A segment rolls over when it reaches max_bytes or, with
+    hourly=True, when the wall-clock hour changes; a segment closed before it is full
+    is rewritten without its unused tail.
+    """
+
+    def __init__(self, directory, columns, sample_rate, dtype='float32', chunk_len=CHUNK_LEN,
+                 max_bytes=MAX_SEGMENT_BYTES, hourly=True):
+        self.directory = directory
+        self.columns = list(columns)
+        self.sample_rate = sample_rate
+        self.dtype = np.dtype(dtype)
+        self.chunk_len = chunk_len
+        self.hourly = hourly
+        chunk_bytes = chunk_len * (8 + len(self.columns) * self.dtype.itemsize)
+        self.capacity = max(1, max_bytes // chunk_bytes) * chunk_len
+        self.epoch_unix = None
+        self.segment = None
+        self.segment_count = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _open_segment(self):
+        self.segment_hour = time.strftime('%Y%m%d%H')
+        name = f"{time.strftime('%Y%m%d_%H%M%S')}_{self.segment_count:04d}"
+        self.segment_count += 1
+        base = os.path.join(self.directory, name)
+        n_ch = len(self.columns)
+        with open(base + '.bin', 'wb') as f:
+            f.truncate(self.capacity * (8 + n_ch * self.dtype.itemsize))
+        open(base + '.idx', 'wb').close()
+        meta = {
+            'columns': self.columns,
+            'dtype': self.dtype.str,
+            'sample_rate': self.sample_rate,
+            'chunk_len': self.chunk_len,
+            'epoch_unix': self.epoch_unix,
+        }
+        with open(base + '.json', 'w') as f:
+            json.dump(meta, f, indent=2)
+
+        self.segment = base
+        self.time_col = np.memmap(base + '.bin', dtype='<f8', mode='r+', shape=(self.capacity,))
+        self.data = np.memmap(base + '.bin', dtype=self.dtype, mode='r+', offset=self.capacity * 8,
+                              shape=(n_ch, self.capacity))
+        self.index = open(base + '.idx', 'ab')
+        self.pos = 0
+        self.chunk_start = 0
+
+    def _close_chunk(self):
+        n = self.pos - self.chunk_start
+        if n == 0:
+            return
+        record = np.array([(self.time_col[self.chunk_start], n)], dtype=INDEX_DTYPE)
+        self.index.write(record.tobytes())
+        self.index.flush()
+        self.chunk_start = self.pos
+
+    def _close_segment(self):
+        self._close_chunk()
+        self.index.close()
+        used = -(-self.pos // self.chunk_len) * self.chunk_len
+        if used < self.capacity:
+            # Columns are laid out by capacity, so shrinking means rewriting the file
+            tmp = self.segment + '.bin.tmp'
+            with open(tmp, 'wb') as f:
+                f.write(self.time_col[:used].tobytes())
+                f.write(self.data[:, :used].tobytes())
+            self.time_col = self.data = None
+            os.replace(tmp, self.segment + '.bin')
+        else:
+            self.time_col.flush()
+            self.data.flush()
+            self.time_col = self.data = None
+        self.segment = None
+
+    def append(self, time_ms, block):
+        """Append samples; time_ms has shape (n,), block has shape (channels, n)."""
+        if self.epoch_unix is None:
+            self.epoch_unix = time.time() - time_ms[-1] / 1000
+        if self.segment is not None and self.hourly and time.strftime('%Y%m%d%H') != self.segment_hour:
+            self._close_segment()
+
+        done = 0
+        while done < len(time_ms):
+            if self.segment is None:
+                self._open_segment()
+            n = min(len(time_ms) - done, self.chunk_start + self.chunk_len - self.pos)
+            self.time_col[self.pos:self.pos + n] = time_ms[done:done + n]
+            self.data[:, self.pos:self.pos + n] = block[:, done:done + n]
+            self.pos += n
+            done += n
+            if self.pos - self.chunk_start == self.chunk_len:
+                self._close_chunk()
+                if self.pos == self.capacity:
+                    self._close_segment()
+
+    def close(self):
+        if self.segment is not None:
+            self._close_segment()
+
+class CompressedDatalogWriter(DatalogWriter):
+    """DatalogWriter that stores every chunk wavecodec-encoded in <name>.wvc.
+
+    Voltages are quantized to `resolution` V and Time(ms) to 1/TIME_STEPS of the sample
+    period, which cuts a segment to roughly a quarter of its float32 size. The index also
+    records each chunk's byte offset; ranges are decoded chunk by chunk instead of being
+    memory-mapped.
+    max_bytes applies to the compressed size.
+    """
+
+    def __init__(self, directory, columns, sample_rate, resolution=RESOLUTION, chunk_len=CHUNK_LEN,
+                 max_bytes=MAX_SEGMENT_BYTES, hourly=True, level=wc.DEFAULT_LEVEL, verify=False):
+        super().__init__(directory, columns, sample_rate, 'float64', chunk_len, max_bytes, hourly)
+        self.resolution = [1000 / sample_rate / TIME_STEPS] + [resolution] * len(self.columns)
+        self.max_bytes = max_bytes
+        self.level = level
+        self.verify = verify
+        self.buffer = np.empty((len(self.columns) + 1, chunk_len))
+
+    def _open_segment(self):
+        self.segment_hour = time.strftime('%Y%m%d%H')
+        name = f"{time.strftime('%Y%m%d_%H%M%S')}_{self.segment_count:04d}"
+        self.segment_count += 1
+        base = os.path.join(self.directory, name)
+        meta = {
+            'columns': self.columns,
+            'format': 'wvc',
+            'resolution': self.resolution,
+            'sample_rate': self.sample_rate,
+            'chunk_len': self.chunk_len,
+            'epoch_unix': self.epoch_unix,
+        }
+        with open(base + '.json', 'w') as f:
+            json.dump(meta, f, indent=2)
+        self.segment = base
+        self.file = open(base + '.wvc', 'wb')
+        self.index = open(base + '.idx', 'ab')
+        self.offset = 0
+        self.fill = 0
+
+    def _close_chunk(self):
+        if self.fill == 0:
+            return
+        block = self.buffer[:, :self.fill]
+        encoded = wc.encode_chunk(block, self.resolution, level=self.level)
+        if self.verify:
+            wc.check_roundtrip(block, encoded, self.resolution)
+        self.file.write(encoded)
+        self.file.flush()
+        record = np.array([(block[0, 0], self.fill, self.offset)], dtype=WVC_INDEX_DTYPE)
+        self.index.write(record.tobytes())
+        self.index.flush()
+        self.offset += len(encoded)
+        self.fill = 0
+
+    def _close_segment(self):
+        self._close_chunk()
+        self.file.close()
+        self.index.close()
+        self.segment = None
+
+    def append(self, time_ms, block):
+        if self.epoch_unix is None:
+            self.epoch_unix = time.time() - time_ms[-1] / 1000
+        if self.segment is not None and self.hourly and time.strftime('%Y%m%d%H') != self.segment_hour:
+            self._close_segment()
+
+        done = 0
+        while done < len(time_ms):
+            if self.segment is None:
+                self._open_segment()
+            n = min(len(time_ms) - done, self.chunk_len - self.fill)
+            self.buffer[0, self.fill:self.fill + n] = time_ms[done:done + n]
+            self.buffer[1:, self.fill:self.fill + n] = block[:, done:done + n]
+            self.fill += n
+            done += n
+            if self.fill == self.chunk_len:
+                self._close_chunk()
+                if self.offset >= self.max_bytes:
+                    self._close_segment()
+
+class DatalogReader:
+    """Time-range queries over a datalog directory, returned as memmap views where possible.
+
+    Compressed (.wvc) segments are decoded on demand, only the chunks a range touches.
+    Every writer (one generator run) stamps its segments with its own epoch_unix, and a
+    restarted generator starts Time(ms) again from zero, so segments are grouped into
+    runs by epoch. read() takes Time(ms) of one run; read_wall() spans runs.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.refresh()
+
+    def refresh(self):
+        """Rescan the directory; picks up chunks and segments written since the last scan."""
+        self.segments = []
+        self.columns = []
+        for meta_path in sorted(glob.glob(os.path.join(self.directory, '*.json'))):
+            base = meta_path[:-len('.json')]
+            with open(meta_path) as f:
+                meta = json.load(f)
+            index_dtype = WVC_INDEX_DTYPE if meta.get('format') == 'wvc' else INDEX_DTYPE
+            index = np.fromfile(base + '.idx', dtype=np.uint8)
+            index = index[:len(index) // index_dtype.itemsize * index_dtype.itemsize].view(index_dtype)
+            if len(index) == 0:
+                continue
+            seg = dict(meta)
+            seg['epoch_unix'] = meta.get('epoch_unix') or 0.0
+            seg['index'] = index
+            seg['length'] = (len(index) - 1) * meta['chunk_len'] + int(index['n'][-1])
+            if meta.get('format') == 'wvc':
+                seg['path'] = base + '.wvc'
+                seg['end'] = index['t0'][-1] + (index['n'][-1] - 1) * 1000 / meta['sample_rate']
+                self.segments.append(seg)
+                self.columns = seg['columns']
+                continue
+            dtype = np.dtype(meta['dtype'])
+            n_ch = len(meta['columns'])
+            # Capacity comes from the file itself, so a segment rewritten on close maps correctly
+            with open(base + '.bin', 'rb') as f:
+                capacity = os.fstat(f.fileno()).st_size // (8 + n_ch * dtype.itemsize)
+                seg['time'] = np.memmap(f, dtype='<f8', mode='r', shape=(capacity,))
+                seg['data'] = np.memmap(f, dtype=dtype, mode='r', offset=capacity * 8, shape=(n_ch, capacity))
+            seg['end'] = seg['time'][seg['length'] - 1]
+            self.segments.append(seg)
+            self.columns = seg['columns']
+
+        # Runs in wall-clock order, each run's segments in Time(ms) order
+        self.segments.sort(key=lambda seg: (seg['epoch_unix'], seg['index']['t0'][0]))
+        self.runs = []
+        for seg in self.segments:
+            if not self.runs or seg['epoch_unix'] != self.runs[-1]['epoch_unix']:
+                self.runs.append({'epoch_unix': seg['epoch_unix'], 'segments': [],
+                                  'start': seg['index']['t0'][0]})
+            self.runs[-1]['segments'].append(seg)
+            self.runs[-1]['end'] = seg['end']
+        self.epoch_unix = self.runs[0]['epoch_unix'] if self.runs else 0.0
+
+    def _position(self, seg, t_ms):
+        # Index lookup picks the chunk, then a search inside that one chunk
+        chunk = max(np.searchsorted(seg['index']['t0'], t_ms, side='right') - 1, 0)
+        start = chunk * seg['chunk_len']
+        stop = start + int(seg['index']['n'][chunk])
+        return start + int(np.searchsorted(seg['time'][start:stop], t_ms))
+
+    def _decode(self, seg, start_ms, end_ms):
+        """Decode the chunks of a compressed segment overlapping the range; (time_ms, data)."""
+        index = seg['index']
+        first = max(np.searchsorted(index['t0'], start_ms, side='right') - 1, 0)
+        last = int(np.searchsorted(index['t0'], end_ms, side='left'))
+        if last <= first:
+            return np.empty(0), np.empty((len(seg['columns']), 0))
+        with open(seg['path'], 'rb') as f:
+            f.seek(index['offset'][first])
+            stop = index['offset'][last] if last < len(index) else None
+            buf = f.read() if stop is None else f.read(stop - index['offset'][first])
+        blocks, pos = [], 0
+        for _ in range(first, last):
+            block, pos = wc.decode_chunk(buf, seg['resolution'], pos)
+            blocks.append(block)
+        values = np.concatenate(blocks, axis=1)
+        a, b = np.searchsorted(values[0], [start_ms, end_ms])
+        return values[0, a:b], values[1:, a:b]
+
+    def read(self, start_ms, end_ms, channels=None, run=-1):
+        """Return (time_ms, data) for start_ms <= Time(ms) < end_ms of one run (default: the
+        latest).
+
+        channels may be column names or indexes. Both arrays are zero-copy views of
+        the segment file when the range falls inside one uncompressed segment.
+        """
+        if channels is None:
+            rows = slice(None)
+        else:
+            rows = [self.columns.index(c) if isinstance(c, str) else c for c in channels]
+            if len(rows) == 1:
+                rows = slice(rows[0], rows[0] + 1)
+
+        times, blocks = [], []
+        for seg in self.runs[run]['segments'] if self.runs else []:
+            seg_start = seg['index']['t0'][0]
+            if seg['end'] < start_ms or seg_start >= end_ms:
+                continue
+            if seg.get('format') == 'wvc':
+                t, data = self._decode(seg, start_ms, end_ms)
+                times.append(t)
+                blocks.append(data[rows])
+                continue
+            a = self._position(seg, start_ms)
+            b = min(self._position(seg, end_ms), seg['length'])
+            times.append(seg['time'][a:b])
+            blocks.append(seg['data'][rows, a:b])
+
+        if not times:
+            return np.empty(0), np.empty((0, 0))
+        if len(times) == 1:
+            return times[0], blocks[0]
+        return np.concatenate(times), np.concatenate(blocks, axis=1)
+
+    def read_wall(self, start_unix, end_unix, channels=None):
+        """Like read(), with wall-clock (Unix) bounds, across runs.
+
+        Each run is placed by its own epoch; the returned Time(ms) is relative to the first
+        run's epoch (self.epoch_unix), so it increases through restarts. Samples of a run
+        that start before the previous run's last one (a clock step) are dropped.
+        """
+        times, blocks = [], []
+        last = -np.inf
+        for run in range(len(self.runs)):
+            shift = (self.runs[run]['epoch_unix'] - self.epoch_unix) * 1000
+            t, data = self.read((start_unix - self.runs[run]['epoch_unix']) * 1000,
+                                (end_unix - self.runs[run]['epoch_unix']) * 1000, channels, run)
+            a = int(np.searchsorted(t, last - shift, side='right'))
+            if a == len(t):
+                continue
+            times.append(t[a:] + shift if shift else t[a:])
+            blocks.append(data[:, a:])
+            last = times[-1][-1]
+        if not times:
+            return np.empty(0), np.empty((0, 0))
+        if len(times) == 1:
+            return times[0], blocks[0]
+        return np.concatenate(times), np.concatenate(blocks, axis=1)
+
+    def wall_range(self):
+        """(first, last) sample time in Time(ms) relative to self.epoch_unix, over all runs."""
+        first, last = self.runs[0], self.runs[-1]
+        return (first['start'] + (first['epoch_unix'] - self.epoch_unix) * 1000,
+                last['end'] + (last['epoch_unix'] - self.epoch_unix) * 1000)
+
+def _last_time_ms(csv_path):
+    with open(csv_path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        f.seek(max(0, f.tell() - 4096))
+        lines = f.read().strip().splitlines()
+    return float(lines[-1].split(b',')[0])
+
+def csv_epoch(csv_path):
+    """Unix time of Time(ms) = 0 in a datalog.csv. The CSV has no wall-clock stamps, so
+    this assumes it ended when the file was last written."""
+    return os.path.getmtime(csv_path) - _last_time_ms(csv_path) / 1000
+
+def convert_csv(csv_path, directory, dtype='float32', chunk_len=CHUNK_LEN, rows_per_read=100_000, resolution=0):
+    """Stream an existing datalog.csv into the binary format; returns the number of samples.
+
+    A resolution (V) selects compressed segments, each chunk checked after encoding.
+    """
+    import pandas as pd  # only conversion needs it; writing and reading do not
+    columns = pd.read_csv(csv_path, nrows=0).columns.tolist()
+    first = pd.read_csv(csv_path, nrows=2)['Time(ms)'].values
+    sample_rate = round(1000 / (first[1] - first[0])) if len(first) > 1 else 1000
+    if resolution:
+        writer = CompressedDatalogWriter(directory, columns[1:], sample_rate, resolution, chunk_len,
+                                         hourly=False, verify=True)
+    else:
+        writer = DatalogWriter(directory, columns[1:], sample_rate, dtype, chunk_len, hourly=False)
+    writer.epoch_unix = csv_epoch(csv_path)
+
+    total = 0
+    for df in pd.read_csv(csv_path, chunksize=rows_per_read):
+        values = df.to_numpy(dtype=np.float64)
+        writer.append(values[:, 0], values[:, 1:].T)
+        total += len(values)
+    writer.close()
+    return total
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Binary datalog tools")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    conv = sub.add_parser('convert', help="convert datalog.csv to the binary format")
+    conv.add_argument('csv')
+    conv.add_argument('directory')
+    conv.add_argument('--dtype', choices=['float32', 'float64'], default='float32')
+    conv.add_argument('--chunk-len', type=int, default=CHUNK_LEN)
+    conv.add_argument('--resolution', type=float, default=0,
+                      help="quantize to this many volts in compressed segments (0 = raw floats)")
+
+    rd = sub.add_parser('read', help="summarize a time range")
+    rd.add_argument('directory')
+    rd.add_argument('--start-ms', type=float, required=True)
+    rd.add_argument('--end-ms', type=float, required=True)
+    rd.add_argument('--channel', action='append', help="column name, e.g. 'PhaseB(V)'")
+    rd.add_argument('--run', type=int, default=-1,
+                    help="generator run whose Time(ms) the range is in, oldest first (default: the latest)")
+
+    args = parser.parse_args(argv)
+    if args.command == 'convert':
+        start = time.time()
+        n = convert_csv(args.csv, args.directory, args.dtype, args.chunk_len, resolution=args.resolution)
+        print(f"Converted {n} samples to {args.directory} in {time.time() - start:.2f}s", flush=True)
+    else:
+        reader = DatalogReader(args.directory)
+        t, data = reader.read(args.start_ms, args.end_ms, args.channel, args.run)
+        names = args.channel or reader.columns
+        print(f"{len(t)} samples", flush=True)
+        for name, row in zip(names, data):
+            if len(row):
+                rms = np.sqrt(np.mean(np.square(row, dtype=np.float64)))
+                print(f"  {name}: min {row.min():.2f} V | max {row.max():.2f} V | RMS {rms:.2f} V", flush=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+import numpy as np
+from functools import lru_cache
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy.signal import firwin, kaiserord
+
+STOPBAND_DB = 80
+RATE_MARGIN = 1.25  # output rate >= 2 * RATE_MARGIN * highest analyzed frequency
+
+def decimation_factor(sample_rate, max_freq, frame_len=None):
+    """Largest q that keeps sample_rate / q at least 2 * RATE_MARGIN * max_freq.
+
+    q also divides the sample rate and the frame length, so every frame decimates to a
+    whole number of samples and a 1 s window stays a whole number of samples.
+    """
+    q = int(sample_rate // (2 * RATE_MARGIN * max_freq))
+    while q > 1 and (sample_rate % q or (frame_len and frame_len % q)):
+        q -= 1
+    return max(q, 1)
+
+@lru_cache(maxsize=8)
+def design_filter(sample_rate, q, max_freq):
+    """Linear-phase Kaiser FIR, flat up to max_freq.
+
+    Only energy between out_rate - max_freq and out_rate + max_freq folds back onto
+    the analyzed band, so the stopband starts at out_rate - max_freq; what lies between
+    the output Nyquist and that edge aliases above max_freq and is never read. The tap
+    count is rounded up to a multiple of q.
+    """
+    out_rate = sample_rate / q
+    stop = out_rate - max_freq
+    if stop <= max_freq:
+        raise ValueError(f"{out_rate:g} Hz is too low to analyze up to {max_freq:g} Hz")
+    numtaps, beta = kaiserord(STOPBAND_DB, (stop - max_freq) / (sample_rate / 2))
+    numtaps = -(-numtaps // q) * q
+    taps = firwin(numtaps, (max_freq + stop) / 2, window=('kaiser', beta), fs=sample_rate)
+    taps.flags.writeable = False
+    return taps
+
+class PolyphaseDecimator:
+    """Streaming anti-alias filter and decimation by q of (channels x samples) blocks.
+
+    Only the kept outputs are computed: output m is the dot product of the taps with
+    the len(taps) input samples ending at input m * q, read from a strided view, so the
+    filter runs at the output rate. The last len(taps) - 1 inputs carry over between
+    blocks; block lengths must be multiples of q.
+    """
+
+    def __init__(self, q, taps, n_channels):
+        self.q = q
+        self.reversed_taps = np.ascontiguousarray(taps[::-1])
+        self.history = np.zeros((n_channels, len(taps) - 1))
+        self.primed = False
+
+    @property
+    def delay(self):
+        """Group delay in input samples."""
+        return (len(self.reversed_taps) - 1) / 2
+
+    def reset(self):
+        """Forget the history, e.g. after a gap in the input."""
+        self.primed = False
+
+    def process(self, block):
+        """Decimated (channels x len(block) / q) output for the next block."""
+        if block.shape[-1] % self.q:
+            raise ValueError(f"block length {block.shape[-1]} is not a multiple of {self.q}")
+        if not self.primed:
+            # Hold the first sample instead of starting from zeros, which would ring for len(taps) samples
+            self.history[:] = block[:, :1]
+            self.primed = True
+        x = np.concatenate((self.history, block), axis=-1)
+        windows = sliding_window_view(x, len(self.reversed_taps), axis=-1)[:, ::self.q]
+        out = windows @ self.reversed_taps
+        self.history[:] = x[:, -self.history.shape[-1]:]
+        return out
@@ -0,0 +1,51 @@
+import numpy as np
+from functools import lru_cache
+from scipy.fft import rfft
+from scipy.signal import get_window
+
+FUNDAMENTAL_FREQ = 50
+RESPONSE_POINTS = 51  # scalloping table over 0..0.5 bin, linearly interpolated
+
+# The fundamental is located on a Hann-windowed spectrum. The Hann main lobe spans four
+# bins, so a tone at k + d (0 <= d <= 0.5) puts |X[k+1]| / |X[k]| = (1 + d) / (2 - d);
+# inverting that gives d from the peak bin and its larger neighbour (Grandke's
+# interpolation). Hann sidelobes fall off as 1/k^3, so harmonics ten bins or more away
+# (a 10-cycle window) bias the estimate by well under 0.01 Hz.
+
+@lru_cache(maxsize=32)
+def hann(n):
+    w = get_window('hann', n)
+    w.flags.writeable = False
+    return w
+
+def interpolate_peak(magnitude, lo, hi):
+    """Fractional bin of the largest peak within bins [lo, hi) of Hann-windowed spectra (..., bins)."""
+    flat = magnitude.reshape(-1, magnitude.shape[-1])
+    lo = max(lo, 1)
+    k = lo + np.argmax(flat[:, lo:hi], axis=-1)
+    rows = np.arange(len(flat))
+    left, centre, right = flat[rows, k - 1], flat[rows, k], flat[rows, k + 1]
+    # alpha = 1/2 puts a silent channel on the peak bin
+    alpha = np.divide(np.maximum(left, right), centre, out=np.full(len(flat), 0.5), where=centre > 0)
+    delta = np.where(right > left, 1, -1) * (2 * alpha - 1) / (alpha + 1)
+    return (k + delta).reshape(magnitude.shape[:-1])
+
+def estimate_frequency(block, sample_rate, nominal=FUNDAMENTAL_FREQ):
+    """Fundamental frequency (Hz) of every row of a (channels x N) block, searched below 2 * nominal."""
+    block = np.atleast_2d(block)
+    n = block.shape[-1]
+    magnitude = np.abs(rfft(block * hann(n), axis=-1))
+    return interpolate_peak(magnitude, 1, max(int(round(2 * nominal * n / sample_rate)), 2)) * sample_rate / n
+
+@lru_cache(maxsize=32)
+def response_table(window, n):
+    """|W(d)| / |W(0)| of an n-point window for offsets d = 0..0.5 bin (window None is rectangular)."""
+    w = np.ones(n) if window is None else get_window(window, n)
+    d = np.linspace(0, 0.5, RESPONSE_POINTS)
+    table = np.abs(np.exp(-2j * np.pi * np.outer(d, np.arange(n)) / n) @ w) / w.sum()
+    table.flags.writeable = False
+    return table
+
+def scalloping(window, n, offsets):
+    """Gain of a tone `offsets` bins (|offsets| <= 0.5) from the bin centre; divide magnitudes by it."""
+    return np.interp(np.abs(offsets), np.linspace(0, 0.5, RESPONSE_POINTS), response_table(window, n))
@@ -1,106 +1,702 @@
 import numpy as np
 import pandas as pd
 import time
-import matplotlib.pyplot as plt
+import argparse
+import signal
+import threading
+from collections import namedtuple
+from functools import lru_cache
 from scipy.fft import rfft, rfftfreq
+from scipy.signal import get_window
+from shm_ring import ShmRing, DEFAULT_RING_NAME
+from sliding_dft import SlidingHarmonicBank
+from aggregation import TenCycleStage, record_to_json
+from metrics import Metrics, NULL_METRICS
+from decimation import PolyphaseDecimator, decimation_factor, design_filter
+from frequency import hann, interpolate_peak, scalloping
+import capture as cap
+from results_store import ResultsStore, WallClock
 
 SAMPLE_RATE = 1000
+FUNDAMENTAL_FREQ = 50
+WINDOW = 'hann'
+WINDOW_MS = 1000
+MAX_HARMONIC = 49
+# Highest frequency the analysis needs: the 50th harmonic, the top of the IEC 61000-4-7 range
+ANALYSIS_MAX_FREQ = 50 * FUNDAMENTAL_FREQ
+
+STAGES = ['acquire', 'decimate', 'fft', 'frequency', 'harmonics', 'thd', 'slide', 'aggregate', 'capture', 'store', 'report',
+          'plot', 'slack', 'cycle']
+COUNTERS = ['cycles', 'overruns', 'dropped_frames', 'dropped_windows', 'events', 'captures']
+
+BinPlan = namedtuple('BinPlan', ['xf', 'window', 'window_gain', 'orders', 'search_bins', 'estimate_window'])
+Analysis = namedtuple('Analysis', ['fundamental_bin', 'fundamental_freq', 'fundamental_mag', 'thd', 'rms', 'peak',
+                                   'harmonic_orders', 'harmonic_bins', 'harmonic_mags', 'harmonic_freqs',
+                                   'xf', 'magnitude'])
+
+def phase_labels(n_channels):
+    return ['A', 'B', 'C'] if n_channels == 3 else [f'Ch{k}' for k in range(n_channels)]
 
 def calculate_thd(fft_magnitude, fundamental_bin, harmonic_bins):
-    fundamental_mag = fft_magnitude[fundamental_bin]
-    harmonic_power = sum(fft_magnitude[h]**2 for h in harmonic_bins)
-    return 100 * np.sqrt(harmonic_power) / fundamental_mag
+    fft_magnitude = np.asarray(fft_magnitude)
+    fundamental_mag = np.take_along_axis(fft_magnitude, np.asarray(fundamental_bin)[..., None], -1)[..., 0]
+    harmonic_mags = np.take_along_axis(fft_magnitude, np.asarray(harmonic_bins), -1)
+    return thd_from_harmonics(harmonic_mags, fundamental_mag)
 
-print("Harmonic analyzer started", flush=True)
-plt.ion()
-fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(12, 8))
+def thd_from_harmonics(harmonic_mags, fundamental_mag):
+    return 100 * np.sqrt(np.einsum('...h,...h->...', harmonic_mags, harmonic_mags)) / fundamental_mag
 
-cycle = 0
-try:
-    while True:
-        start_time = time.time()
-        cycle += 1
-        
+@lru_cache(maxsize=32)
+def bin_plan(n, sample_rate, fundamental=FUNDAMENTAL_FREQ, window=WINDOW):
+    """Everything about the spectrum that depends only on (N, sample rate, fundamental, window)."""
+    xf = rfftfreq(n, 1/sample_rate)
+    if window is None:
+        w, gain = None, 1.0
+    else:
+        w = get_window(window, n)
+        gain = w.mean()
+    orders = np.arange(2, MAX_HARMONIC + 1)
+    # Fundamental search band: up to twice the nominal fundamental (bins [1, 100) at 1 kHz / 1 s)
+    search_bins = max(int(round(2 * fundamental * n / sample_rate)), 2)
+    for a in (xf, w, orders):
+        if a is not None:
+            a.flags.writeable = False
+    # The fundamental is always estimated on a Hann spectrum; other windows need a second FFT
+    return BinPlan(xf, w, gain, orders, search_bins, None if window == 'hann' else hann(n))
+
+def analyze_window(block, sample_rate=SAMPLE_RATE, fundamental=FUNDAMENTAL_FREQ, window=WINDOW,
+                   metrics=NULL_METRICS):
+    """Analyze a (phases x N) block with one batched FFT.
+
+    The fundamental frequency is interpolated between bins (see frequency.py), and
+    harmonic h is read from the bin nearest h times that frequency, corrected for the
+    window's scalloping loss; so off-nominal frequencies and short (10-cycle) windows
+    keep their THD. Harmonic tables cover orders 2..MAX_HARMONIC; orders whose bin is
+    at or above Nyquist have bin -1, magnitude 0 and frequency NaN. The fft,
+    frequency, harmonics and thd stages are timed into metrics.
+    """
+    block = np.atleast_2d(block)
+    n = block.shape[-1]
+    plan = bin_plan(n, sample_rate, fundamental, window)
+
+    # Perform FFT
+    t = metrics.now()
+    x = block if plan.window is None else block * plan.window
+    magnitude = np.abs(rfft(x, axis=-1)) * (2 / (n * plan.window_gain))
+    t = metrics.mark('fft', t)
+
+    # Estimate the fundamental between bins
+    hann_magnitude = magnitude if plan.estimate_window is None else \
+        np.abs(rfft(block * plan.estimate_window, axis=-1))
+    position = interpolate_peak(hann_magnitude, 1, plan.search_bins)
+    fundamental_bin = np.rint(position).astype(np.int64)
+    fundamental_mag = np.take_along_axis(magnitude, fundamental_bin[:, None], -1)[:, 0] / \
+        scalloping(window, n, position - fundamental_bin)
+    t = metrics.mark('frequency', t)
+
+    # Harmonic h of a fundamental at bin position p sits at h*p; the Nyquist bin is left
+    # out, as its magnitude depends on the phase
+    positions = np.outer(position, plan.orders)
+    harmonic_bins = np.rint(positions).astype(np.int64)
+    valid = harmonic_bins < len(plan.xf) - 1
+    harmonic_bins = np.where(valid, harmonic_bins, -1)
+    lookup = np.take_along_axis(magnitude, np.where(valid, harmonic_bins, 0), -1)
+    harmonic_mags = np.where(valid, lookup / scalloping(window, n, positions - harmonic_bins), 0.0)
+    harmonic_freqs = np.where(valid, positions * plan.xf[1], np.nan)
+    t = metrics.mark('harmonics', t)
+
+    # Calculate THD
+    thd = thd_from_harmonics(harmonic_mags, fundamental_mag)
+    rms = np.sqrt(np.mean(np.square(block, dtype=np.float64), axis=-1))
+    peak = np.max(np.abs(block), axis=-1)
+    metrics.mark('thd', t)
+
+    return Analysis(fundamental_bin, position * plan.xf[1], fundamental_mag, thd, rms, peak,
+                    plan.orders, harmonic_bins, harmonic_mags, harmonic_freqs, plan.xf, magnitude)
+
+class CsvSource:
+    """Read the latest window from realtime_data.csv (written by data_generator.py --csv)."""
+
+    sample_rate = SAMPLE_RATE
+    n_channels = 3
+    tap = None  # called with (time_ms, block) for every sample not seen before
+
+    def __init__(self, window_ms=WINDOW_MS):
+        self.window_len = int(round(window_ms * self.sample_rate / 1000))
+        self.last_ms = -np.inf
+        self.fresh = 0
+        self.skipped = 0
+        self.waited = 0.0
+        self.stop = threading.Event()
+
+    def read(self):
+        """Return (time_ms, phases, token) or None if no complete window is available."""
+        self.waited = 0.0
         try:
             df = pd.read_csv('realtime_data.csv')
         except Exception as e:
             print(f"Error reading data: {e}", flush=True)
             time.sleep(0.5)
-            continue
-            
-        if len(df) < 1000:
+            self.waited = 0.5
+            return None
+
+        if len(df) < self.window_len:
             print("Waiting for more data...", flush=True)
             time.sleep(0.1)
+            self.waited = 0.1
+            return None
+
+        time_ms = df['Time(ms)'].values
+        self.fresh = int(np.count_nonzero(time_ms > self.last_ms))
+        self.last_ms = time_ms[-1]
+        phases = df.iloc[:, 1:].values.T
+        if self.tap and self.fresh:
+            self.tap(time_ms[-self.fresh:], phases[:, -self.fresh:])
+        return time_ms[-self.window_len:], phases[:, -self.window_len:], None
+
+    def is_intact(self, token):
+        return True
+
+class RingSource:
+    """Zero-copy views of the latest window_ms window in the generator's shared-memory ring.
+
+    With a reader slot the source registers its position in the ring, so the generator
+    waits for it instead of overwriting frames it has not analyzed, and read() hands out
+    every frame in order rather than jumping to the newest one.
+    """
+
+    tap = None  # called with (time_ms, block) views of every new frame
+
+    def __init__(self, name, slot=None, window_ms=WINDOW_MS):
+        self.ring = None
+        while self.ring is None:
+            try:
+                self.ring = ShmRing.attach(name)
+            except (FileNotFoundError, ValueError):
+                print("Waiting for data generator...", flush=True)
+                time.sleep(1.0)
+        self.sample_rate = self.ring.sample_rate
+        self.frame_len = self.ring.frame_len
+        self.n_channels = self.ring.n_rows - 1
+        self.window_len = int(round(window_ms * self.sample_rate / 1000))
+        self.window_frames = -(-self.window_len // self.ring.frame_len)
+        self.slot = slot
+        if slot is None:
+            self.last_seq = self.ring.sequence
+        else:
+            # Resumes where a previous reader of this slot stopped, if it never released it
+            self.last_seq = self.ring.claim(slot, self.ring.sequence - self.window_frames) + self.window_frames
+        self.fresh = 0
+        self.skipped = 0
+        self.waited = 0.0
+        self.stop = threading.Event()
+
+    def read(self):
+        """Block until a new frame arrives; return (time_ms, phases, first_seq) views, or None if stopped.
+
+        waited is the time spent idle for the frame; skipped counts frames that arrived
+        since the previous read and will never be analyzed on their own.
+        """
+        if self.slot is not None:
+            return self._read_next()
+        start = time.perf_counter()
+        while self.ring.sequence == self.last_seq:
+            if self.stop.wait(0.005):
+                self.waited = time.perf_counter() - start
+                return None
+        self.waited = time.perf_counter() - start
+        seq = self.ring.sequence
+        self.fresh = min((seq - self.last_seq) * self.ring.frame_len, self.window_len)
+        self.skipped = seq - self.last_seq - 1 if self.last_seq else 0
+        self.last_seq = seq
+
+        view, first = self.ring.window(self.window_frames, self.last_seq)
+        if view is None:
+            print("Waiting for more data...", flush=True)
+            return None
+        view = view[:, -self.window_len:]
+        if self.tap:
+            self.tap(view[0, -self.fresh:], view[1:, -self.fresh:])
+        return view[0], view[1:], first
+
+    def _read_next(self):
+        window = self.read_hop(self.ring.frame_len)
+        if window is None:
+            return None
+        time_ms, span, first, contiguous, _ = window
+        self.fresh = self.ring.frame_len if contiguous else self.window_len
+        return time_ms[-self.window_len:], span[:, -self.window_len:], first
+
+    def read_hop(self, hop):
+        """Wait for the next `hop` samples; return (time_ms, phases, first_seq, contiguous, backlog) or None.
+
+        Hops are handed out in order, so a consumer that stalls catches up instead of
+        skipping windows. The views span the previous window plus the new hop:
+        [..., :hop] is leaving the window and [..., -hop:] is entering it. contiguous is
+        False when the consumer fell so far behind that the ring overwrote the frames it
+        needed; it then resumes at the newest window and has to re-anchor. backlog is the
+        number of frames already waiting behind this hop.
+        """
+        hop_frames = hop // self.ring.frame_len
+        span_frames = self.window_frames + hop_frames
+        if self.slot is not None:
+            # The previous window is done with; the next one starts window_frames back
+            self.ring.advance(self.slot, self.last_seq - self.window_frames)
+        end = self.last_seq + hop_frames
+        start = time.perf_counter()
+        while self.ring.sequence < end:
+            if self.stop.wait(0.002):
+                self.waited = time.perf_counter() - start
+                return None
+        self.waited = time.perf_counter() - start
+        latest = self.ring.sequence
+        contiguous = latest - (end - span_frames) <= self.ring.capacity
+        self.skipped = 0
+        if not contiguous:
+            self.skipped = latest - end
+            end = latest
+        self.last_seq = end
+
+        view, first = self.ring.window(span_frames, end)
+        if view is None:
+            return None
+        view = view[:, -(self.window_len + hop):]
+        if self.tap:
+            self.tap(view[0, -hop:], view[1:, -hop:])
+        return view[0], view[1:], first, contiguous, latest - end
+
+    def is_intact(self, first_seq):
+        return self.ring.is_intact(first_seq)
+
+    def close(self):
+        if self.slot is not None:
+            self.ring.release(self.slot)
+        self.ring.close()
+
+class DecimatingSource:
+    """A RingSource seen at sample_rate / q.
+
+    Every ring frame is taken in order, anti-alias filtered and decimated into a private
+    buffer holding the latest window plus up to one window of hop, so read() and
+    read_hop() hand out copies at the lower rate and is_intact() is always true. A gap
+    in the ring (frames overwritten before they were read) restarts the filter.
+    """
+
+    def __init__(self, source, q, max_freq=ANALYSIS_MAX_FREQ, metrics=NULL_METRICS):
+        if source.frame_len % q or source.sample_rate % q or source.window_len % q:
+            raise ValueError(f"decimation by {q} needs a frame length, sample rate and window divisible by {q}")
+        self.source = source
+        self.ring = source.ring
+        self.q = q
+        self.metrics = metrics
+        self.sample_rate = source.sample_rate // q
+        self.frame_len = source.frame_len // q
+        self.window_len = source.window_len // q
+        self.n_channels = source.n_channels
+        self.taps = design_filter(source.sample_rate, q, max_freq)
+        self.decimator = PolyphaseDecimator(q, self.taps, self.n_channels)
+        self.buffer = np.zeros((self.n_channels + 1, 2 * self.window_len))
+        self.filled = 0
+        self.fresh = 0
+        self.skipped = 0
+        self.waited = 0.0
+        self.stop = source.stop
+
+    def _pull(self):
+        """Decimate the next ring frame into the buffer; returns (contiguous, backlog) or None if stopped."""
+        window = self.source.read_hop(self.source.frame_len)
+        self.waited += self.source.waited
+        if window is None:
+            return None
+        time_ms, span, first, contiguous, backlog = window
+        self.skipped += self.source.skipped
+        start = self.metrics.now()
+        if not contiguous:
+            self.decimator.reset()
+            self.filled = 0
+        n = self.frame_len
+        frame = span[:, -self.source.frame_len:]
+        out = self.decimator.process(frame)
+        frame_ms = time_ms[-self.source.frame_len::self.q]
+        if not self.source.is_intact(first):
+            # Overwritten while being filtered; the output cannot be trusted
+            self.decimator.reset()
+            self.filled = 0
+            self.metrics.count('dropped_windows')
+            contiguous = False
+        else:
+            self.buffer[:, :-n] = self.buffer[:, n:]
+            self.buffer[0, -n:] = frame_ms
+            self.buffer[1:, -n:] = out
+            self.filled = min(self.filled + n, self.buffer.shape[-1])
+        self.metrics.mark('decimate', start)
+        return contiguous, backlog
+
+    def read(self):
+        """Next frame in order; (time_ms, phases, None) once a full window is buffered, else None."""
+        self.waited = 0.0
+        self.skipped = 0
+        pulled = self._pull()
+        if pulled is None or self.filled < self.window_len:
+            return None
+        self.fresh = self.frame_len if pulled[0] else self.window_len
+        window = self.buffer[:, -self.window_len:]
+        return window[0], window[1:], None
+
+    def read_hop(self, hop):
+        """RingSource.read_hop() at the decimated rate; hop is in output samples."""
+        self.waited = 0.0
+        self.skipped = 0
+        contiguous = True
+        pulled = 0
+        while pulled < hop or self.filled < self.window_len + hop:
+            result = self._pull()
+            if result is None:
+                return None
+            if not result[0]:
+                contiguous = False
+            pulled += self.frame_len
+            backlog = result[1]
+        span = self.buffer[:, -(self.window_len + hop):]
+        return span[0], span[1:], None, contiguous, backlog
+
+    def is_intact(self, token):
+        return True
+
+    def close(self):
+        self.source.close()
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Real-time harmonic analyzer")
+    parser.add_argument('--source', choices=['shm', 'csv'], default='shm',
+                        help="read from the shared-memory ring or poll realtime_data.csv")
+    parser.add_argument('--ring', default=DEFAULT_RING_NAME)
+    parser.add_argument('--decimate', default='auto',
+                        help="decimation factor before analysis; 'auto' picks the largest that still "
+                             f"covers the 50th harmonic ({ANALYSIS_MAX_FREQ} Hz), 1 disables it")
+    parser.add_argument('--reader-slot', type=int, default=None,
+                        help="claim this reader slot in the ring: the generator holds off instead of "
+                             "overwriting unread frames, and every frame is analyzed in order")
+    parser.add_argument('--window-ms', type=float, default=WINDOW_MS,
+                        help="analysis window; 200 is the IEC 61000-4-7 10-cycle window, a 5x smaller FFT")
+    parser.add_argument('--hop-ms', type=float, default=None,
+                        help="slide the window by this much and update harmonics incrementally "
+                             "(needs --source shm and a generator --block-size that divides the hop)")
+    parser.add_argument('--aggregate', action='store_true',
+                        help="aggregate 10-cycle harmonic groups to 150-cycle (3 s) and 10-minute values")
+    parser.add_argument('--aggregate-log', default=None,
+                        help="append aggregated records to this NDJSON file (implies --aggregate)")
+    parser.add_argument('--results', default=None, metavar='DIR',
+                        help="append every cycle's results to this store, with 1 min / 1 h / 1 d rollups "
+                             "(see results_store.py)")
+    parser.add_argument('--headless', action='store_true',
+                        help="no plots; matplotlib is not imported")
+    parser.add_argument('--plot-fps', type=float, default=5,
+                        help="plot refresh rate, independent of the analysis rate")
+    parser.add_argument('--capture', metavar='DIR', default=None,
+                        help="write the raw waveform around THD / sag / swell / frequency events to DIR "
+                             "instead of needing a full datalog")
+    parser.add_argument('--capture-pre', type=float, default=cap.PRE_TRIGGER, help="seconds kept before a trigger")
+    parser.add_argument('--capture-post', type=float, default=cap.POST_TRIGGER, help="seconds recorded after it")
+    parser.add_argument('--capture-ring-s', type=float, default=cap.RING_SECONDS,
+                        help="seconds of raw samples held in memory")
+    parser.add_argument('--trigger-thd', type=float, default=cap.THD_LIMIT, help="THD limit (%%)")
+    parser.add_argument('--trigger-sag', type=float, default=cap.SAG_LEVEL, help="sag below this fraction of --nominal-v")
+    parser.add_argument('--trigger-swell', type=float, default=cap.SWELL_LEVEL,
+                        help="swell above this fraction of --nominal-v")
+    parser.add_argument('--trigger-freq', type=float, default=cap.FREQ_DEVIATION,
+                        help="fundamental deviation from --nominal-hz (Hz)")
+    parser.add_argument('--nominal-v', type=float, default=cap.NOMINAL_VOLTAGE, help="nominal RMS voltage")
+    parser.add_argument('--nominal-hz', type=float, default=cap.NOMINAL_FREQ)
+    parser.add_argument('--verbose', action='store_true',
+                        help="print the full per-cycle report instead of a periodic status line")
+    parser.add_argument('--metrics', default='analyzer_metrics.json',
+                        help="stage timings and counters, rewritten every --metrics-interval seconds")
+    parser.add_argument('--metrics-interval', type=float, default=5.0)
+    parser.add_argument('--no-metrics', action='store_true', help="keep metrics in memory only")
+    args = parser.parse_args(argv)
+    args.aggregate = args.aggregate or args.aggregate_log is not None
+    if args.hop_ms is not None and args.source != 'shm':
+        parser.error("--hop-ms requires --source shm")
+    return args
+
+def report_aggregates(records, labels, log):
+    for record in records:
+        thd = " | ".join(f"{label}: {v:.2f}%" for label, v in zip(labels, record.thd))
+        print(f"[IEC {record.level}] {record.start_ms / 1000:.1f}-{record.end_ms / 1000:.1f}s THD {thd}", flush=True)
+        if log:
+            log.write(record_to_json(record, labels) + "\n")
+            log.flush()
+
+def print_report(cycle, result, labels):
+    print("\n" + "="*50, flush=True)
+    print(f"ANALYSIS CYCLE {cycle}", flush=True)
+    for p, label in enumerate(labels):
+        print(f"Phase {label}: Fundamental {result.fundamental_freq[p]:.2f} Hz | "
+              f"Magnitude: {result.fundamental_mag[p]:.2f} V | THD: {result.thd[p]:.2f}% | "
+              f"RMS Voltage: {result.rms[p]:.2f} V", flush=True)
+    print("-"*50, flush=True)
+    print("Harmonics (" + " | ".join(labels) + "):", flush=True)
+    shown = np.flatnonzero(result.harmonic_bins[0] >= 0)[:10]
+    for i in shown:
+        mags = " | ".join(f"{m:.2f}" for m in result.harmonic_mags[:, i])
+        print(f"  Harmonic {result.harmonic_orders[i]}: {mags} V @ {result.harmonic_freqs[0, i]:.2f} Hz", flush=True)
+    print("="*50 + "\n", flush=True)
+
+def hop_samples(args, source):
+    hop = int(round(args.hop_ms * source.sample_rate / 1000))
+    if hop <= 0 or hop % source.frame_len or hop > source.window_len:
+        raise SystemExit(f"--hop-ms must be a multiple of the generator block "
+                         f"({source.frame_len * 1000 / source.sample_rate:g} ms) and at most --window-ms")
+    return hop
+
+def end_cycle(args, metrics, start, period):
+    if metrics.end_cycle(start, period) and not args.verbose:
+        print(metrics.summary('cycle'), flush=True)
+
+def check_events(capture, metrics, time_ms, thd, rms, freq=None):
+    if capture:
+        fired = capture.check(time_ms, thd, rms, freq)
+        if fired:
+            metrics.count('events', len(fired))
+
+def store_results(results, clock, metrics, time_ms, *values):
+    if results:
+        t = metrics.now()
+        results.append(clock(time_ms), *values)
+        metrics.mark('store', t)
+
+def run_windows(args, source, publish, log, metrics, capture=None, results=None):
+    """One full analysis per new window."""
+    sample_rate = source.sample_rate
+    # A new window is due every frame from the ring, every second from the CSV
+    period = source.frame_len / sample_rate if args.source == 'shm' else 1.0
+    stage = None
+    clock = WallClock()
+    cycle = 0
+    while not source.stop.is_set():
+        start_time = time.time()
+        cycle += 1
+
+        start = metrics.now()
+        window = source.read()
+        if args.source == 'shm':
+            metrics.record('slack', source.waited)
+        # The busy part of the cycle starts once the frame has arrived
+        start += source.waited
+        if window is None:
+            continue
+        metrics.mark('acquire', start)
+        if source.skipped:
+            metrics.count('dropped_frames', source.skipped)
+
+        # Analyze all phases at once
+        time_ms, phases, token = window
+        result = analyze_window(phases, sample_rate, metrics=metrics)
+        if args.aggregate:
+            t = metrics.now()
+            if stage is None:
+                stage = TenCycleStage(len(phases), sample_rate)
+            if source.fresh:
+                report_aggregates(stage.feed(time_ms[-source.fresh:], phases[:, -source.fresh:]),
+                                  phase_labels(len(phases)), log)
+            metrics.mark('aggregate', t)
+        check_events(capture, metrics, time_ms[-1], result.thd, result.rms, result.fundamental_freq)
+
+        # Keep Phase A for plotting; the ring may reuse this slot
+        t = time_ms / 1000
+        signal = phases[0].copy()
+        if not source.is_intact(token):
+            print("Window overwritten during analysis, skipping", flush=True)
+            metrics.count('dropped_windows')
+            end_cycle(args, metrics, start, period)
             continue
-            
-        # Extract Phase A voltage
-        signal = df['PhaseA(V)'].values
-        N = len(signal)
-        t = df['Time(ms)'].values / 1000
-        
-        # Compute RMS and fundamental metrics
-        rms_voltage = np.sqrt(np.mean(signal**2))
-        fundamental_peak = np.max(signal[:20])
-        
-        # Perform FFT
-        yf = rfft(signal)
-        xf = rfftfreq(N, 1/SAMPLE_RATE)
-        magnitude = np.abs(yf) / N * 2
-        
-        # Identify key frequencies
-        fundamental_bin = np.argmax(magnitude[:100])
-        fundamental_freq = xf[fundamental_bin]
-        
-        # Find harmonic bins
-        harmonic_bins = []
-        harmonic_freqs = []
-        for h in range(2, 50):
-            target_freq = h * fundamental_freq
-            if target_freq > SAMPLE_RATE/2:
-                break
-            bin_idx = np.argmin(np.abs(xf - target_freq))
-            harmonic_bins.append(bin_idx)
-            harmonic_freqs.append(xf[bin_idx])
-        
-        # Calculate THD
-        thd = calculate_thd(magnitude, fundamental_bin, harmonic_bins)
-        
-        # Terminal Output
-        print("\n" + "="*50, flush=True)
-        print(f"ANALYSIS CYCLE {cycle}", flush=True)
-        print(f"Fundamental: {fundamental_freq:.2f} Hz | Magnitude: {magnitude[fundamental_bin]:.2f} V", flush=True)
-        print(f"THD: {thd:.2f}% | RMS Voltage: {rms_voltage:.2f} V", flush=True)
-        print("-"*50, flush=True)
-        print("Harmonics:", flush=True)
-        for i, h_bin in enumerate(harmonic_bins[:10]):
-            print(f"  Harmonic {i+2}: {magnitude[h_bin]:.2f} V @ {xf[h_bin]:.2f} Hz", flush=True)
-        print("="*50 + "\n", flush=True)
-        
-        # Live Plots
-        ax1.clear()
-        ax1.plot(t, signal, 'b-')
-        ax1.set_title(f'Phase A Voltage (THD={thd:.1f}%)')
-        ax1.set_xlabel('Time (s)')
-        ax1.set_ylabel('Voltage (V)')
-        ax1.set_ylim(-1.5*fundamental_peak, 1.5*fundamental_peak)
-        
-        ax2.clear()
-        ax2.stem(xf[:500], magnitude[:500], 'r-', markerfmt=' ', basefmt=' ')
-        ax2.set_title('Frequency Spectrum')
-        ax2.set_xlabel('Frequency (Hz)')
-        ax2.set_ylabel('Magnitude (V)')
-        ax2.set_xlim(0, 1000)
-        ax2.grid(True)
-        
-        plt.tight_layout()
-        plt.pause(0.01)
-        
-        # Maintain timing
+        store_results(results, clock, metrics, time_ms[-1], result.fundamental_freq, result.fundamental_mag,
+                      result.rms, result.peak, result.thd, result.harmonic_mags)
+
+        mark = metrics.now()
+        if args.verbose:
+            print_report(cycle, result, phase_labels(len(phases)))
+        if publish:
+            publish(t, signal, result)
+        metrics.mark('report', mark)
+        end_cycle(args, metrics, start, period)
+
+        # Maintain timing (the ring source already waits for the next frame)
         elapsed = time.time() - start_time
-        if elapsed < 1.0:
-            time.sleep(1.0 - elapsed)
-            
-except KeyboardInterrupt:
-    plt.ioff()
-    plt.show()
-    print("Harmonic analyzer stopped", flush=True)
\ No newline at end of file
+        if args.source == 'csv' and elapsed < 1.0:
+            metrics.record('slack', 1.0 - elapsed)
+            source.stop.wait(1.0 - elapsed)
+
+def run_sliding(args, source, publish, log, metrics, capture=None, results=None):
+    """Overlapping windows advanced every --hop-ms, tracking only the harmonic bins.
+
+    A full analyze_window() runs once per window length (and after any gap) to re-anchor
+    the sliding DFT and re-estimate the fundamental; the hops in between cost one small
+    matrix product each and reuse phase A's frequency estimate for the bins and the
+    scalloping correction.
+    """
+    sample_rate = source.sample_rate
+    hop = hop_samples(args, source)
+    period = hop / sample_rate
+    resync_every = max(source.window_len // hop, 1)
+    stage = TenCycleStage(source.n_channels, sample_rate) if args.aggregate else None
+
+    bank = None
+    clock = WallClock()
+    since_resync = 0
+    cycle = 0
+    while not source.stop.is_set():
+        start = metrics.now()
+        window = source.read_hop(hop)
+        metrics.record('slack', source.waited)
+        start += source.waited
+        if window is None:
+            continue
+        t = metrics.mark('acquire', start)
+        time_ms, span, token, contiguous, backlog = window
+        current = span[:, hop:]
+        cycle += 1
+        if source.skipped:
+            metrics.count('dropped_frames', source.skipped)
+        if stage:
+            # Feed before anything can re-anchor; gaps are detected from the timestamps
+            report_aggregates(stage.feed(time_ms[-hop:], span[:, -hop:]), phase_labels(len(current)), log)
+            t = metrics.mark('aggregate', t)
+
+        if bank is None or not contiguous or since_resync >= resync_every:
+            result = analyze_window(current, sample_rate, metrics=metrics)
+            tracked = result.harmonic_bins[0] >= 0
+            orders = np.concatenate(([1], result.harmonic_orders[tracked]))
+            bins = np.concatenate((result.fundamental_bin[:1], result.harmonic_bins[0, tracked]))
+            if bank is None or not np.array_equal(bank.bins, bins):
+                bank = SlidingHarmonicBank(source.window_len, hop, bins, len(current), WINDOW)
+            position = result.fundamental_freq[0] * source.window_len / sample_rate
+            gain = scalloping(WINDOW, source.window_len, orders * position - bins)
+            bank.reset(current)
+            since_resync = 0
+            check_events(capture, metrics, time_ms[-1], result.thd, result.rms, result.fundamental_freq)
+            t = time_ms[hop:] / 1000
+            signal = current[0].copy()
+            if not source.is_intact(token):
+                print("Window overwritten during analysis, skipping", flush=True)
+                metrics.count('dropped_windows')
+                bank = None
+                end_cycle(args, metrics, start, period)
+                continue
+            store_results(results, clock, metrics, time_ms[-1], result.fundamental_freq, result.fundamental_mag,
+                          result.rms, result.peak, result.thd, result.harmonic_mags)
+            if backlog == 0:
+                mark = metrics.now()
+                if args.verbose:
+                    print_report(cycle, result, phase_labels(len(current)))
+                if publish:
+                    publish(t, signal, result)
+                metrics.mark('report', mark)
+            end_cycle(args, metrics, start, period)
+            continue
+
+        bank.update(span[:, :hop], span[:, -hop:])
+        t = metrics.mark('slide', t)
+        since_resync += 1
+        if not source.is_intact(token):
+            print("Window overwritten during analysis, re-anchoring", flush=True)
+            metrics.count('dropped_windows')
+            bank = None
+            end_cycle(args, metrics, start, period)
+            continue
+        if backlog and not results:
+            end_cycle(args, metrics, start, period)
+            continue
+        mags = bank.magnitudes() / gain
+        thd = thd_from_harmonics(mags[:, 1:], mags[:, 0])
+        rms = bank.rms()
+        t = metrics.mark('thd', t)
+        check_events(capture, metrics, time_ms[-1], thd, rms)
+        if results:
+            # Orders the bank does not track are above Nyquist, zero in analyze_window() too
+            harmonics = np.zeros_like(result.harmonic_mags)
+            harmonics[:, tracked] = mags[:, 1:]
+            store_results(results, clock, metrics, time_ms[-1], result.fundamental_freq, mags[:, 0], rms,
+                          np.max(np.abs(span[:, hop:]), axis=-1), thd, harmonics)
+            t = metrics.now()
+        if backlog:
+            end_cycle(args, metrics, start, period)
+            continue
+        if args.verbose:
+            summary = " | ".join(f"{label}: THD {thd[p]:.2f}% RMS {rms[p]:.1f} V"
+                                 for p, label in enumerate(phase_labels(len(mags))))
+            print(f"[{time_ms[-1] / 1000:.2f}s] {summary}", flush=True)
+            metrics.mark('report', t)
+        end_cycle(args, metrics, start, period)
+
+def main(argv=None):
+    args = parse_args(argv)
+    print("Harmonic analyzer started", flush=True)
+    metrics = Metrics('analyzer', None if args.no_metrics else args.metrics, args.metrics_interval,
+                      STAGES, COUNTERS)
+    source = RingSource(args.ring, args.reader_slot, args.window_ms) if args.source == 'shm' \
+        else CsvSource(args.window_ms)
+    input_rate = source.sample_rate
+    capture = None
+    if args.capture:
+        # Captures keep the raw input, so the tap goes on the source before any decimation
+        labels = phase_labels(source.n_channels)
+        detector = cap.EventDetector(labels, args.trigger_thd, args.trigger_sag, args.trigger_swell,
+                                     args.trigger_freq, args.nominal_v, args.nominal_hz)
+        capture = cap.TriggeredCapture(args.capture, labels, input_rate, detector, args.capture_pre,
+                                       args.capture_post, args.capture_ring_s, metrics)
+        source.tap = capture.feed
+    if args.source == 'shm':
+        q = decimation_factor(input_rate, ANALYSIS_MAX_FREQ, source.frame_len) if args.decimate == 'auto' \
+            else int(args.decimate)
+        if q > 1:
+            source = DecimatingSource(source, q, ANALYSIS_MAX_FREQ, metrics)
+            print(f"Decimating {input_rate} Hz -> {source.sample_rate} Hz ({len(source.taps)}-tap anti-alias "
+                  f"filter, flat to {ANALYSIS_MAX_FREQ} Hz)", flush=True)
+    if input_rate < 2 * ANALYSIS_MAX_FREQ:
+        print(f"Note: at {input_rate} Hz harmonics above {input_rate / 2:g} Hz alias and are not analyzed", flush=True)
+    run = run_windows
+    if args.hop_ms is not None:
+        hop_samples(args, source)
+        run = run_sliding
+    log = open(args.aggregate_log, 'a') if args.aggregate_log else None
+    results = None
+    if args.results:
+        results = ResultsStore(args.results, phase_labels(source.n_channels), np.arange(2, MAX_HARMONIC + 1))
+    metrics.info = {'source': args.source, 'input_rate': input_rate, 'sample_rate': source.sample_rate,
+                    'window_ms': args.window_ms, 'hop_ms': args.hop_ms}
+
+    worker = None
+    try:
+        if args.headless:
+            run(args, source, None, log, metrics, capture, results)
+        else:
+            # Analysis runs on its own thread so a slow GUI never holds it back
+            from live_plot import LivePlot
+            plot = LivePlot(args.plot_fps, metrics)
+            worker = threading.Thread(target=run, args=(args, source, plot.post, log, metrics, capture, results),
+                                      daemon=True)
+            worker.start()
+            plot.run(worker)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        source.stop.set()
+        if worker:
+            worker.join()
+        if args.source == 'shm':
+            source.close()
+        if log:
+            log.close()
+        if capture:
+            capture.close()
+        if results:
+            results.close()
+        metrics.flush()
+        print("Harmonic analyzer stopped", flush=True)
+
+if __name__ == "__main__":
+    # Let the supervisor's terminate() run the same cleanup as Ctrl+C
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    main()
@@ -0,0 +1,123 @@
+import threading
+import time
+import numpy as np
+import matplotlib.pyplot as plt
+from metrics import NULL_METRICS
+
+SPECTRUM_MAX_FREQ = 2500  # 50th harmonic
+
+def minmax_decimate(x, y, n_columns):
+    """Reduce a trace to a min and a max per pixel column; keeps peaks that plain striding drops."""
+    if len(y) <= 2 * n_columns:
+        return x, y
+    per_column = len(y) // n_columns
+    usable = per_column * n_columns
+    cols = y[-usable:].reshape(n_columns, per_column)
+    xs = x[-usable:].reshape(n_columns, per_column)[:, [0, -1]].ravel()
+    ys = np.column_stack((cols.min(axis=1), cols.max(axis=1))).ravel()
+    return xs, ys
+
+class LivePlot:
+    """Phase A trace and spectrum redrawn at their own rate, off the analysis path.
+
+    The analysis thread calls post() with its latest result and never waits on the GUI.
+    run() owns the GUI on the main thread: the artists are created once, updated with
+    set_data() and blitted, and a full redraw happens only when an axis range changes.
+    """
+
+    def __init__(self, fps=5, metrics=NULL_METRICS):
+        self.period = 1 / fps
+        self.metrics = metrics
+        self.lock = threading.Lock()
+        self.latest = None
+        self.background = None
+        self.ylim = None
+        self.spec_ylim = None
+
+        plt.ion()
+        self.fig, (self.ax1, self.ax2) = plt.subplots(2, 1, figsize=(12, 8))
+        self.trace, = self.ax1.plot([], [], 'b-', animated=True)
+        self.title = self.ax1.set_title('Phase A Voltage', animated=True)
+        self.ax1.set_xlabel('Time (s)')
+        self.ax1.set_ylabel('Voltage (V)')
+        self.stems, = self.ax2.plot([], [], 'r-', animated=True)
+        self.ax2.set_title('Frequency Spectrum')
+        self.ax2.set_xlabel('Frequency (Hz)')
+        self.ax2.set_ylabel('Magnitude (V)')
+        self.ax2.set_xlim(0, SPECTRUM_MAX_FREQ)
+        self.ax2.grid(True)
+        self.fig.tight_layout()
+        self.fig.canvas.mpl_connect('draw_event', self._on_draw)
+        plt.show(block=False)
+
+    def post(self, t, signal, result):
+        """Hand over the newest Phase A window; an unread older one is simply replaced."""
+        with self.lock:
+            self.latest = (t, signal, result)
+
+    def _on_draw(self, event):
+        # Full redraws (resize, axis change) refresh the cached background
+        self.background = self.fig.canvas.copy_from_bbox(self.fig.bbox)
+        self._draw_artists()
+
+    def _draw_artists(self):
+        for artist in (self.trace, self.title, self.stems):
+            self.fig.draw_artist(artist)
+
+    def _needs_rescale(self, current, top):
+        return current is None or top > current[1] or top < 0.5 * current[1]
+
+    def _update(self, t, signal, result):
+        xf, magnitude = result.xf, result.magnitude[0]
+        keep = xf <= SPECTRUM_MAX_FREQ
+        xf, magnitude = xf[keep], magnitude[keep]
+
+        # Time relative to the window start keeps the x range fixed between updates
+        width = max(int(self.ax1.bbox.width), 1)
+        self.trace.set_data(*minmax_decimate(t - t[0], signal, width))
+        self.title.set_text(f'Phase A Voltage (THD={result.thd[0]:.1f}%) @ {t[0]:.1f} s')
+        # One polyline of NaN-separated vertical segments instead of a stem container
+        stem_x = np.repeat(xf, 3)
+        stem_y = np.column_stack((np.zeros_like(magnitude), magnitude, np.full_like(magnitude, np.nan))).ravel()
+        stem_x[2::3] = np.nan
+        self.stems.set_data(stem_x, stem_y)
+
+        redraw = False
+        peak = 1.5 * abs(result.peak[0])
+        if self._needs_rescale(self.ylim, peak):
+            self.ylim = (-1.2 * peak, 1.2 * peak)
+            self.ax1.set_ylim(*self.ylim)
+            redraw = True
+        duration = t[-1] - t[0]
+        if self.ax1.get_xlim() != (0, duration):
+            self.ax1.set_xlim(0, duration)
+            redraw = True
+        right = min(SPECTRUM_MAX_FREQ, xf[-1])
+        if self.ax2.get_xlim() != (0, right):
+            self.ax2.set_xlim(0, right)
+            redraw = True
+        top = magnitude[1:].max() if len(magnitude) > 1 else 1.0
+        if self._needs_rescale(self.spec_ylim, top):
+            self.spec_ylim = (0, 1.2 * top)
+            self.ax2.set_ylim(*self.spec_ylim)
+            redraw = True
+
+        canvas = self.fig.canvas
+        if redraw or self.background is None or not canvas.supports_blit:
+            canvas.draw()
+        else:
+            canvas.restore_region(self.background)
+            self._draw_artists()
+            canvas.blit(self.fig.bbox)
+
+    def run(self, worker):
+        """Serve the GUI until the analysis thread ends or the window is closed."""
+        while worker.is_alive() and plt.fignum_exists(self.fig.number):
+            start = time.time()
+            with self.lock:
+                item, self.latest = self.latest, None
+            if item is not None:
+                self._update(*item)
+                self.metrics.record('plot', time.time() - start)
+            remaining = self.period - (time.time() - start)
+            self.fig.canvas.start_event_loop(max(remaining, 0.001))
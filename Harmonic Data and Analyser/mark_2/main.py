@@ -1,87 +1,243 @@
 # main.py
-import subprocess
-import time
+import os
 import sys
+import shlex
 import signal
-import threading
-
-# Global references to processes
-generator_process = None
-analyzer_process = None
-
-def stream_reader(prefix, stream):
-    """Read lines from a stream and print them with a prefix."""
-    try:
-        for line in iter(stream.readline, ''):
-            if line:
-                print(f"[{prefix}] {line.strip()}")
-                sys.stdout.flush()
-    finally:
-        stream.close()
-
-def signal_handler(sig, frame):
-    """Handle Ctrl+C to terminate child processes."""
-    print("\nTerminating processes...")
-    if generator_process:
-        generator_process.terminate()
-    if analyzer_process:
-        analyzer_process.terminate()
-    # Wait for processes to terminate
-    if generator_process:
-        generator_process.wait()
-    if analyzer_process:
-        analyzer_process.wait()
-    print("All processes terminated")
-    sys.exit(0)
+import asyncio
+import argparse
+import subprocess
+from shm_ring import ShmRing, DEFAULT_RING_NAME, MAX_READERS
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BACKOFF_INITIAL = 0.5  # seconds before the first restart
+BACKOFF_MAX = 10.0
+STABLE_AFTER = 30.0    # a child that ran this long starts over at BACKOFF_INITIAL
+STOP_TIMEOUT = 5.0     # grace period after SIGTERM before SIGKILL
+
+class Worker:
+    """One supervised child process; restarted with exponential backoff whenever it exits.
+
+    stdout and stderr are read with asyncio and echoed line by line with the worker's
+    name as prefix. on_exit runs after every unexpected exit, on_give_up once
+    max_restarts consecutive short-lived runs have failed.
+    """
+
+    def __init__(self, name, argv, max_restarts=5, on_exit=None, on_give_up=None):
+        self.name = name
+        self.argv = argv
+        self.max_restarts = max_restarts
+        self.on_exit = on_exit
+        self.on_give_up = on_give_up
+        self.process = None
+        self.restarts = 0
+        self.restart_now = False
+
+    async def _pump(self, stream, prefix):
+        while True:
+            line = await stream.readline()
+            if not line:
+                break
+            sys.stdout.write(f"[{prefix}] {line.decode(errors='replace').rstrip()}\n")
+            sys.stdout.flush()
+
+    async def _start(self):
+        # Children get their own process group, so a terminal Ctrl+C reaches only the supervisor
+        if os.name == 'nt':
+            kw = {'creationflags': subprocess.CREATE_NEW_PROCESS_GROUP}
+        else:
+            kw = {'start_new_session': True}
+        return await asyncio.create_subprocess_exec(
+            sys.executable, *self.argv, cwd=HERE,
+            stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE, **kw)
+
+    async def run(self, stopping):
+        loop = asyncio.get_running_loop()
+        backoff = BACKOFF_INITIAL
+        failures = 0
+        while not stopping.is_set():
+            self.process = await self._start()
+            started = loop.time()
+            await asyncio.gather(self._pump(self.process.stdout, self.name),
+                                 self._pump(self.process.stderr, f"{self.name}-ERR"),
+                                 self.process.wait())
+            code = self.process.returncode
+            if stopping.is_set():
+                break
+            if self.restart_now:
+                self.restart_now = False
+                continue
+            if self.on_exit:
+                self.on_exit()
+
+            if loop.time() - started >= STABLE_AFTER:
+                backoff, failures = BACKOFF_INITIAL, 0
+            failures += 1
+            if self.max_restarts and failures > self.max_restarts:
+                print(f"[{self.name}] exited with code {code}; giving up after {self.max_restarts} restarts",
+                      flush=True)
+                if self.on_give_up:
+                    self.on_give_up()
+                break
+            print(f"[{self.name}] exited with code {code}; restarting in {backoff:.1f}s", flush=True)
+            try:
+                await asyncio.wait_for(stopping.wait(), backoff)
+            except asyncio.TimeoutError:
+                pass
+            backoff = min(2 * backoff, BACKOFF_MAX)
+            self.restarts += 1
+
+    def restart(self):
+        """Stop the current process and start a new one straight away."""
+        if self.process and self.process.returncode is None:
+            self.restart_now = True
+            self.process.terminate()
+
+    async def stop(self):
+        if self.process is None or self.process.returncode is not None:
+            return
+        self.process.terminate()
+        try:
+            await asyncio.wait_for(self.process.wait(), STOP_TIMEOUT)
+        except asyncio.TimeoutError:
+            self.process.kill()
+            await self.process.wait()
+
+class Pipeline:
+    """A generator and its analyzers sharing one ring; analyzer k holds reader slot k."""
+
+    def __init__(self, index, args):
+        single = args.pipelines == 1
+        self.ring_name = DEFAULT_RING_NAME if single else f"{DEFAULT_RING_NAME}_{index}"
+        suffix = "" if single else str(index)
+
+        gen_argv = ["data_generator.py", "--ring", self.ring_name,
+                    "--metrics", os.path.join(args.metrics_dir, f"generator{suffix}.json")]
+        if not single:
+            gen_argv += ["--datalog", f"datalog_{index}"]
+        self.generator = Worker(f"GEN{suffix}", gen_argv + shlex.split(args.generator_args), args.max_restarts,
+                                on_exit=self.discard_ring)
+
+        self.analyzers = []
+        for k in range(args.analyzers):
+            if args.analyzers == 1:
+                name = f"ANA{suffix}"
+            else:
+                name = f"ANA{suffix}.{k}" if suffix else f"ANA{k}"
+            ana_argv = ["harmonic_analyzer.py", "--ring", self.ring_name, "--reader-slot", str(k),
+                        "--metrics", os.path.join(args.metrics_dir, f"analyzer{suffix}_{k}.json")]
+            # Only the very first analyzer gets a plot window
+            if args.headless or index > 0 or k > 0:
+                ana_argv.append("--headless")
+            self.analyzers.append(Worker(name, ana_argv + shlex.split(args.analyzer_args), args.max_restarts,
+                                         on_give_up=lambda k=k: self.release(k)))
+
+    def discard_ring(self):
+        """Unlink the ring of a generator that died, so restarted analyzers wait for the new one
+        instead of attaching to the stale segment."""
+        try:
+            ring = ShmRing.attach(self.ring_name)
+        except (FileNotFoundError, ValueError):
+            return
+        ring.shm.unlink()
+        ring.close()
+
+    def release(self, slot):
+        """Free a reader slot whose analyzer is gone for good, so it cannot hold back the generator."""
+        try:
+            ring = ShmRing.attach(self.ring_name)
+        except (FileNotFoundError, ValueError):
+            return
+        ring.release(slot)
+        ring.close()
+
+    def lags(self):
+        try:
+            ring = ShmRing.attach(self.ring_name)
+        except (FileNotFoundError, ValueError):
+            return None
+        try:
+            return ring.sequence, ring.headroom(), ring.lags()
+        finally:
+            ring.close()
+
+    async def run(self, stopping):
+        gen = asyncio.create_task(self.generator.run(stopping))
+        # Give the generator a moment to create the ring
+        await asyncio.sleep(0.5)
+        # Analyzers also stop when their generator has been given up
+        feed_down = asyncio.Event()
+        analyzers = [asyncio.create_task(a.run(feed_down)) for a in self.analyzers]
+        restarts = self.generator.restarts
+        while not gen.done() and not stopping.is_set():
+            await asyncio.sleep(0.5)
+            if self.generator.restarts != restarts:
+                # A restarted generator creates a fresh ring; the analyzers must re-attach
+                restarts = self.generator.restarts
+                for a in self.analyzers:
+                    a.restart()
+        # Analyzers first, so they release their reader slots before the ring goes away
+        feed_down.set()
+        await asyncio.gather(*(a.stop() for a in self.analyzers))
+        await self.generator.stop()
+        await asyncio.gather(gen, *analyzers)
+
+async def report_lag(pipelines, interval):
+    """Periodically show how far each analyzer is behind its generator."""
+    while True:
+        await asyncio.sleep(interval)
+        for p in pipelines:
+            state = p.lags()
+            if state is None:
+                continue
+            sequence, headroom, lags = state
+            readers = " ".join(f"{slot}:{lag}" for slot, lag in lags.items()) or "none"
+            print(f"[SUP] {p.ring_name}: frame {sequence} | headroom {headroom} | reader lag {readers}",
+                  flush=True)
+
+async def supervise(args):
+    os.makedirs(os.path.join(HERE, args.metrics_dir), exist_ok=True)
+    loop = asyncio.get_running_loop()
+    stopping = asyncio.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stopping.set)
+        except NotImplementedError:
+            signal.signal(sig, lambda *_: loop.call_soon_threadsafe(stopping.set))
+
+    pipelines = [Pipeline(i, args) for i in range(args.pipelines)]
+    print(f"Starting {args.pipelines} pipeline(s) x {args.analyzers} analyzer(s). Press Ctrl+C to stop", flush=True)
+    print("=" * 60, flush=True)
+    tasks = [asyncio.create_task(p.run(stopping)) for p in pipelines]
+    reporter = asyncio.create_task(report_lag(pipelines, args.status_s)) if args.status_s > 0 else None
+
+    # Runs until Ctrl+C / SIGTERM, or until every pipeline has been given up
+    all_done = asyncio.gather(*tasks)
+    stop_requested = asyncio.create_task(stopping.wait())
+    await asyncio.wait([all_done, stop_requested], return_when=asyncio.FIRST_COMPLETED)
+    if stopping.is_set():
+        print("\nTerminating processes...", flush=True)
+    stopping.set()
+    await all_done
+    if reporter:
+        reporter.cancel()
+    print("All processes terminated", flush=True)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Supervise data generator and harmonic analyzer pipelines")
+    parser.add_argument('--pipelines', type=int, default=1,
+                        help="independent generator + analyzers sets, each on its own ring")
+    parser.add_argument('--analyzers', type=int, default=1, help="analyzers per generator")
+    parser.add_argument('--generator-args', default="", help="extra arguments for data_generator.py")
+    parser.add_argument('--analyzer-args', default="", help="extra arguments for harmonic_analyzer.py")
+    parser.add_argument('--headless', action='store_true', help="no plot window for the first analyzer")
+    parser.add_argument('--max-restarts', type=int, default=5,
+                        help="consecutive quick restarts before a child is given up (0 = never give up)")
+    parser.add_argument('--metrics-dir', default='metrics')
+    parser.add_argument('--status-s', type=float, default=10.0, help="reader lag report interval (0 = off)")
+    args = parser.parse_args(argv)
+    if not 1 <= args.analyzers <= MAX_READERS:
+        parser.error(f"--analyzers must be between 1 and {MAX_READERS}")
+    return args
 
 if __name__ == "__main__":
-    # Register signal handler
-    signal.signal(signal.SIGINT, signal_handler)
-    
-    print("Starting data generator...")
-    generator_process = subprocess.Popen(
-        [sys.executable, "data_generator.py"],
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        text=True,
-        bufsize=1,
-        creationflags=subprocess.CREATE_NEW_PROCESS_GROUP
-    )
-    
-    # Wait for initial data
-    time.sleep(0.5)
-    print("Data generator running")
-    
-    print("Starting harmonic analyzer...")
-    analyzer_process = subprocess.Popen(
-        [sys.executable, "harmonic_analyzer.py"],
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        text=True,
-        bufsize=1,
-        creationflags=subprocess.CREATE_NEW_PROCESS_GROUP
-    )
-    
-    print("Both processes running. Press Ctrl+C to stop")
-    print("=" * 60)
-    
-    # Create threads to read the streams
-    threads = [
-        threading.Thread(target=stream_reader, args=("GEN", generator_process.stdout)),
-        threading.Thread(target=stream_reader, args=("GEN-ERR", generator_process.stderr)),
-        threading.Thread(target=stream_reader, args=("ANA", analyzer_process.stdout)),
-        threading.Thread(target=stream_reader, args=("ANA-ERR", analyzer_process.stderr)),
-    ]
-    
-    # Start all threads
-    for t in threads:
-        t.daemon = True  # Daemon threads will be terminated when the main program exits
-        t.start()
-    
-    # Keep the main thread alive until both processes finish (or until Ctrl+C)
-    try:
-        # Wait for both processes to finish (if they do, we break out)
-        while generator_process.poll() is None or analyzer_process.poll() is None:
-            time.sleep(0.1)
-    except KeyboardInterrupt:
-        signal_handler(signal.SIGINT, None)
\ No newline at end of file
+    asyncio.run(supervise(parse_args()))
@@ -0,0 +1,165 @@
+import os
+import json
+import math
+import time
+import numpy as np
+
+# Latency histogram buckets: 8 per decade from 1 us to 100 s
+BUCKETS_PER_DECADE = 8
+MIN_EXP, MAX_EXP = -3, 5  # 10**-3 ms .. 10**5 ms
+N_BUCKETS = (MAX_EXP - MIN_EXP) * BUCKETS_PER_DECADE + 2  # plus underflow and overflow
+EDGES_MS = 10.0 ** (MIN_EXP + np.arange(N_BUCKETS - 1) / BUCKETS_PER_DECADE)
+FLUSH_INTERVAL = 5.0  # seconds between metrics file updates
+
+class Histogram:
+    """Fixed log-spaced histogram of durations; recording never allocates."""
+
+    def __init__(self):
+        self.counts = np.zeros(N_BUCKETS, dtype=np.int64)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, ms):
+        if ms <= EDGES_MS[0]:
+            i = 0
+        else:
+            i = min(int((math.log10(ms) - MIN_EXP) * BUCKETS_PER_DECADE) + 1, N_BUCKETS - 1)
+        self.counts[i] += 1
+        self.count += 1
+        self.total += ms
+        if ms > self.max:
+            self.max = ms
+
+    def percentile(self, q):
+        """Upper edge of the bucket holding the q-th percentile (ms), capped at the maximum seen."""
+        if self.count == 0:
+            return 0.0
+        i = int(np.searchsorted(np.cumsum(self.counts), q / 100 * self.count))
+        return min(float(EDGES_MS[i]), self.max) if i < len(EDGES_MS) else self.max
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'mean_ms': self.total / self.count if self.count else 0.0,
+            'p50_ms': self.percentile(50),
+            'p99_ms': self.percentile(99),
+            'max_ms': self.max,
+            'counts': self.counts.tolist(),
+        }
+
+class Metrics:
+    """Per-stage timings and event counters for one process, flushed to a JSON file.
+
+    Stages are timed back to back with mark(): t = metrics.mark('fft', t) records the
+    time since t under 'fft' and returns the new timestamp. The file is rewritten
+    atomically every `interval` seconds, so readers never see a partial document.
+    """
+
+    def __init__(self, process, path=None, interval=FLUSH_INTERVAL, stages=(), counters=()):
+        self.process = process
+        self.path = path
+        self.interval = interval
+        self.started = time.time()
+        self.last_flush = time.perf_counter()
+        self.stages = {name: Histogram() for name in stages}
+        self.counters = dict.fromkeys(counters, 0)
+        self.info = {}
+
+    now = staticmethod(time.perf_counter)
+
+    def mark(self, stage, since):
+        now = time.perf_counter()
+        self.record(stage, now - since)
+        return now
+
+    def record(self, stage, seconds):
+        hist = self.stages.get(stage)
+        if hist is None:
+            hist = self.stages[stage] = Histogram()
+        hist.record(seconds * 1000)
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def end_cycle(self, start, period):
+        """Record the busy time since start as one cycle, an overrun if it exceeded period (s).
+
+        Flushes the file when it is due and returns True if it did.
+        """
+        busy = time.perf_counter() - start
+        self.record('cycle', busy)
+        self.count('cycles')
+        if busy > period:
+            self.count('overruns')
+        if time.perf_counter() - self.last_flush < self.interval:
+            return False
+        self.flush()
+        return True
+
+    def snapshot(self):
+        return {
+            'process': self.process,
+            'pid': os.getpid(),
+            'started': self.started,
+            'updated': time.time(),
+            'uptime_s': time.time() - self.started,
+            'info': self.info,
+            'counters': dict(self.counters),
+            'edges_ms': EDGES_MS.tolist(),
+            'stages': {name: hist.summary() for name, hist in self.stages.items()},
+        }
+
+    def flush(self):
+        self.last_flush = time.perf_counter()
+        if not self.path:
+            return
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp, self.path)
+
+    def summary(self, stage):
+        """One-line status for the console."""
+        hist = self.stages.get(stage)
+        timing = f"{stage} p50 {hist.percentile(50):.2f} ms p99 {hist.percentile(99):.2f} ms" if hist else ""
+        counters = " ".join(f"{name} {value}" for name, value in self.counters.items())
+        return f"[{self.process}] {timing} | {counters}"
+
+class NullMetrics:
+    """Stand-in when instrumentation is off; every call is a no-op."""
+
+    stages = {}
+    counters = {}
+
+    def now(self):
+        return 0.0
+
+    def mark(self, stage, since):
+        return 0.0
+
+    def record(self, stage, seconds):
+        pass
+
+    def count(self, name, n=1):
+        pass
+
+NULL_METRICS = NullMetrics()
+
+def print_metrics(path):
+    """Table of the stage timings and counters in a metrics file."""
+    with open(path) as f:
+        doc = json.load(f)
+    print(f"{doc['process']} (pid {doc['pid']}), up {doc['uptime_s']:.0f} s", flush=True)
+    for name, stage in doc['stages'].items():
+        if stage['count']:
+            print(f"  {name:10s} n={stage['count']:<8d} mean {stage['mean_ms']:9.3f} ms | p50 {stage['p50_ms']:9.3f} ms"
+                  f" | p99 {stage['p99_ms']:9.3f} ms | max {stage['max_ms']:9.3f} ms", flush=True)
+    for name, value in doc['counters'].items():
+        print(f"  {name}: {value}", flush=True)
+
+if __name__ == "__main__":
+    import sys
+    for path in sys.argv[1:] or ['generator_metrics.json', 'analyzer_metrics.json']:
+        if os.path.exists(path):
+            print_metrics(path)
@@ -0,0 +1,311 @@
+import os
+import json
+import time
+import argparse
+import numpy as np
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+# Levels: name, bucket length (s) and UTC partition name. Raw rows go into one directory
+# per day; a rollup bucket never spans two raw partitions.
+LEVELS = [('raw', 0, '%Y%m%d'), ('1min', 60, '%Y%m'), ('1h', 3600, '%Y'), ('1d', 86400, 'all')]
+STATS = ['min', 'max', 'mean', 'p95']
+FIELDS = ['fundamental_freq', 'fundamental_mag', 'rms', 'peak', 'thd', 'harmonics']
+
+QueryResult = namedtuple('QueryResult', ['level', 'time', 'values'])
+
+def _partition_name(fmt, t):
+    return time.strftime(fmt, time.gmtime(t))
+
+def _rows(path):
+    """Complete rows of a partition; a directory whose time file is not there yet has none."""
+    try:
+        return os.path.getsize(os.path.join(path, 'time.f8')) // 8
+    except FileNotFoundError:
+        return 0
+
+def _read_columns(path, shapes, names):
+    """(time, {name: column}) memmaps of a partition; rows are counted by the time file,
+    which is written last."""
+    n = _rows(path)
+    if n == 0:
+        return np.empty(0), {name: np.empty((0,) + shapes[name], dtype=np.float32) for name in names}
+    t = np.memmap(os.path.join(path, 'time.f8'), dtype='<f8', mode='r', shape=(n,))
+    return t, {name: np.memmap(os.path.join(path, name + '.f4'), dtype='<f4', mode='r', shape=(n,) + shapes[name])
+               for name in names}
+
+class PartitionWriter:
+    """Append-only column files of one partition: time.f8 plus one float32 file per column."""
+
+    def __init__(self, path, names):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.time = open(os.path.join(path, 'time.f8'), 'ab')
+        self.files = {name: open(os.path.join(path, name + '.f4'), 'ab') for name in names}
+
+    def append(self, t, row):
+        for name, f in self.files.items():
+            f.write(np.asarray(row[name], dtype='<f4').tobytes())
+            f.flush()
+        # Time last, so a reader never counts a row whose columns are incomplete
+        self.time.write(np.float64(t).tobytes())
+        self.time.flush()
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+        self.time.close()
+
+class WallClock:
+    """Unix time of generator Time(ms) stamps; re-anchors when the stamps jump back (a
+    restarted generator starts again from zero)."""
+
+    def __init__(self):
+        self.offset = None
+        self.last_ms = None
+
+    def __call__(self, time_ms):
+        if self.offset is None or time_ms < self.last_ms:
+            self.offset = time.time() - time_ms / 1000
+        self.last_ms = time_ms
+        return self.offset + time_ms / 1000
+
+class ResultsStore:
+    """Per-cycle analysis results with 1-minute, 1-hour and 1-day rollups.
+
+    Raw rows hold fundamental frequency and magnitude, RMS, peak and THD per phase and
+    the harmonic magnitudes per phase and order, in time-partitioned column files whose
+    sorted time column is the index. When a row starts a new minute, hour or day, the
+    bucket that just closed is summarized (min, max, mean, exact p95) from its raw rows
+    on a background thread, so appending never waits for a rollup. query() reads the
+    coarsest level that meets the requested resolution.
+
+    One process appends to a directory; any number may query it.
+    """
+
+    def __init__(self, directory, labels=None, orders=None):
+        self.directory = directory
+        schema_path = os.path.join(directory, 'schema.json')
+        if os.path.exists(schema_path):
+            with open(schema_path) as f:
+                self.schema = json.load(f)
+            if labels is not None and (list(labels) != self.schema['labels']
+                                       or list(orders) != self.schema['orders']):
+                raise ValueError(f"{directory} holds {self.schema['labels']} x orders {self.schema['orders']}")
+        else:
+            if labels is None:
+                raise FileNotFoundError(f"no results store in {directory}")
+            self.schema = {'labels': list(labels), 'orders': [int(h) for h in orders],
+                           'fields': FIELDS, 'stats': STATS, 'levels': [name for name, _, _ in LEVELS]}
+            os.makedirs(directory, exist_ok=True)
+            with open(schema_path, 'w') as f:
+                json.dump(self.schema, f, indent=2)
+
+        n_phases, n_orders = len(self.schema['labels']), len(self.schema['orders'])
+        self.field_shapes = {name: (n_phases,) for name in FIELDS}
+        self.field_shapes['harmonics'] = (n_phases, n_orders)
+        self.shapes = {'raw': self.field_shapes}
+        for name, _, _ in LEVELS[1:]:
+            shapes = {'count': ()}
+            for field, shape in self.field_shapes.items():
+                shapes.update({f'{field}.{stat}': shape for stat in STATS})
+            self.shapes[name] = shapes
+
+        self.writers = {}
+        self.buckets = None
+        self.last_time = None
+        self.worker = None
+        self.caught_up = False
+
+    def _level(self, name):
+        return next(level for level in LEVELS if level[0] == name)
+
+    def _writer(self, level, t):
+        """Writer for the partition holding t, closing the previous one on a change."""
+        _, _, fmt = self._level(level)
+        path = os.path.join(self.directory, level, _partition_name(fmt, t))
+        writer = self.writers.get(level)
+        if writer is None or writer.path != path:
+            if writer:
+                writer.close()
+            writer = self.writers[level] = PartitionWriter(path, list(self.shapes[level]))
+        return writer
+
+    def partitions(self, level, start, end):
+        """Partition directories of a level that can hold rows in [start, end)."""
+        _, _, fmt = self._level(level)
+        root = os.path.join(self.directory, level)
+        if not os.path.isdir(root):
+            return []
+        first, last = _partition_name(fmt, start), _partition_name(fmt, end)
+        return [os.path.join(root, name) for name in sorted(os.listdir(root)) if first <= name <= last]
+
+    def append(self, t, fundamental_freq, fundamental_mag, rms, peak, thd, harmonics):
+        """Add one cycle at Unix time t; returns False (and stores nothing) unless t is later
+        than the previous row."""
+        if self.worker is None:
+            # First row from this writer: continue after what is on disk
+            self.last_time = self._last_time('raw')
+            self.worker = ThreadPoolExecutor(max_workers=1)
+        if self.last_time is not None and t <= self.last_time:
+            return False
+        row = {'fundamental_freq': fundamental_freq, 'fundamental_mag': fundamental_mag, 'rms': rms,
+               'peak': peak, 'thd': thd, 'harmonics': harmonics}
+        self._writer('raw', t).append(t, row)
+        if not self.caught_up:
+            self.caught_up = True
+            # Summarize whatever closed while no writer was running; submitted once the row
+            # is on disk, so even a new store has a first time to start from
+            self.worker.submit(self._guarded, self.catch_up, t)
+
+        buckets = [int(t // step) for _, step, _ in LEVELS[1:]]
+        if self.buckets is not None:
+            for (level, step, _), old, new in zip(LEVELS[1:], self.buckets, buckets):
+                if new != old:
+                    self.worker.submit(self._guarded, self.rollup, level, old * step, (old + 1) * step)
+        self.buckets = buckets
+        self.last_time = t
+        return True
+
+    def append_analysis(self, t, result, harmonic_mags=None):
+        """append() from a harmonic_analyzer Analysis; harmonic_mags overrides its table."""
+        mags = result.harmonic_mags if harmonic_mags is None else harmonic_mags
+        return self.append(t, result.fundamental_freq, result.fundamental_mag, result.rms, result.peak,
+                           result.thd, mags)
+
+    def _guarded(self, fn, *args):
+        try:
+            fn(*args)
+        except Exception as e:
+            print(f"Results rollup failed: {e}", flush=True)
+
+    def _last_time(self, level):
+        root = os.path.join(self.directory, level)
+        names = sorted(os.listdir(root)) if os.path.isdir(root) else []
+        for name in reversed(names):
+            n = _rows(os.path.join(root, name))
+            if n:
+                return float(np.fromfile(os.path.join(root, name, 'time.f8'), dtype='<f8', offset=(n - 1) * 8)[0])
+        return None
+
+    def catch_up(self, now):
+        """Roll up every closed bucket after the last stored one, up to the one holding now;
+        returns {level: buckets written}."""
+        first_raw = self.first_time()
+        written = {}
+        for level, step, _ in LEVELS[1:]:
+            if first_raw is None:
+                break
+            last = self._last_time(level)
+            start = first_raw // step * step if last is None else last + step
+            end = now // step * step
+            written[level] = self.rollup(level, start, end) if start < end else 0
+        return written
+
+    def first_time(self):
+        root = os.path.join(self.directory, 'raw')
+        for name in sorted(os.listdir(root)) if os.path.isdir(root) else []:
+            if _rows(os.path.join(root, name)):
+                return float(np.fromfile(os.path.join(root, name, 'time.f8'), dtype='<f8', count=1)[0])
+        return None
+
+    def rollup(self, level, start, end):
+        """Summarize the raw rows of every bucket of `level` in [start, end); returns buckets written.
+
+        Runs on the background thread while appending. Buckets are appended, so a range
+        must not overlap rows already in the level.
+        """
+        _, step, _ = self._level(level)
+        written = 0
+        for path in self.partitions('raw', start, end):
+            t, cols = _read_columns(path, self.field_shapes, FIELDS)
+            a, b = np.searchsorted(t, [start, end])
+            if a == b:
+                continue
+            ids = (t[a:b] // step).astype(np.int64)
+            bounds = np.flatnonzero(np.diff(ids)) + 1
+            for lo, hi in zip(np.concatenate(([0], bounds)) + a, np.concatenate((bounds, [b - a])) + a):
+                row = {'count': hi - lo}
+                for field in FIELDS:
+                    x = cols[field][lo:hi]
+                    row[f'{field}.min'] = x.min(axis=0)
+                    row[f'{field}.max'] = x.max(axis=0)
+                    row[f'{field}.mean'] = x.mean(axis=0, dtype=np.float64)
+                    row[f'{field}.p95'] = np.percentile(x, 95, axis=0)
+                bucket = ids[lo - a] * step
+                self._writer(level, bucket).append(bucket, row)
+                written += 1
+        return written
+
+    def query(self, field, start, end, resolution=0, stat='mean'):
+        """Rows of field with start <= t < end from the coarsest level whose bucket is at most
+        `resolution` seconds (raw below one minute).
+
+        Returns (level, time, values); values has shape (rows, phases) or, for harmonics,
+        (rows, phases, orders). Rollup rows are stamped with their bucket start and only
+        exist for closed buckets. stat is one of STATS, or 'count', and ignored for raw rows.
+        """
+        level = 'raw'
+        for name, step, _ in LEVELS[1:]:
+            if step <= resolution:
+                level = name
+        column = field if level == 'raw' else (stat if stat == 'count' else f'{field}.{stat}')
+        shapes = self.shapes[level]
+        times, values = [], []
+        for path in self.partitions(level, start, end):
+            t, cols = _read_columns(path, shapes, [column])
+            a, b = np.searchsorted(t, [start, end])
+            times.append(t[a:b])
+            values.append(cols[column][a:b])
+        if not times:
+            return QueryResult(level, np.empty(0), np.empty((0,) + shapes[column], dtype=np.float32))
+        return QueryResult(level, np.concatenate(times), np.concatenate(values))
+
+    def close(self):
+        """Wait for pending rollups and close the files; buckets still open stay raw-only
+        until the next writer catches up on them."""
+        if self.worker:
+            self.worker.shutdown(wait=True)
+        for writer in self.writers.values():
+            writer.close()
+        self.writers = {}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Query or rebuild an analysis results store")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    q = sub.add_parser('query', help="summarize a field over a time range")
+    q.add_argument('directory')
+    q.add_argument('--field', choices=FIELDS, default='thd')
+    q.add_argument('--stat', choices=STATS + ['count'], default='mean')
+    q.add_argument('--days', type=float, default=1.0, help="range ending now")
+    q.add_argument('--resolution', type=float, default=None,
+                   help="seconds per point; default picks about 1000 points over the range")
+
+    rb = sub.add_parser('rollup', help="roll up closed buckets that have raw rows but no rollup yet")
+    rb.add_argument('directory')
+
+    args = parser.parse_args(argv)
+    store = ResultsStore(args.directory)
+    if args.command == 'query':
+        end = time.time()
+        start = end - args.days * 86400
+        resolution = args.resolution if args.resolution is not None else (end - start) / 1000
+        t0 = time.perf_counter()
+        result = store.query(args.field, start, end, resolution, args.stat)
+        elapsed = (time.perf_counter() - t0) * 1000
+        print(f"{len(result.time)} rows from level {result.level} in {elapsed:.2f} ms", flush=True)
+        if len(result.time) and args.field != 'harmonics':
+            for label, column in zip(store.schema['labels'], result.values.T):
+                print(f"  {label}: min {column.min():.3f} | mean {column.mean():.3f} | max {column.max():.3f}",
+                      flush=True)
+    else:
+        last = store._last_time('raw')
+        # The bucket holding the last row may still be filling; it is left to the writer
+        written = store.catch_up(last) if last is not None else {}
+        for level, n in written.items():
+            print(f"{level}: {n} buckets", flush=True)
+        store.close()
+
+if __name__ == "__main__":
+    main()
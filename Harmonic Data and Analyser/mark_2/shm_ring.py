@@ -0,0 +1,162 @@
+import os
+import numpy as np
+from multiprocessing import shared_memory, resource_tracker
+
+# Header layout (int64 words); the rest of the header is reserved
+HEADER_WORDS = 64
+MAGIC = 0x48524E47  # "HRNG"
+H_MAGIC, H_ROWS, H_FRAME_LEN, H_CAPACITY, H_SAMPLE_RATE, H_WRITE_BEGIN, H_WRITE_END = range(7)
+# Words 8..23: per-reader cursor, the first frame that reader still needs (-1 = slot free)
+H_READERS = 8
+MAX_READERS = 16
+FREE = -1
+
+DEFAULT_RING_NAME = 'harmonic_ring'
+
+def _attach_shm(name):
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Before Python 3.13 consumers register the segment with the resource
+        # tracker, which unlinks the producer's ring when the consumer exits
+        shm = shared_memory.SharedMemory(name=name)
+        if os.name == 'posix':
+            resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
+
+class ShmRing:
+    """Lock-free single-producer / multi-consumer ring of float64 frames in shared memory.
+
+    A frame is an (n_rows, frame_len) block; row 0 holds Time(ms) and the other rows
+    hold the channels. Every frame is stored twice, at its slot and at slot + capacity,
+    so any run of up to `capacity` consecutive frames is one contiguous slice and
+    consumers get it as a zero-copy view.
+
+    The producer bumps WRITE_BEGIN before touching a slot and WRITE_END after, so a
+    consumer can confirm with is_intact() that a view was not overwritten while it
+    was being used.
+
+    Consumers that must not miss frames claim a reader slot and keep its cursor at the
+    first frame they still need; the producer checks headroom() before publishing and
+    holds off while the slowest of them is a full ring behind. Each slot has a single
+    writer (its reader), so no locking is needed.
+    """
+
+    def __init__(self, shm, owner):
+        self.shm = shm
+        self.owner = owner
+        self.header = np.ndarray((HEADER_WORDS,), dtype=np.int64, buffer=shm.buf)
+        if self.header[H_MAGIC] != MAGIC:
+            raise ValueError(f"Shared memory '{shm.name}' is not a harmonic ring")
+        self.n_rows = int(self.header[H_ROWS])
+        self.frame_len = int(self.header[H_FRAME_LEN])
+        self.capacity = int(self.header[H_CAPACITY])
+        self.sample_rate = int(self.header[H_SAMPLE_RATE])
+        self.data = np.ndarray((self.n_rows, 2 * self.capacity * self.frame_len), dtype=np.float64,
+                               buffer=shm.buf, offset=HEADER_WORDS * 8)
+        self.cursors = self.header[H_READERS:H_READERS + MAX_READERS]
+
+    @classmethod
+    def create(cls, name, n_rows, frame_len, capacity=16, sample_rate=0):
+        size = HEADER_WORDS * 8 + n_rows * 2 * capacity * frame_len * 8
+        try:
+            shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            # Left behind by a producer that was killed; replace it
+            stale = _attach_shm(name)
+            stale.close()
+            stale.unlink()
+            shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        header = np.ndarray((HEADER_WORDS,), dtype=np.int64, buffer=shm.buf)
+        header[:] = 0
+        header[H_ROWS] = n_rows
+        header[H_FRAME_LEN] = frame_len
+        header[H_CAPACITY] = capacity
+        header[H_SAMPLE_RATE] = sample_rate
+        header[H_READERS:H_READERS + MAX_READERS] = FREE
+        header[H_MAGIC] = MAGIC
+        del header
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name):
+        return cls(_attach_shm(name), owner=False)
+
+    @property
+    def sequence(self):
+        """Number of frames published so far."""
+        return int(self.header[H_WRITE_END])
+
+    def publish(self, frame):
+        """Copy an (n_rows, frame_len) frame into the next slot and return its sequence number."""
+        seq = int(self.header[H_WRITE_END])
+        self.header[H_WRITE_BEGIN] = seq + 1
+        start = (seq % self.capacity) * self.frame_len
+        mirror = start + self.capacity * self.frame_len
+        self.data[:, start:start + self.frame_len] = frame
+        self.data[:, mirror:mirror + self.frame_len] = frame
+        self.header[H_WRITE_END] = seq + 1
+        return seq
+
+    def window(self, n_frames, end_seq=None):
+        """Return (view, first_seq) for frames [end_seq - n_frames, end_seq).
+
+        The view has shape (n_rows, n_frames * frame_len) and aliases the ring; it is
+        None until enough frames have been published.
+        """
+        if n_frames > self.capacity:
+            raise ValueError(f"window of {n_frames} frames exceeds ring capacity {self.capacity}")
+        end = self.sequence if end_seq is None else end_seq
+        first = end - n_frames
+        if first < 0:
+            return None, first
+        start = (first % self.capacity) * self.frame_len
+        return self.data[:, start:start + n_frames * self.frame_len], first
+
+    def is_intact(self, first_seq):
+        """True if no frame from first_seq onward has been overwritten."""
+        return int(self.header[H_WRITE_BEGIN]) - first_seq <= self.capacity
+
+    def claim(self, slot, start):
+        """Take reader slot `slot`, starting at frame `start` unless it is still held.
+
+        A slot left held by a reader that died (and was not released) is resumed where
+        that reader stopped. Returns the slot's cursor.
+        """
+        if not 0 <= slot < MAX_READERS:
+            raise ValueError(f"reader slot must be in [0, {MAX_READERS})")
+        if self.cursors[slot] == FREE:
+            self.cursors[slot] = max(start, 0)
+        return int(self.cursors[slot])
+
+    def advance(self, slot, seq):
+        """Frames before seq are no longer needed by this reader."""
+        self.cursors[slot] = max(seq, 0)
+
+    def release(self, slot):
+        self.cursors[slot] = FREE
+
+    def slowest(self):
+        """Lowest cursor over the claimed reader slots, or None when there are none."""
+        active = self.cursors[self.cursors != FREE]
+        return int(active.min()) if len(active) else None
+
+    def headroom(self):
+        """Frames that can be published before one a reader still needs is overwritten."""
+        slowest = self.slowest()
+        if slowest is None:
+            return self.capacity
+        return self.capacity - (self.sequence - slowest)
+
+    def lags(self):
+        """{slot: frames published beyond the reader's cursor} for the claimed slots."""
+        seq = self.sequence
+        return {int(k): seq - int(c) for k, c in enumerate(self.cursors) if c != FREE}
+
+    def close(self):
+        self.header = None
+        self.cursors = None
+        self.data = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
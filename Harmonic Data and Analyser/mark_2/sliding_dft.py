@@ -0,0 +1,58 @@
+import numpy as np
+from scipy.fft import rfft
+
+class SlidingHarmonicBank:
+    """Sliding DFT over a fixed set of bins, advanced one hop of samples at a time.
+
+    With W = exp(-2j*pi/N), moving an N-sample window forward by H samples gives
+
+        X'_k = W^(-k*H) * (X_k + sum_m (x_new[m] - x_old[m]) * W^(k*m)),  m = 0..H-1
+
+    so each hop costs one (channels x H) @ (H x bins) product instead of a full FFT.
+    The running sum of squares gives the window RMS the same way. reset() re-anchors
+    the state on an exact FFT to clear accumulated rounding error.
+
+    With window='hann' the bank also tracks both neighbours of every bin, since a
+    periodic Hann window in the time domain is X_k/2 - (X_(k-1) + X_(k+1))/4 in the
+    frequency domain; magnitudes() then matches the analyzer's Hann FFT.
+    """
+
+    def __init__(self, window_len, hop, bins, n_channels, window=None):
+        if hop > window_len:
+            raise ValueError("hop must not exceed the window length")
+        if window not in (None, 'hann'):
+            raise ValueError("window must be None or 'hann'")
+        self.window_len = window_len
+        self.hop = hop
+        self.bins = np.asarray(bins)
+        self.window = window
+        tracked = self.bins if window is None else (self.bins[:, None] + np.array([-1, 0, 1])).ravel()
+        self.tracked = tracked
+        m = np.arange(hop)
+        self.kernel = np.exp(-2j * np.pi * np.outer(m, tracked) / window_len)
+        self.rotate = np.exp(2j * np.pi * tracked * hop / window_len)
+        self.spectrum = np.zeros((n_channels, len(tracked)), dtype=complex)
+        self.sum_sq = np.zeros(n_channels)
+
+    def reset(self, window):
+        """Load the exact state for a (channels x window_len) block."""
+        self.spectrum = rfft(window, axis=-1)[:, self.tracked]
+        self.sum_sq = np.sum(np.square(window, dtype=np.float64), axis=-1)
+
+    def update(self, x_old, x_new):
+        """Slide by one hop; x_old leaves the window and x_new enters it, both (channels x hop)."""
+        self.spectrum += (x_new - x_old) @ self.kernel
+        self.spectrum *= self.rotate
+        self.sum_sq += np.sum(np.square(x_new, dtype=np.float64), axis=-1)
+        self.sum_sq -= np.sum(np.square(x_old, dtype=np.float64), axis=-1)
+
+    def magnitudes(self):
+        """Peak amplitude of every bin, scaled like the analyzer's full FFT."""
+        if self.window is None:
+            return np.abs(self.spectrum) * (2 / self.window_len)
+        x = self.spectrum.reshape(len(self.spectrum), -1, 3)
+        # The Hann window's mean is 1/2
+        return np.abs(x[..., 1] / 2 - (x[..., 0] + x[..., 2]) / 4) * (4 / self.window_len)
+
+    def rms(self):
+        return np.sqrt(np.maximum(self.sum_sq, 0) / self.window_len)
@@ -0,0 +1,154 @@
+import json
+import zlib
+import struct
+import numpy as np
+
+# Compact waveform encoding: samples are quantized to a declared resolution, stored as
+# zigzagged deltas in the narrowest integer width that holds the chunk, byte-shuffled
+# so the (mostly zero) high bytes sit together, then optionally zlib-compressed.
+MAGIC = b'WVC1'
+DEFAULT_LEVEL = 1  # zlib level; higher levels gain little on shuffled deltas
+CODECS = {'none': 0, 'zlib': 1}
+WIDTHS = (1, 2, 4, 8)
+# body bytes, channels, samples, integer width, codec
+CHUNK_HEADER = struct.Struct('<IIIBB')
+FILE_HEADER = struct.Struct('<4sI')  # magic, JSON metadata length
+
+def _resolution(resolution, n_channels):
+    res = np.asarray(resolution, dtype=np.float64).reshape(-1, 1)
+    if len(res) == 1:
+        res = np.repeat(res, n_channels, axis=0)
+    if len(res) != n_channels or np.any(res <= 0):
+        raise ValueError(f"need one positive resolution, or one per channel ({n_channels})")
+    return res
+
+def _tolerance(values, res):
+    # Half a step, plus the float64 rounding of values that sit exactly halfway
+    return res[:, 0] / 2 + 4 * np.spacing(np.max(np.abs(values), axis=-1, initial=0))
+
+def quantize(values, resolution):
+    """Integer multiples of resolution (int64); raises ValueError if any sample would be
+    off by more than half a step (NaN, infinity, or beyond float64 precision)."""
+    values = np.atleast_2d(values)
+    res = _resolution(resolution, len(values))
+    scaled = np.rint(values / res)
+    if not np.all(np.isfinite(scaled)) or np.max(np.abs(scaled), initial=0) >= 2**62:
+        raise ValueError("samples are not finite or too large for the resolution")
+    q = scaled.astype(np.int64)
+    err = np.max(np.abs(q * res - values), axis=-1, initial=0)
+    if np.any(err > _tolerance(values, res)):
+        raise ValueError(f"quantization error {err.max():g} exceeds half the resolution")
+    return q
+
+def zigzag(d):
+    """Signed to unsigned so small negative deltas stay small: 0, -1, 1, -2 -> 0, 1, 2, 3."""
+    return ((d << 1) ^ (d >> 63)).view(np.uint64)
+
+def unzigzag(z):
+    return (z >> np.uint64(1)).view(np.int64) ^ -(z & np.uint64(1)).view(np.int64)
+
+def encode_chunk(values, resolution, codec='zlib', level=DEFAULT_LEVEL):
+    """Encode a (channels x samples) block; returns bytes."""
+    q = quantize(values, resolution)
+    n_channels, n = q.shape
+    z = zigzag(np.diff(q, axis=-1, prepend=q[:, :1]))
+    top = int(z.max(initial=0))
+    width = next(w for w in WIDTHS if w == 8 or top < 1 << (8 * w))
+    # Byte planes: all least significant bytes first, the most significant last
+    planes = z.astype(f'<u{width}', order='C').view(np.uint8).reshape(n_channels, n, width).transpose(2, 0, 1)
+    body = planes.tobytes()
+    if codec == 'zlib':
+        body = zlib.compress(body, level)
+    header = CHUNK_HEADER.pack(len(body), n_channels, n, width, CODECS[codec])
+    return header + q[:, 0].astype('<i8').tobytes() + body
+
+def decode_chunk(buf, resolution, offset=0):
+    """Decode the chunk at buf[offset:]; returns (float64 channels x samples, next offset)."""
+    size, n_channels, n, width, codec = CHUNK_HEADER.unpack_from(buf, offset)
+    pos = offset + CHUNK_HEADER.size
+    first = np.frombuffer(buf, '<i8', n_channels, pos)
+    pos += 8 * n_channels
+    body = bytes(buf[pos:pos + size])
+    if codec == CODECS['zlib']:
+        body = zlib.decompress(body)
+    planes = np.frombuffer(body, np.uint8).reshape(width, n_channels, n)
+    z = np.ascontiguousarray(planes.transpose(1, 2, 0)).view(f'<u{width}')[..., 0].astype(np.uint64)
+    # The first delta is zero by construction, so the running sum starts at the first sample
+    q = np.cumsum(unzigzag(z), axis=-1) + first[:, None]
+    return q * _resolution(resolution, n_channels), pos + size
+
+def max_roundtrip_error(values, encoded, resolution):
+    """Per-channel largest |decoded - original|."""
+    decoded, _ = decode_chunk(encoded, resolution)
+    return np.max(np.abs(decoded - np.atleast_2d(values)), axis=-1, initial=0)
+
+def check_roundtrip(values, encoded, resolution):
+    """Raise ValueError unless every decoded sample is within half a resolution step."""
+    values = np.atleast_2d(values)
+    err = max_roundtrip_error(values, encoded, resolution)
+    if np.any(err > _tolerance(values, _resolution(resolution, len(values)))):
+        raise ValueError(f"round-trip error {err.max():g} exceeds the declared resolution")
+    return err
+
+class WaveWriter:
+    """Stream (channels x samples) blocks into a .wvc file, one encoded chunk per write().
+
+    The file starts with MAGIC and a JSON header holding the resolution and any extra
+    metadata passed as keyword arguments. With verify=True every chunk is decoded again
+    and checked against the declared resolution before it is written.
+    """
+
+    def __init__(self, path, resolution, codec='zlib', level=DEFAULT_LEVEL, verify=False, **meta):
+        self.resolution = resolution
+        self.codec = codec
+        self.level = level
+        self.verify = verify
+        self.meta = dict(meta, resolution=np.asarray(resolution, dtype=np.float64).tolist(), codec=codec)
+        self.f = open(path, 'wb')
+        header = json.dumps(self.meta).encode()
+        self.f.write(FILE_HEADER.pack(MAGIC, len(header)) + header)
+        self.samples = 0
+
+    def write(self, block):
+        encoded = encode_chunk(block, self.resolution, self.codec, self.level)
+        if self.verify:
+            check_roundtrip(block, encoded, self.resolution)
+        self.f.write(encoded)
+        self.samples += np.shape(block)[-1]
+        return len(encoded)
+
+    def close(self):
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def read_header(buf):
+    """(metadata, offset of the first chunk) of a .wvc file's contents."""
+    magic, length = FILE_HEADER.unpack_from(buf, 0)
+    if magic != MAGIC:
+        raise ValueError("not a .wvc file")
+    start = FILE_HEADER.size
+    return json.loads(bytes(buf[start:start + length])), start + length
+
+def _blocks(buf):
+    meta, pos = read_header(buf)
+    while pos < len(buf):
+        block, pos = decode_chunk(buf, meta['resolution'], pos)
+        yield block
+
+def iter_chunks(path):
+    """Yield the decoded blocks of a .wvc file in order."""
+    with open(path, 'rb') as f:
+        yield from _blocks(f.read())
+
+def load(path, axis=-1, dtype=np.float64):
+    """(metadata, all blocks of a .wvc file concatenated along axis)."""
+    with open(path, 'rb') as f:
+        buf = f.read()
+    meta, _ = read_header(buf)
+    blocks = [block.astype(dtype, copy=False) for block in _blocks(buf)]
+    return meta, np.concatenate(blocks, axis=axis)
@@ -0,0 +1,30 @@
+import numpy as np
+
+class HarmonicBasis:
+    """Precomputed sin/cos tables for harmonic orders over a fixed time grid.
+
+    m * sin(w*t + p) = m*cos(p) * sin(w*t) + m*sin(p) * cos(w*t), so any mix of
+    harmonics is a small matrix product with the two tables instead of fresh np.sin
+    calls for every harmonic.
+    """
+
+    def __init__(self, t, base_freq, orders):
+        self.t = t
+        self.orders = np.asarray(orders)
+        arg = 2 * np.pi * base_freq * np.outer(self.orders, t)
+        self.sin = np.sin(arg)
+        self.cos = np.cos(arg)
+
+    def coefficients(self, magnitudes, phases_deg):
+        phases = np.radians(phases_deg)
+        return magnitudes * np.cos(phases), magnitudes * np.sin(phases)
+
+    def components(self, magnitudes, phases_deg):
+        """One trace per order, shape (orders, samples)."""
+        a, b = self.coefficients(np.asarray(magnitudes, dtype=float), phases_deg)
+        return a[:, None] * self.sin + b[:, None] * self.cos
+
+    def combine(self, magnitudes, phases_deg):
+        """Summed signal; magnitudes and phases may be (orders,) or a batch (configs, orders)."""
+        a, b = self.coefficients(np.asarray(magnitudes, dtype=float), phases_deg)
+        return a @ self.sin + b @ self.cos
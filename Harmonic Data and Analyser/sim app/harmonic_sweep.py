@@ -0,0 +1,190 @@
+import json
+import time
+import argparse
+import numpy as np
+from harmonic_basis import HarmonicBasis
+
+# Same time grid as the visualizers
+fs = 5000  # Sampling frequency
+t = np.linspace(0, 0.1, int(0.1 * fs), endpoint=False)
+base_freq = 50  # Fundamental frequency
+ORDERS = list(range(1, 20))  # fundamental plus the visualizer's 2x-19x harmonics
+CHUNK = 8192  # configurations synthesized per batch
+
+def parse_range(text):
+    """'5=0:10:21' -> (5, linspace(0, 10, 21)); '5=0,2.5,5' -> (5, [0, 2.5, 5])."""
+    order, sep, values = text.partition('=')
+    if not sep:
+        raise ValueError(f"expected ORDER=START:STOP:NUM or ORDER=V1,V2,..., got {text!r}")
+    if ':' in values:
+        start, stop, num = values.split(':')
+        values = np.linspace(float(start), float(stop), int(num))
+    else:
+        values = np.array([float(v) for v in values.split(',')])
+    return int(order), values
+
+def parse_fixed(text):
+    """'3=1.5@30' -> (3, 1.5, 30.0); the phase defaults to 0."""
+    order, sep, value = text.partition('=')
+    if not sep:
+        raise ValueError(f"expected ORDER=MAG[@PHASE], got {text!r}")
+    mag, _, phase = value.partition('@')
+    return int(order), float(mag), float(phase or 0)
+
+class HarmonicSweep:
+    """Every combination of the given magnitude and phase ranges, evaluated in batches.
+
+    params is a list of (order, 'magnitude' | 'phase', values), the same parameters
+    as HarmonicVisualizer.harmonics; fixed maps order -> (magnitude, phase) for the
+    harmonics that are not swept (default 0). Configuration i is decoded from its flat
+    index with np.unravel_index, so the grid itself is never materialized.
+    """
+
+    def __init__(self, params, fixed=None, orders=ORDERS):
+        self.params = [(order, key, np.asarray(values, dtype=float)) for order, key, values in params]
+        seen = set()
+        for order in [order for order, _, _ in self.params] + list(fixed or {}):
+            if order not in orders:
+                raise ValueError(f"harmonic order {order} is not one of {orders[0]}..{orders[-1]}")
+        for order, key, values in self.params:
+            if (order, key) in seen:
+                raise ValueError(f"the {key} of order {order} is swept twice")
+            if len(values) == 0:
+                raise ValueError(f"the {key} range of order {order} is empty")
+            seen.add((order, key))
+        self.basis = HarmonicBasis(t, base_freq, orders)
+        self.position = {order: i for i, order in enumerate(orders)}
+        self.shape = tuple(len(values) for _, _, values in self.params)
+        self.size = int(np.prod(self.shape))
+
+        self.base_mags = np.zeros(len(orders))
+        self.base_phases = np.zeros(len(orders))
+        self.base_mags[self.position[1]] = 1.0
+        for order, (mag, phase) in (fixed or {}).items():
+            self.base_mags[self.position[order]] = mag
+            self.base_phases[self.position[order]] = phase
+
+        # Harmonics that are not swept add the same waveform to every configuration
+        self.swept = sorted({self.position[order] for order, _, _ in self.params})
+        self.swept_basis = HarmonicBasis(t, base_freq, np.asarray(orders)[self.swept])
+        static_mags = self.base_mags.copy()
+        static_mags[self.swept] = 0
+        self.static = self.basis.combine(static_mags, self.base_phases)
+
+        n = len(t)
+        self.harmonic_bins = np.rint(np.asarray(orders) * base_freq * n / fs).astype(int)
+        self.fundamental_col = self.position[1]
+        self.dtype = np.dtype([(f"h{order}_{key[:3]}", '<f4') for order, key, _ in self.params] +
+                              [('thd', '<f4'), ('rms', '<f4'), ('peak', '<f4'), ('crest', '<f4')])
+
+    def configurations(self, start, stop):
+        """(magnitudes, phases), each (configs x orders), for flat indexes start..stop-1."""
+        coords = np.unravel_index(np.arange(start, stop), self.shape)
+        mags = np.tile(self.base_mags, (stop - start, 1))
+        phases = np.tile(self.base_phases, (stop - start, 1))
+        for (order, key, values), idx in zip(self.params, coords):
+            target = mags if key == 'magnitude' else phases
+            target[:, self.position[order]] = values[idx]
+        return coords, mags, phases
+
+    def evaluate(self, start, stop):
+        """Result table rows for configurations start..stop-1."""
+        coords, mags, phases = self.configurations(start, stop)
+        signals = self.swept_basis.combine(mags[:, self.swept], phases[:, self.swept])
+        signals += self.static
+        n = signals.shape[-1]
+
+        magnitude = np.abs(np.fft.rfft(signals, axis=-1)[:, self.harmonic_bins]) * (2 / n)
+        fundamental = magnitude[:, self.fundamental_col]
+        harmonics = np.delete(magnitude, self.fundamental_col, axis=1)
+        rms = np.sqrt(np.mean(np.square(signals), axis=-1))
+        peak = np.max(np.abs(signals), axis=-1)
+
+        rows = np.empty(stop - start, dtype=self.dtype)
+        for (order, key, values), idx, name in zip(self.params, coords, self.dtype.names):
+            rows[name] = values[idx]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rows['thd'] = 100 * np.sqrt(np.sum(np.square(harmonics), axis=-1)) / fundamental
+            rows['crest'] = peak / rms
+        rows['rms'] = rms
+        rows['peak'] = peak
+        return rows
+
+    def chunks(self, chunk=CHUNK):
+        """Yield (start, rows) through the whole grid, chunk configurations at a time."""
+        for start in range(0, self.size, chunk):
+            stop = min(start + chunk, self.size)
+            yield start, self.evaluate(start, stop)
+
+    def run(self, out_path, chunk=CHUNK, thd_limit=None):
+        """Write the table to out_path (.npy) and a .json sidecar; returns the sidecar dict."""
+        table = np.lib.format.open_memmap(out_path, mode='w+', dtype=self.dtype, shape=(self.size,))
+        over = 0
+        worst = None
+        for start, rows in self.chunks(chunk):
+            table[start:start + len(rows)] = rows
+            if thd_limit is not None:
+                over += int(np.count_nonzero(rows['thd'] > thd_limit))
+            if np.isnan(rows['thd']).all():
+                # No fundamental anywhere in this chunk, so no THD to rank
+                continue
+            i = int(np.nanargmax(rows['thd']))
+            if worst is None or rows['thd'][i] > worst[1]:
+                worst = (start + i, float(rows['thd'][i]))
+        table.flush()
+        del table
+
+        summary = {
+            'configurations': self.size,
+            'shape': list(self.shape),
+            'params': [{'order': order, 'key': key, 'values': values.tolist()} for order, key, values in self.params],
+            'fixed': {str(order): [float(self.base_mags[i]), float(self.base_phases[i])]
+                      for order, i in self.position.items() if self.base_mags[i] or self.base_phases[i]},
+            'sample_rate': fs,
+            'base_freq': base_freq,
+            'worst_index': worst and worst[0],
+            'worst_thd': worst and worst[1],
+        }
+        if thd_limit is not None:
+            summary['thd_limit'] = thd_limit
+            summary['over_limit'] = over
+        with open(out_path.rsplit('.npy', 1)[0] + '.json', 'w') as f:
+            json.dump(summary, f, indent=2)
+        return summary
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sweep harmonic magnitude/phase combinations")
+    parser.add_argument('--mag', action='append', default=[], metavar='ORDER=START:STOP:NUM',
+                        help="magnitude range for one harmonic, e.g. 5=0:10:21 or 5=0,2.5,5")
+    parser.add_argument('--phase', action='append', default=[], metavar='ORDER=START:STOP:NUM',
+                        help="phase range in degrees, e.g. 7=0:360:37")
+    parser.add_argument('--fixed', action='append', default=[], metavar='ORDER=MAG[@PHASE]',
+                        help="hold a harmonic that is not swept, e.g. 3=1.5@30")
+    parser.add_argument('--thd-limit', type=float, help="count configurations above this THD (%%)")
+    parser.add_argument('--chunk', type=int, default=CHUNK, help="configurations per batch")
+    parser.add_argument('--out', default='harmonic_sweep.npy', help="output table (.npy)")
+    args = parser.parse_args(argv)
+
+    try:
+        params = [(order, 'magnitude', values) for order, values in map(parse_range, args.mag)]
+        params += [(order, 'phase', values) for order, values in map(parse_range, args.phase)]
+        fixed = {order: (mag, phase) for order, mag, phase in map(parse_fixed, args.fixed)}
+        if not params:
+            parser.error("give at least one --mag or --phase range")
+        sweep = HarmonicSweep(params, fixed)
+    except ValueError as e:
+        parser.error(str(e))
+    print(f"Sweeping {sweep.size} configurations {sweep.shape} -> {args.out}", flush=True)
+    start = time.time()
+    summary = sweep.run(args.out, args.chunk, args.thd_limit)
+    elapsed = time.time() - start
+    print(f"Done in {elapsed:.2f}s ({sweep.size / elapsed:.0f} configurations/s)", flush=True)
+    if summary['worst_index'] is None:
+        print("No configuration has a fundamental, so THD is undefined throughout", flush=True)
+    else:
+        print(f"Highest THD {summary['worst_thd']:.2f}% at configuration {summary['worst_index']}", flush=True)
+    if args.thd_limit is not None:
+        print(f"{summary['over_limit']} configurations above {args.thd_limit}% THD", flush=True)
+
+if __name__ == "__main__":
+    main()
@@ -3,12 +3,14 @@ import matplotlib.pyplot as plt
 import tkinter as tk
 from tkinter import ttk
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+from harmonic_basis import HarmonicBasis
 
 # Constants
 fs = 5000  # Sampling frequency
 T = 1 / fs
 t = np.linspace(0, 0.1, int(0.1 * fs), endpoint=False)
 base_freq = 50  # Fundamental frequency
+REDRAW_DELAY_MS = 30  # coalesce slider events into at most one redraw per interval
 
 class HarmonicVisualizer:
     def __init__(self, root):
@@ -16,6 +18,9 @@ class HarmonicVisualizer:
         self.root.title("FFT Signal Analysis")
 
         self.harmonics = {n: {"magnitude": 0, "phase": 0} for n in range(2, 8)}
+        self.basis = HarmonicBasis(t, base_freq, [1] + list(self.harmonics))
+        self.redraw_pending = None
+        self.artists = None
 
         self.create_widgets()
         self.update_plot()
@@ -48,32 +53,31 @@ class HarmonicVisualizer:
 
     def set_and_update(self, harmonic, key, value):
         self.harmonics[harmonic][key] = float(value)
-        self.update_plot()
+        if self.redraw_pending is None:
+            self.redraw_pending = self.root.after(REDRAW_DELAY_MS, self.flush_redraw)
 
-    def generate_signal_components(self):
-        fundamental = np.sin(2 * np.pi * base_freq * t)
-        harmonic_signals = {1: fundamental}
-        for n in range(2, 8):
-            mag = self.harmonics[n]["magnitude"]
-            phase = np.radians(self.harmonics[n]["phase"])
-            harmonic_signals[n] = mag * np.sin(2 * np.pi * n * base_freq * t + phase)
-        return harmonic_signals
+    def flush_redraw(self):
+        self.redraw_pending = None
+        self.update_plot()
 
-    def update_plot(self):
-        components = self.generate_signal_components()
-        signal = sum(components.values())
+    def harmonic_arrays(self):
+        mags = np.array([1.0] + [h["magnitude"] for h in self.harmonics.values()])
+        phases = np.array([0.0] + [h["phase"] for h in self.harmonics.values()])
+        return mags, phases
 
-        # Clear axes
-        self.ax1.cla()
-        self.ax2.cla()
+    def generate_signal_components(self):
+        mags, phases = self.harmonic_arrays()
+        return dict(zip(self.basis.orders, self.basis.components(mags, phases)))
 
-        # Time-domain plot
+    def build_plot(self, components, signal, fft_freqs, magnitude):
+        """Create every artist once; later updates only change their data."""
         colors = ['blue', 'orange', 'green', 'red', 'purple', 'brown', 'pink']
-        self.ax1.plot(t, signal, label="Combined Signal", color='black', linewidth=1.5)
-
-        for i, (n, comp) in enumerate(components.items()):
+        combined, = self.ax1.plot(t, signal, label="Combined Signal", color='black', linewidth=1.5)
+        component_lines = []
+        for n, comp in components.items():
             label = f"{n}x Harmonic" if n > 1 else "Fundamental"
-            self.ax1.plot(t, comp, label=label, linestyle='--', color=colors[n % len(colors)])
+            line, = self.ax1.plot(t, comp, label=label, linestyle='--', color=colors[n % len(colors)])
+            component_lines.append(line)
 
         self.ax1.set_xlim(0, 0.1)
         self.ax1.set_xlabel("Seconds")
@@ -82,19 +86,40 @@ class HarmonicVisualizer:
         self.ax1.grid(True)
         self.ax1.legend(loc='upper right')
 
-        # Frequency-domain plot
-        fft_vals = np.fft.fft(signal)
-        fft_freqs = np.fft.fftfreq(len(signal), 1/fs)
-        half_n = len(signal) // 2
-
-        self.ax2.bar(fft_freqs[:half_n], 2/len(signal) * np.abs(fft_vals[:half_n]), width=2.5, color='blue')
+        bars = self.ax2.bar(fft_freqs, magnitude, width=2.5, color='blue')
         self.ax2.set_xlim(0, 400)
         self.ax2.set_xlabel("Frequency (Hz)")
         self.ax2.set_ylabel("Magnitude")
         self.ax2.set_title("FFT Spectrum")
         self.ax2.grid(True)
 
-        self.canvas.draw()
+        self.artists = (combined, component_lines, bars)
+
+    def update_plot(self):
+        components = self.generate_signal_components()
+        signal = self.basis.combine(*self.harmonic_arrays())
+
+        # Frequency-domain values; only the bars inside the 0-400 Hz view are drawn
+        half_n = len(signal) // 2
+        fft_freqs = np.fft.rfftfreq(len(signal), 1/fs)[:half_n]
+        magnitude = 2/len(signal) * np.abs(np.fft.rfft(signal)[:half_n])
+        visible = fft_freqs <= 400
+        fft_freqs, magnitude = fft_freqs[visible], magnitude[visible]
+
+        if self.artists is None:
+            self.build_plot(components, signal, fft_freqs, magnitude)
+        else:
+            combined, component_lines, bars = self.artists
+            combined.set_ydata(signal)
+            for line, comp in zip(component_lines, components.values()):
+                line.set_ydata(comp)
+            for bar, height in zip(bars, magnitude):
+                bar.set_height(height)
+
+        self.ax1.relim()
+        self.ax1.autoscale_view(scalex=False)
+        self.ax2.set_ylim(0, 1.05 * magnitude.max())
+        self.canvas.draw_idle()
 
 if __name__ == "__main__":
     root = tk.Tk()
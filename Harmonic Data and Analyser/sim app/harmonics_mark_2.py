@@ -3,12 +3,14 @@ import matplotlib.pyplot as plt
 import tkinter as tk
 from tkinter import ttk
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+from harmonic_basis import HarmonicBasis
 
 # Constants
 fs = 5000  # Sampling frequency
 T = 1 / fs
 t = np.linspace(0, 0.1, int(0.1 * fs), endpoint=False)
 base_freq = 50  # Fundamental frequency
+REDRAW_DELAY_MS = 30  # coalesce slider events into at most one redraw per interval
 
 class HarmonicVisualizer:
     def __init__(self, root):
@@ -22,13 +24,17 @@ class HarmonicVisualizer:
 
         self.root.configure(bg=self.bg_colors[self.theme])
         self.harmonics = {n: {"magnitude": 0, "phase": 0} for n in range(2, 20)}
+        self.basis = HarmonicBasis(t, base_freq, [1] + list(self.harmonics))
+        self.redraw_pending = None
+        self.artists = None
         self.create_widgets()
         self.update_plot()
 
     def toggle_theme(self):
         self.theme = "dark" if self.theme == "light" else "light"
         self.root.configure(bg=self.bg_colors[self.theme])
-        self.update_plot()
+        self.apply_theme()
+        self.canvas.draw_idle()
 
     def create_widgets(self):
         # Theme toggle button
@@ -82,31 +88,31 @@ class HarmonicVisualizer:
 
     def set_and_update(self, harmonic, key, value):
         self.harmonics[harmonic][key] = float(value)
-        self.update_plot()
+        if self.redraw_pending is None:
+            self.redraw_pending = self.root.after(REDRAW_DELAY_MS, self.flush_redraw)
 
-    def generate_signal_components(self):
-        fundamental = np.sin(2 * np.pi * base_freq * t)
-        harmonic_signals = {1: fundamental}
-        for n in self.harmonics:
-            mag = self.harmonics[n]["magnitude"]
-            phase = np.radians(self.harmonics[n]["phase"])
-            harmonic_signals[n] = mag * np.sin(2 * np.pi * n * base_freq * t + phase)
-        return harmonic_signals
+    def flush_redraw(self):
+        self.redraw_pending = None
+        self.update_plot()
 
-    def update_plot(self):
-        components = self.generate_signal_components()
-        signal = sum(components.values())
+    def harmonic_arrays(self):
+        mags = np.array([1.0] + [h["magnitude"] for h in self.harmonics.values()])
+        phases = np.array([0.0] + [h["phase"] for h in self.harmonics.values()])
+        return mags, phases
 
-        self.ax1.cla()
-        self.ax2.cla()
+    def generate_signal_components(self):
+        mags, phases = self.harmonic_arrays()
+        return dict(zip(self.basis.orders, self.basis.components(mags, phases)))
 
-        # Time Domain Plot
+    def build_plot(self, components, signal, fft_freqs, magnitude):
+        """Create every artist once; later updates only change their data."""
         colors = ['blue', 'orange', 'green', 'red', 'purple', 'brown', 'pink', 'gray', 'olive', 'cyan']
-        self.ax1.plot(t, signal, label="Combined Signal", color='yellow', linewidth=1.8)
-
-        for i, (n, comp) in enumerate(components.items()):
+        combined, = self.ax1.plot(t, signal, label="Combined Signal", color='yellow', linewidth=1.8)
+        component_lines = []
+        for n, comp in components.items():
             label = f"{n}x Harmonic" if n > 1 else "Fundamental"
-            self.ax1.plot(t, comp, label=label, linestyle='--', color=colors[n % len(colors)])
+            line, = self.ax1.plot(t, comp, label=label, linestyle='--', color=colors[n % len(colors)])
+            component_lines.append(line)
 
         self.ax1.set_xlim(0, 0.1)
         self.ax1.set_xlabel("Time (s)")
@@ -115,29 +121,26 @@ class HarmonicVisualizer:
         self.ax1.grid(True)
         self.ax1.legend(loc='upper right', fontsize=9)
 
-        # Frequency Domain Plot
-        fft_vals = np.fft.fft(signal)
-        fft_freqs = np.fft.fftfreq(len(signal), 1/fs)
-        half_n = len(signal) // 2
-        magnitude = 2 / len(signal) * np.abs(fft_vals[:half_n])
-
-        self.ax2.plot(fft_freqs[:half_n], magnitude, color='darkcyan', linewidth=1.5)
+        spectrum, = self.ax2.plot(fft_freqs, magnitude, color='darkcyan', linewidth=1.5)
         self.ax2.set_xlim(0, 1000)
         self.ax2.set_xlabel("Frequency (Hz)")
         self.ax2.set_ylabel("Magnitude (V)")
         self.ax2.set_title("FFT Spectrum (0–1000 Hz)", fontsize=12)
         self.ax2.grid(True)
 
+        annotations = []
         for h in range(1, 20):
             freq = h * base_freq
-            idx = np.argmin(np.abs(fft_freqs - freq))
-            mag = magnitude[idx]
+            mag = magnitude[self.harmonic_bins[h - 1]]
             self.ax2.axvline(x=freq, color='red', linestyle='--', alpha=0.4)
-            self.ax2.annotate(f"{h}x\n{freq}Hz", xy=(freq, mag), xytext=(freq + 5, mag + 0.5),
-                              textcoords="data", fontsize=8, color='red',
-                              arrowprops=dict(arrowstyle='->', color='red', lw=0.5))
+            annotations.append(self.ax2.annotate(f"{h}x\n{freq}Hz", xy=(freq, mag), xytext=(freq + 5, mag + 0.5),
+                                                 textcoords="data", fontsize=8, color='red',
+                                                 arrowprops=dict(arrowstyle='->', color='red', lw=0.5)))
 
-        # Theme settings
+        self.artists = (combined, component_lines, spectrum, annotations)
+        self.apply_theme()
+
+    def apply_theme(self):
         bg = self.bg_colors[self.theme]
         fg = self.fg_colors[self.theme]
         self.fig.patch.set_facecolor(bg)
@@ -152,7 +155,34 @@ class HarmonicVisualizer:
         self.ax1.tick_params(colors=fg)
         self.ax2.tick_params(colors=fg)
 
-        self.canvas.draw()
+    def update_plot(self):
+        components = self.generate_signal_components()
+        signal = self.basis.combine(*self.harmonic_arrays())
+
+        # Frequency Domain
+        half_n = len(signal) // 2
+        fft_freqs = np.fft.rfftfreq(len(signal), 1/fs)[:half_n]
+        magnitude = 2 / len(signal) * np.abs(np.fft.rfft(signal)[:half_n])
+
+        if self.artists is None:
+            self.harmonic_bins = [np.argmin(np.abs(fft_freqs - h * base_freq)) for h in range(1, 20)]
+            self.build_plot(components, signal, fft_freqs, magnitude)
+        else:
+            combined, component_lines, spectrum, annotations = self.artists
+            combined.set_ydata(signal)
+            for line, comp in zip(component_lines, components.values()):
+                line.set_ydata(comp)
+            spectrum.set_ydata(magnitude)
+            for h, ann in enumerate(annotations, start=1):
+                freq = h * base_freq
+                mag = magnitude[self.harmonic_bins[h - 1]]
+                ann.xy = (freq, mag)
+                ann.set_position((freq + 5, mag + 0.5))
+
+        for ax in (self.ax1, self.ax2):
+            ax.relim()
+            ax.autoscale_view(scalex=False)
+        self.canvas.draw_idle()
 
 if __name__ == "__main__":
     root = tk.Tk()